@@ -0,0 +1,38 @@
+"""
+Shelf packer for the web UI sprite atlas.
+
+Rectangles are sorted tallest-first and laid left to right on shelves of a
+fixed width (about the square root of the total area, never narrower than
+the widest rectangle); a new shelf starts when the current one is full.
+Icon tiles are near-uniform in size, so this is close to optimal without
+the cost of a general bin packer.
+"""
+
+import math
+from typing import List, Sequence, Tuple
+
+
+def shelf_pack(sizes: Sequence[Tuple[int, int]], padding: int = 1) -> Tuple[Tuple[int, int], List[Tuple[int, int]]]:
+    """
+    Place (w, h) rectangles with `padding` pixels between them. Returns the
+    atlas size and the (x, y) of each rectangle, in input order.
+    """
+    if not sizes:
+        return (0, 0), []
+
+    area = sum((w + padding) * (h + padding) for w, h in sizes)
+    width = max(max(w for w, _ in sizes), int(math.ceil(math.sqrt(area))))
+
+    order = sorted(range(len(sizes)), key=lambda i: (-sizes[i][1], -sizes[i][0], i))
+    pos: List[Tuple[int, int]] = [(0, 0)] * len(sizes)
+    x = y = shelf_h = used_w = 0
+    for i in order:
+        w, h = sizes[i]
+        if x > 0 and x + w > width:
+            y += shelf_h + padding
+            x = shelf_h = 0
+        pos[i] = (x, y)
+        used_w = max(used_w, x + w)
+        x += w + padding
+        shelf_h = max(shelf_h, h)
+    return (used_w, y + shelf_h), pos
@@ -0,0 +1,273 @@
+"""
+Band-at-a-time PNG reader for very large sprite sheets.
+
+Image.open() + load() decodes the whole sheet up front: a 16384x16384 RGBA
+sheet is 1 GiB before a single tile is cropped. BandReader instead inflates
+the IDAT stream incrementally and decodes only the rows asked for, so peak
+memory follows the tallest band requested (one row of tiles), not the sheet.
+
+Scanline unfiltering is still done by Pillow: a band's filtered rows are
+re-wrapped as a small stored-deflate PNG whose first row is the previous
+band's last row (unfiltered, filter type 0), so Up / Average / Paeth rows
+at the top of the band see the right predecessor. Decoded pixels are
+therefore identical to a full decode.
+
+Rows must be requested top to bottom. Interlaced, 16-bit and non-PNG
+sheets (or `full=True`) fall back to a full decode with random access.
+"""
+
+import io
+import struct
+import zlib
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+from PIL import Image
+
+
+_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+_READ_SIZE = 1 << 16
+_SKIP_BYTES = 1 << 22  # rows skipped over are decoded (and dropped) in batches of about this size
+
+COLOR_GRAY = 0
+COLOR_PALETTE = 3
+
+# Color type -> (channels, Pillow raw mode of an 8-bit scanline). Gray and
+# palette images may also be 1/2/4-bit.
+_COLOR_TYPES: Dict[int, Tuple[int, str]] = {
+    0: (1, "L"),
+    2: (3, "RGB"),
+    3: (1, "P"),
+    4: (2, "LA"),
+    6: (4, "RGBA"),
+}
+
+
+def _chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+
+def _scan_header(f: BinaryIO) -> Optional[Tuple[Tuple[int, int, int, int], List[bytes], int]]:
+    """
+    ((width, height, depth, color type), PLTE/tRNS chunks, first IDAT length),
+    leaving `f` at the start of the IDAT data; None if not a streamable PNG.
+    """
+    if f.read(8) != _SIGNATURE:
+        return None
+    ihdr: Optional[Tuple[int, ...]] = None
+    extra: List[bytes] = []
+    while True:
+        head = f.read(8)
+        if len(head) < 8:
+            return None
+        length, kind = struct.unpack(">I4s", head)
+        if kind == b"IDAT":
+            break
+        data = f.read(length)
+        f.read(4)  # CRC
+        if kind == b"IHDR":
+            ihdr = struct.unpack(">IIBBBBB", data)
+        elif kind in (b"PLTE", b"tRNS"):
+            extra.append(_chunk(kind, data))
+    if ihdr is None:
+        return None
+    width, height, depth, ctype, _, _, interlace = ihdr
+    if interlace or ctype not in _COLOR_TYPES or depth not in ((1, 2, 4, 8) if ctype in (COLOR_GRAY, COLOR_PALETTE) else (8,)):
+        return None
+    return (width, height, depth, ctype), extra, length
+
+
+def _stack(parts: List[Image.Image]) -> Image.Image:
+    """Concatenate same-width images vertically (keeps palette and info)."""
+    if len(parts) == 1:
+        return parts[0]
+    first = parts[0]
+    # crop() past the bottom edge pads, and unlike Image.new() carries the palette over.
+    out = first.crop((0, 0, first.width, sum(p.height for p in parts)))
+    y = first.height
+    for part in parts[1:]:
+        out.paste(part, (0, y))
+        y += part.height
+    return out
+
+
+class BandReader:
+    def __init__(self, path: str, full: bool = False) -> None:
+        self.path = path
+        self.image: Optional[Image.Image] = None  # set when falling back to a full decode
+        self._file: Optional[BinaryIO] = None
+        self._window: Optional[Image.Image] = None  # decoded rows [_window_y, _next)
+        self._window_y = 0
+        self._next = 0
+
+        if full or not self._open_stream():
+            img = Image.open(path)
+            img.load()
+            self.image = img
+            self.size = img.size
+            self.mode = img.mode
+
+    @property
+    def streaming(self) -> bool:
+        return self.image is None
+
+    def __enter__(self) -> "BandReader":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._window = None
+
+    def _open_stream(self) -> bool:
+        """Read the header up to the first IDAT; False if the file can't be streamed."""
+        f = open(self.path, "rb")
+        try:
+            header = _scan_header(f)
+        except BaseException:
+            f.close()
+            raise
+        if header is None:
+            f.close()
+            return False
+        (width, height, depth, ctype), self._extra, self._idat_left = header
+        self.size = (width, height)
+        self._ihdr = (depth, ctype)
+        self._stride = (width * _COLOR_TYPES[ctype][0] * depth + 7) // 8
+        self._file = f
+        self._z = zlib.decompressobj()
+        self._prev = bytes(self._stride)  # the row "above" row 0 is all zero
+        with Image.open(io.BytesIO(self._wrap(b"", 0))) as probe:
+            probe.load()
+            self.mode = probe.mode
+            self._empty = probe.crop((0, 0, width, 0))
+        return True
+
+    def _wrap(self, filtered: bytes, n: int, scanlines: bool = False) -> bytes:
+        """
+        A PNG of the previous row (filter 0) followed by `n` filtered rows.
+        With `scanlines`, the rows are labelled 8-bit gray, one pixel per
+        byte, which decodes to the raw scanline bytes themselves.
+        """
+        depth, ctype = self._ihdr
+        if scanlines:
+            header, extra = (self._stride, n + 1, 8, COLOR_GRAY), []
+        else:
+            header, extra = (self.size[0], n + 1, depth, ctype), self._extra
+        ihdr = struct.pack(">IIBBBBB", *header, 0, 0, 0)
+        idat = zlib.compress(b"\x00" + self._prev + filtered, 0)
+        return b"".join([_SIGNATURE, _chunk(b"IHDR", ihdr)] + extra + [_chunk(b"IDAT", idat), _chunk(b"IEND", b"")])
+
+    def _read_idat(self) -> bytes:
+        while self._idat_left == 0:
+            if self._file is None:
+                return b""
+            self._file.read(4)  # CRC of the previous chunk
+            head = self._file.read(8)
+            if len(head) < 8:
+                return b""
+            length, kind = struct.unpack(">I4s", head)
+            if kind != b"IDAT":
+                self._file.close()
+                self._file = None
+                return b""
+            self._idat_left = length
+        assert self._file is not None
+        data = self._file.read(min(self._idat_left, _READ_SIZE))
+        if not data:
+            raise ValueError(f"{self.path}: truncated image data")
+        self._idat_left -= len(data)
+        return data
+
+    def _inflate(self, need: int) -> bytes:
+        parts: List[bytes] = []
+        left = need
+        while left > 0:
+            data = self._z.unconsumed_tail or self._read_idat()
+            more = self._z.decompress(data, left)
+            if not data and not more:
+                raise ValueError(f"{self.path}: truncated image data")
+            parts.append(more)
+            left -= len(more)
+        return b"".join(parts)
+
+    def _decode(self, n: int) -> Image.Image:
+        """Decode the next `n` rows."""
+        filtered = self._inflate(n * (self._stride + 1))
+        with Image.open(io.BytesIO(self._wrap(filtered, n))) as img:
+            img.load()
+            band = img.crop((0, 1, self.size[0], n + 1))
+        depth, ctype = self._ihdr
+        if depth < 8:
+            # Decoded pixels lose the padding bits at the end of each packed
+            # row, but the next row's filters see them. The filter unit is one
+            # byte either way, so unfilter again as plain bytes.
+            with Image.open(io.BytesIO(self._wrap(filtered, n, scanlines=True))) as img:
+                self._prev = img.tobytes()[-self._stride :]
+        else:
+            self._prev = band.crop((0, n - 1, self.size[0], n)).tobytes("raw", _COLOR_TYPES[ctype][1])
+        self._next += n
+        return band
+
+    def _cover(self, y0: int, y1: int) -> None:
+        """Make the window hold rows [y0, y1) (already clamped to the sheet)."""
+        if y0 < self._window_y:
+            raise ValueError(f"{self.path}: rows must be read top to bottom (asked for row {y0} after {self._window_y})")
+        if self._window is not None and y1 <= self._next:
+            # Already decoded (e.g. the next tile in the same row): no copy.
+            return
+
+        w = self.size[0]
+        parts: List[Image.Image] = []
+        if self._window is not None and y0 < self._next:
+            parts.append(self._window.crop((0, y0 - self._window_y, w, self._next - self._window_y)))
+        self._window = None
+        if y0 - self._next > y1 - y0:
+            # A long gap is decoded (unfiltering needs it) and dropped in batches.
+            while self._next < y0:
+                self._decode(min(y0 - self._next, max(1, _SKIP_BYTES // (self._stride + 1))))
+        if self._next < y1:
+            # A short gap (e.g. the spacing row between tiles) rides along with the band.
+            start = self._next
+            band = self._decode(y1 - start)
+            parts.append(band if start >= y0 else band.crop((0, y0 - start, w, band.height)))
+
+        self._window_y = y0
+        self._window = _stack(parts) if parts else None
+
+    def rows(self, y0: int, y1: int) -> Image.Image:
+        """
+        Rows [y0, y1) clamped to the sheet, as one image. When streaming,
+        `y0` must not decrease between calls; rows above it are released.
+        """
+        w, h = self.size
+        y0 = max(0, min(y0, h))
+        y1 = max(y0, min(y1, h))
+        if self.image is not None:
+            return self.image.crop((0, y0, w, y1))
+        self._cover(y0, y1)
+        if self._window is None:
+            return self._empty
+        if self._window_y == y0 and self._window.height == y1 - y0:
+            return self._window
+        return self._window.crop((0, y0 - self._window_y, w, y1 - self._window_y))
+
+    def crop(self, box: Tuple[int, int, int, int]) -> Image.Image:
+        """
+        Same as Image.crop() on the whole sheet (out-of-range pixels are
+        zero). Tiles in one row are cut from the same decoded band.
+        """
+        if self.image is not None:
+            return self.image.crop(box)
+        x0, y0, x1, y1 = box
+        h = self.size[1]
+        top = max(0, min(y0, h))
+        self._cover(top, max(top, min(y1, h)))
+        if self._window is None:
+            return self._empty.crop((x0, y0 - top, x1, y1 - top))
+        # The window never extends past the sheet, so rows outside it are
+        # the zero padding Image.crop() gives.
+        return self._window.crop((x0, y0 - self._window_y, x1, y1 - self._window_y))
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Benchmark: full-sheet decode vs. band_reader on a large sprite sheet.
+
+Writes a synthetic RGBA sheet (the UI icons from generate_ui_iconsheet.py
+tiled across it) one row of tiles at a time, then reads every tile back in
+two child processes - Image.open() + load() + crop(), and BandReader
+streaming one row of tiles at a time - with one reader.crop() per tile,
+thresholding and packing each like
+generate_icons.py does. Prints time and peak RSS above an idle interpreter
+for each, and checks both saw byte-identical tiles.
+
+Example:
+  python3 icons/scripts/bench_band_reader.py --size 16384
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import resource
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from typing import Dict, Iterator
+
+from PIL import Image, ImageChops, ImageDraw
+
+import generate_ui_iconsheet as ui
+from band_reader import BandReader
+from bitmap_pack import BIT_ORDER_LSB, pack_1bpp, threshold_1bpp
+
+
+def _chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+
+def _strips(width: int, tile_size: int, spacing: int) -> Iterator[Image.Image]:
+    """Rows of tiles (tile_size + spacing high), cycling through the UI icons."""
+    step = tile_size + spacing
+    fns = [getattr(ui, f"icon_{name}") for (name, _, _) in ui.ICON_LAYOUT]
+    shift = 0
+    while True:
+        strip = Image.new("RGBA", (width, step), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(strip)
+        for i, x in enumerate(range(0, width - tile_size + 1, step)):
+            # Drawing functions assume 32x32 tiles; larger tiles just get more margin.
+            fns[(i + shift) % len(fns)](draw, x, 0)
+        yield strip
+        shift += 1
+
+
+def write_sheet(path: str, size: int, tile_size: int, spacing: int) -> None:
+    """Stream a size x size RGBA PNG to `path` without holding the image."""
+    z = zlib.compressobj(6)
+    prev = Image.new("RGBA", (size, 1), (0, 0, 0, 0))
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n" + _chunk(b"IHDR", struct.pack(">IIBBBBB", size, size, 8, 6, 0, 0, 0)))
+        y = 0
+        for strip in _strips(size, tile_size, spacing):
+            strip = strip.crop((0, 0, size, min(strip.height, size - y)))
+            # "Up" filter for every row: bytewise (row - row above) mod 256.
+            above = Image.new("RGBA", strip.size)
+            above.paste(prev, (0, 0))
+            above.paste(strip.crop((0, 0, size, strip.height - 1)), (0, 1))
+            diff = ImageChops.subtract_modulo(strip, above).tobytes()
+            stride = size * 4
+            rows = b"".join(b"\x02" + diff[i : i + stride] for i in range(0, len(diff), stride))
+            data = z.compress(rows)
+            if data:
+                f.write(_chunk(b"IDAT", data))
+            prev = strip.crop((0, strip.height - 1, size, strip.height))
+            y += strip.height
+            if y >= size:
+                break
+        f.write(_chunk(b"IDAT", z.flush()) + _chunk(b"IEND", b""))
+
+
+def _child(mode: str, path: str, tile_size: int, spacing: int, threshold: int) -> Dict[str, object]:
+    step = tile_size + spacing
+    digest = hashlib.sha256()
+    tiles = 0
+    start = time.perf_counter()
+    if mode != "idle":
+        Image.MAX_IMAGE_PIXELS = None  # the full decode would otherwise refuse sheets this big
+        reader = BandReader(path, full=mode == "full")
+        w, h = reader.size
+        for y in range(0, h - tile_size + 1, step):
+            for x in range(0, w - tile_size + 1, step):
+                # Per-tile crop, the way generate_icons.py reads the sheet.
+                tile = reader.crop((x, y, x + tile_size, y + tile_size))
+                digest.update(tile.tobytes())
+                digest.update(pack_1bpp(threshold_1bpp(tile, threshold), BIT_ORDER_LSB))
+                tiles += 1
+        reader.close()
+    return {
+        "ms": (time.perf_counter() - start) * 1000,
+        "rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "tiles": tiles,
+        "digest": digest.hexdigest(),
+    }
+
+
+def _run_child(mode: str, args: argparse.Namespace, path: str) -> Dict[str, object]:
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", mode, "--sheet", path, "--tile-size", str(args.tile_size), "--spacing", str(args.spacing), "--threshold", str(args.threshold)]
+    return json.loads(subprocess.run(cmd, check=True, capture_output=True, text=True).stdout)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark full-sheet decode vs. band-at-a-time reading")
+    parser.add_argument("--size", type=int, default=8192, help="Sheet width/height in pixels (default: 8192)")
+    parser.add_argument("--tile-size", type=int, default=32, help="Tile size in pixels (default: 32)")
+    parser.add_argument("--spacing", type=int, default=1, help="Spacing between tiles (default: 1)")
+    parser.add_argument("--threshold", type=int, default=128, help="Threshold (default: 128)")
+    parser.add_argument("--sheet", default=None, help="Use this PNG instead of writing a synthetic sheet")
+    parser.add_argument("--child", choices=("idle", "full", "band"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(_child(args.child, args.sheet or "", args.tile_size, args.spacing, args.threshold)))
+        return 0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.sheet
+        if path is None:
+            path = os.path.join(tmp, "sheet.png")
+            t0 = time.perf_counter()
+            write_sheet(path, args.size, args.tile_size, args.spacing)
+            print(f"Wrote synthetic sheet in {(time.perf_counter() - t0) * 1000:.0f} ms")
+        with BandReader(path) as probe:
+            w, h = probe.size
+            print(f"Sheet: {w}x{h} {probe.mode} ({os.path.getsize(path) / 1048576:.1f} MiB PNG, {'streamed' if probe.streaming else 'not streamable: full decode'})")
+
+        idle = _run_child("idle", args, path)
+        full = _run_child("full", args, path)
+        band = _run_child("band", args, path)
+
+    print(f"Tiles: {band['tiles']} of {args.tile_size}x{args.tile_size}")
+    if full["digest"] != band["digest"] or full["tiles"] != band["tiles"]:
+        print("ERROR: band reader tiles differ from the full decode")
+        return 1
+    print("Output: byte-identical")
+    base = int(idle["rss_kb"])
+    row_mib = w * (args.tile_size + args.spacing) * 4 / 1048576
+    print(f"full decode : {full['ms']:9.1f} ms, peak +{(int(full['rss_kb']) - base) / 1024:8.1f} MiB")
+    print(f"band reader : {band['ms']:9.1f} ms, peak +{(int(band['rss_kb']) - base) / 1024:8.1f} MiB")
+    print(f"(one row of tiles, decoded: {row_mib:.1f} MiB; whole sheet: {w * h * 4 / 1048576:.1f} MiB)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Benchmark: legacy getpixel() 1bpp packing vs. bitmap_pack.
+
+Builds a synthetic sheet by tiling the UI icons from generate_ui_iconsheet.py,
+packs every tile with both implementations, checks the output is
+byte-identical and prints timings.
+
+Example:
+  python3 icons/scripts/bench_bitmap_pack.py --tiles 2000 --tile-size 32
+"""
+
+import argparse
+import time
+from typing import List, Tuple
+
+from PIL import Image, ImageDraw
+
+import generate_ui_iconsheet as ui
+from bitmap_pack import BIT_ORDER_LSB, pack_sheet_tiles, pack_tile_1bpp
+
+
+def _legacy_pack(img: Image.Image, size: int, threshold: int) -> bytes:
+    # Verbatim copy of the pre-bitmap_pack loop from generate_icons.py.
+    gray = img.convert("L")
+    out = bytearray()
+    for y in range(size):
+        for x0 in range(0, size, 8):
+            b = 0
+            for bit in range(8):
+                x = x0 + bit
+                if x < size and gray.getpixel((x, y)) > threshold:
+                    b |= (1 << bit)
+            out.append(b)
+    return bytes(out)
+
+
+def build_sheet(tiles: int, tile_size: int, spacing: int) -> Tuple[Image.Image, List[Tuple[int, int, int, int]]]:
+    step = tile_size + spacing
+    cols = max(1, int(tiles ** 0.5))
+    rows = (tiles + cols - 1) // cols
+    sheet = Image.new("RGBA", (cols * step, rows * step), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(sheet)
+    fns = [getattr(ui, f"icon_{name}") for (name, _, _) in ui.ICON_LAYOUT]
+
+    boxes = []
+    for i in range(tiles):
+        x = (i % cols) * step
+        y = (i // cols) * step
+        # Drawing functions assume 32x32 tiles; larger tiles just get more margin.
+        fns[i % len(fns)](draw, x, y)
+        boxes.append((x, y, x + tile_size, y + tile_size))
+    return sheet, boxes
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark 1bpp bitmap packing")
+    parser.add_argument("--tiles", type=int, default=1000, help="Number of tiles (default: 1000)")
+    parser.add_argument("--tile-size", type=int, default=32, help="Tile size in pixels (default: 32)")
+    parser.add_argument("--spacing", type=int, default=1, help="Spacing between tiles (default: 1)")
+    parser.add_argument("--threshold", type=int, default=128, help="Threshold (default: 128)")
+    args = parser.parse_args()
+
+    size = args.tile_size
+    sheet, boxes = build_sheet(args.tiles, size, args.spacing)
+    print(f"Sheet: {sheet.size[0]}x{sheet.size[1]}, {len(boxes)} tiles of {size}x{size}")
+
+    t0 = time.perf_counter()
+    legacy = [_legacy_pack(sheet.crop(b), size, args.threshold) for b in boxes]
+    t_legacy = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    per_tile = [pack_tile_1bpp(sheet.crop(b), args.threshold, bit_order=BIT_ORDER_LSB) for b in boxes]
+    t_tile = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    whole = pack_sheet_tiles(sheet, boxes, args.threshold, bit_order=BIT_ORDER_LSB)
+    t_sheet = time.perf_counter() - t0
+
+    if legacy != per_tile or legacy != whole:
+        print("ERROR: packed output differs from legacy implementation")
+        return 1
+
+    print("Output: byte-identical")
+    print(f"legacy getpixel : {t_legacy * 1000:9.1f} ms")
+    print(f"per-tile packed : {t_tile * 1000:9.1f} ms  ({t_legacy / t_tile:6.1f}x)")
+    print(f"whole-sheet     : {t_sheet * 1000:9.1f} ms  ({t_legacy / t_sheet:6.1f}x)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Load generator for the icon endpoints (icon_server.py or a real device).
+
+Each client loads the /icons/test page the way a browser would: the HTML,
+then every resource it references (icon <img>s, or the atlas CSS and the
+sprite sheet it points at), one request at a time. Scenarios:
+
+  cold        empty cache: every resource is fetched
+  revalidate  resources cached without freshness: conditional GETs with
+              the ETags from a first load (304s when the build sends ETags)
+  cached      the browser honours Cache-Control max-age: after a first load
+              only the page itself is requested
+  icons       random /api/icon?name=... requests (the status-bar style API)
+
+Reports request count, status codes, bytes on the wire, per-request latency
+percentiles and page load times. `--spawn` starts icon_server.py in-process
+on a free port with the given server options, so output options can be
+compared from one command after regenerating:
+
+  python3 icons/scripts/bench_icon_server.py --spawn --single-threaded --throttle 200000 --clients 4
+  python3 icons/scripts/bench_icon_server.py --url http://192.168.1.50 --scenario revalidate
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+
+from icon_server import IconStore, make_server
+
+_IMG_RE = re.compile(rb'<img[^>]* src="([^"]+)"')
+_LINK_RE = re.compile(rb'<link[^>]* href="([^"]+)"')
+_CSS_URL_RE = re.compile(rb"url\(([^)]+)\)")
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+class _Client:
+    """One browser-like client: its own connection(s) and cache of validators."""
+
+    def __init__(self, base: str, keep_alive: bool, results: Dict[str, Any], lock: threading.Lock) -> None:
+        url = urlsplit(base)
+        self.host = url.hostname or "127.0.0.1"
+        self.port = url.port or 80
+        self.base = base
+        self.keep_alive = keep_alive
+        self.conn: Optional[http.client.HTTPConnection] = None
+        self.results = results
+        self.lock = lock
+        # path -> (etag, fresh until, body)
+        self.cache: Dict[str, Tuple[Optional[str], float, bytes]] = {}
+
+    def get(self, path: str, scenario: str) -> bytes:
+        headers: Dict[str, str] = {}
+        cached = self.cache.get(path)
+        if cached is not None and scenario == "cached" and cached[1] > time.monotonic():
+            return cached[2]
+        if cached is not None and cached[0] and scenario in ("revalidate", "cached"):
+            headers["If-None-Match"] = cached[0]
+        if not self.keep_alive:
+            headers["Connection"] = "close"
+        start = time.perf_counter()
+        if self.conn is None:
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        self.conn.request("GET", path, headers=headers)
+        resp = self.conn.getresponse()
+        body = resp.read()
+        elapsed = time.perf_counter() - start
+        if not self.keep_alive or resp.will_close:
+            self.conn.close()
+            self.conn = None
+        # Status line + headers as sent on the wire.
+        head = len(f"HTTP/1.1 {resp.status} {resp.reason}\r\n") + len(str(resp.msg)) + 2
+        etag = resp.getheader("ETag")
+        max_age = _MAX_AGE_RE.search(resp.getheader("Cache-Control") or "")
+        fresh = time.monotonic() + int(max_age.group(1)) if max_age and "no-cache" not in (resp.getheader("Cache-Control") or "") else 0.0
+        with self.lock:
+            r = self.results
+            r["requests"] += 1
+            r["status"][resp.status] = r["status"].get(resp.status, 0) + 1
+            r["body_bytes"] += len(body)
+            r["header_bytes"] += head
+            r["latency"].append(elapsed)
+        if resp.status == 200 and (etag or fresh):
+            self.cache[path] = (etag, fresh, body)
+        elif resp.status == 304 and cached is not None:
+            return cached[2]
+        return body
+
+    def load_page(self, page: str, scenario: str) -> None:
+        html = self.get(page, "cold")
+        resources = [m.decode("utf-8") for m in _IMG_RE.findall(html) + _LINK_RE.findall(html)]
+        for ref in resources:
+            path = urlsplit(urljoin(self.base + page, ref))
+            target = path.path + (f"?{path.query}" if path.query else "")
+            body = self.get(target, scenario)
+            if target.endswith(".css"):
+                for url in _CSS_URL_RE.findall(body):
+                    self.get(url.decode("utf-8"), scenario)
+
+
+def _run(args: argparse.Namespace, base: str, names: List[str]) -> Dict[str, Any]:
+    results: Dict[str, Any] = {"requests": 0, "status": {}, "body_bytes": 0, "header_bytes": 0, "latency": [], "pages": []}
+    lock = threading.Lock()
+    errors: List[BaseException] = []
+
+    def client(index: int) -> None:
+        c = _Client(base, args.keep_alive, results, lock)
+        rng = random.Random(args.seed + index)
+        try:
+            if args.scenario == "icons":
+                for _ in range(args.iterations):
+                    c.get(f"/api/icon?name={rng.choice(names)}", "cold")
+                return
+            if args.scenario != "cold":
+                # Warm-up load fills the cache; not counted.
+                scratch = _Client(base, args.keep_alive, {"requests": 0, "status": {}, "body_bytes": 0, "header_bytes": 0, "latency": []}, threading.Lock())
+                scratch.load_page(args.page, "cold")
+                c.cache = scratch.cache
+            for _ in range(args.iterations):
+                start = time.perf_counter()
+                c.load_page(args.page, args.scenario)
+                with lock:
+                    results["pages"].append(time.perf_counter() - start)
+        except BaseException as e:  # surfaced after the other clients finish
+            errors.append(e)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(args.clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+    if errors:
+        raise errors[0]
+
+    lat = results["latency"]
+    pages = results["pages"]
+    return {
+        "scenario": args.scenario,
+        "clients": args.clients,
+        "wall_s": round(wall, 3),
+        "requests": results["requests"],
+        "requests_per_s": round(results["requests"] / wall, 1) if wall else 0.0,
+        "status": {str(k): v for k, v in sorted(results["status"].items())},
+        "body_bytes": results["body_bytes"],
+        "wire_bytes": results["body_bytes"] + results["header_bytes"],
+        "latency_ms": {f"p{p}": round(_percentile(lat, p) * 1000, 2) for p in (50, 95, 99)} | {"max": round(max(lat, default=0.0) * 1000, 2)},
+        "page_loads": len(pages),
+        "requests_per_page": round(results["requests"] / len(pages), 1) if pages else None,
+        "page_ms": {f"p{p}": round(_percentile(pages, p) * 1000, 1) for p in (50, 95)} if pages else None,
+    }
+
+
+def main() -> int:
+    repo_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+    parser = argparse.ArgumentParser(description="Load-test /icons/test and /api/icon on icon_server.py or a device")
+    parser.add_argument("--url", default=None, help="Server base URL, e.g. http://192.168.1.50 (default: --spawn)")
+    parser.add_argument("--spawn", action="store_true", help="Start icon_server.py in-process on a free port")
+    parser.add_argument("--scenario", choices=("cold", "revalidate", "cached", "icons"), default="cold", help="What each client does (default: cold)")
+    parser.add_argument("--page", default="/icons/test", help="Page to load, e.g. /icons/test?atlas=0 (default: /icons/test)")
+    parser.add_argument("--clients", type=int, default=1, help="Concurrent clients (default: 1)")
+    parser.add_argument("--iterations", type=int, default=5, help="Page loads (or /api/icon requests for 'icons') per client (default: 5)")
+    parser.add_argument("--keep-alive", action="store_true", help="Reuse connections (the server needs --keep-alive too)")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for the icons scenario (default: 1)")
+    parser.add_argument("--json", default=None, help="Also write the results as JSON to this path")
+    spawn = parser.add_argument_group("--spawn server options (see icon_server.py)")
+    spawn.add_argument("--cpp", default=os.path.join(repo_root, "icons_embedded.cpp"), help="Generated source (default: icons_embedded.cpp in the project root)")
+    spawn.add_argument("--blob", default=None, help="Payload blob for output incbin/file")
+    spawn.add_argument("--single-threaded", action="store_true", help="Serve one connection at a time")
+    spawn.add_argument("--throttle", type=float, default=0.0, help="Body bytes/s per connection (default: unlimited)")
+    spawn.add_argument("--latency", type=float, default=0.0, help="Added handling time per request in ms")
+    spawn.add_argument("--no-etags", action="store_true", help="Don't send ETags or answer 304")
+    spawn.add_argument("--cache-control", default=None, help="Cache-Control value (default: the build's; '' for none)")
+    args = parser.parse_args()
+    if args.clients < 1 or args.iterations < 1:
+        parser.error("--clients and --iterations must be >= 1")
+    if args.url is None and not args.spawn:
+        args.spawn = True
+
+    server = None
+    names: List[str] = []
+    if args.spawn:
+        store = IconStore(args.cpp, args.blob)
+        names = store.order
+        server = make_server(store, "127.0.0.1", 0, args.single_threaded, args.throttle, args.latency, not args.no_etags, args.cache_control, args.keep_alive)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        mode = "single-threaded" if args.single_threaded else "threaded"
+        print(f"Spawned emulator on {base} ({len(names)} icons, {mode}, throttle {args.throttle or 'off'}, latency {args.latency} ms)")
+    else:
+        base = args.url.rstrip("/")
+    if args.scenario == "icons" and not names:
+        # Icon names come from the page the server renders.
+        conn = http.client.HTTPConnection(urlsplit(base).hostname or "127.0.0.1", urlsplit(base).port or 80, timeout=60)
+        conn.request("GET", "/icons/test?atlas=0")
+        names = [m.decode("utf-8") for m in re.findall(rb"/api/icon\?name=(\w+)", conn.getresponse().read())]
+        conn.close()
+        if not names:
+            parser.error("could not list icon names from /icons/test?atlas=0")
+
+    try:
+        report = _run(args, base, names)
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+    print(f"Scenario {report['scenario']}: {report['clients']} client(s), {report['requests']} request(s) in {report['wall_s']:.2f} s ({report['requests_per_s']} req/s)")
+    print(f"  status: {', '.join(f'{n}x {s}' for s, n in report['status'].items())}")
+    print(f"  bytes: {report['body_bytes']} body, {report['wire_bytes']} incl. headers")
+    lat = report["latency_ms"]
+    print(f"  request latency: p50 {lat['p50']} ms, p95 {lat['p95']} ms, p99 {lat['p99']} ms, max {lat['max']} ms")
+    if report["page_ms"]:
+        print(f"  page loads: {report['page_loads']}, {report['requests_per_page']} request(s)/page, p50 {report['page_ms']['p50']} ms, p95 {report['page_ms']['p95']} ms")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
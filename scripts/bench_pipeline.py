@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+Benchmark: generate_icons.py pipeline, stage by stage, on synthetic sheets.
+
+For each requested icon count, builds a sheet by tiling the UI icons from
+generate_ui_iconsheet.py (each tile also gets its index drawn as a bit
+pattern along its bottom row, so no two tiles are identical and dedup
+doesn't hide the cost), then runs the generator's own functions stage by
+stage in a fresh child process:
+
+  decode        band_reader rows under each row of tiles
+  crop          tile crops from the decoded bands
+  png_encode    Pillow PNG encode of each tile
+  png_minimize  lossless minimizer (skipped with --no-minimize)
+  bitmap_pack   threshold + 1bpp pack
+  c_emit        dedup, perfect hash, icons_embedded.cpp + _gen.h text
+  file_write    writing both files to disk
+
+Reports seconds, throughput and peak RSS per stage (ru_maxrss is a
+high-water mark, so each stage's figure includes the stages before it),
+optionally as JSON, and compares against a stored baseline. Each icon count
+runs --repeat times. A stage is a regression when its fastest and median
+runs are both more than --tolerance slower, and the fastest run is slower by
+more than the noise floor (5 ms, or the run-to-run spread of that stage if
+larger). A peak RSS that grew by more than --tolerance (and at least 8 MiB)
+is a regression too. Any regression makes the exit status 1.
+
+Example:
+  python3 icons/scripts/bench_pipeline.py --icons 48 1000 5000 --json out.json
+  python3 icons/scripts/bench_pipeline.py --save-baseline
+"""
+
+import argparse
+import io
+import json
+import math
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+import PIL
+from PIL import Image, ImageDraw
+
+import generate_icons as gen
+import generate_ui_iconsheet as ui
+from band_reader import BandReader
+from bitmap_pack import threshold_1bpp
+from perfect_hash import build_perfect_hash
+from png_minimize import minimize_png
+
+STAGES = ("decode", "crop", "png_encode", "png_minimize", "bitmap_pack", "c_emit", "file_write")
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_pipeline_baseline.json")
+
+# Regressions smaller than these are treated as noise.
+MIN_SLOWDOWN_S = 0.005
+MIN_RSS_GROWTH_KB = 8 * 1024
+
+
+def build_sheet(icons: int, tile_size: int, spacing: int) -> Image.Image:
+    step = tile_size + spacing
+    cols = max(1, int(math.ceil(math.sqrt(icons))))
+    rows = (icons + cols - 1) // cols
+    sheet = Image.new("RGBA", (cols * step, rows * step), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(sheet)
+    fns = [getattr(ui, f"icon_{name}") for (name, _, _) in ui.ICON_LAYOUT]
+    for i in range(icons):
+        x = (i % cols) * step
+        y = (i // cols) * step
+        # Drawing functions assume 32x32 tiles; larger tiles just get more margin.
+        fns[i % len(fns)](draw, x, y)
+        for bit in range(min(tile_size, i.bit_length())):
+            if i >> bit & 1:
+                draw.point((x + bit, y + tile_size - 1), fill=ui.INK)
+    return sheet
+
+
+def _manifest(icons: int, cols: int, tile_size: int, spacing: int, minimize: bool) -> Dict[str, Any]:
+    return {
+        "tileSize": tile_size,
+        "spacing": spacing,
+        "pngMinimize": minimize,
+        "icons": [{"name": f"icon_{i}", "row": i // cols, "col": i % cols} for i in range(icons)],
+    }
+
+
+class _Stages:
+    def __init__(self) -> None:
+        self.seconds: Dict[str, float] = {name: 0.0 for name in STAGES}
+        self.rss_kb: Dict[str, int] = {}
+
+    def run(self, name: str, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        self.seconds[name] += time.perf_counter() - start
+        return result
+
+    def mark(self, name: str) -> None:
+        self.rss_kb[name] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _child(sheet_path: str, icons: int, tile_size: int, spacing: int, minimize: bool) -> Dict[str, Any]:
+    step = tile_size + spacing
+    cols = max(1, int(math.ceil(math.sqrt(icons))))
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    with tempfile.TemporaryDirectory() as tmp:
+        manifest = _manifest(icons, cols, tile_size, spacing, minimize)
+        opts = gen._parse_options(manifest)
+        threshold = int(manifest.get("threshold", 128))
+
+        st = _Stages()
+        reader = BandReader(sheet_path)
+        out: List[Dict[str, Any]] = []
+        for row in range((icons + cols - 1) // cols):
+            band = st.run("decode", reader.rows, row * step, row * step + tile_size)
+            for col in range(min(cols, icons - row * cols)):
+                x = col * step
+                tile = st.run("crop", band.crop, (x, 0, x + tile_size, tile_size))
+                png = st.run("png_encode", gen._png_bytes, tile)
+                if minimize:
+                    png = st.run("png_minimize", minimize_png, tile, baseline=png)
+                mono = st.run("bitmap_pack", threshold_1bpp, tile, threshold)
+                bmp = st.run("bitmap_pack", gen._bitmap_1bpp, mono, (32, 32))
+                name = f"icon_{row * cols + col}"
+                out.append({"name": name, "x": x, "y": row * step, "row": row, "src": (tile_size, tile_size), "w": 32, "h": 32, "png": png, "bmp": bmp})
+        reader.close()
+        for name in ("decode", "crop", "png_encode", "png_minimize", "bitmap_pack"):
+            st.mark(name)
+
+        def emit() -> Dict[str, str]:
+            gen._dedup_payloads(out, transforms=opts["transformDedup"])
+            gen._encode_bitmaps(out, opts["bitmapEncoding"])
+            gen._build_formats(out, gen._format_array_list(opts))
+            gen._build_color_formats(out, opts)
+            names = [i["name"] for i in out]
+            ph = build_perfect_hash([n.encode("ascii") for n in names])
+            cpp, header = io.StringIO(), io.StringIO()
+            gen._write_cpp(cpp, out, ph, opts)
+            gen._write_gen_header(header, out, opts)
+            return {"icons_embedded.cpp": cpp.getvalue(), gen.GEN_HEADER_NAME: header.getvalue()}
+
+        texts = st.run("c_emit", emit)
+        st.mark("c_emit")
+
+        def write() -> None:
+            changed: List[str] = []
+            for fname, text in texts.items():
+                with gen._write_if_changed(os.path.join(tmp, fname), changed) as f:
+                    f.write(text)
+
+        st.run("file_write", write)
+        st.mark("file_write")
+
+    pixel_bytes = icons * tile_size * tile_size * 4
+    out_bytes = sum(len(t) for t in texts.values())
+    stages: Dict[str, Dict[str, Any]] = {}
+    for name in STAGES:
+        if name == "png_minimize" and not minimize:
+            continue
+        sec = st.seconds[name]
+        entry: Dict[str, Any] = {
+            "seconds": round(sec, 6),
+            "icons_per_s": round(icons / sec, 1) if sec > 0 else None,
+            "peak_rss_kb": st.rss_kb[name],
+        }
+        if name in ("decode", "crop"):
+            entry["mib_per_s"] = round(pixel_bytes / 1048576 / sec, 2) if sec > 0 else None
+        elif name in ("c_emit", "file_write"):
+            entry["mib_per_s"] = round(out_bytes / 1048576 / sec, 2) if sec > 0 else None
+        stages[name] = entry
+    return {
+        "icons": icons,
+        "sheet": [cols * step, ((icons + cols - 1) // cols) * step],
+        "output_bytes": out_bytes,
+        "total_seconds": round(sum(e["seconds"] for e in stages.values()), 6),
+        "base_rss_kb": base_rss,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "stages": stages,
+    }
+
+
+def _median(values: List[float]) -> float:
+    ordered = sorted(values)
+    mid = len(ordered) // 2
+    return ordered[mid] if len(ordered) % 2 else (ordered[mid - 1] + ordered[mid]) / 2
+
+
+def _best_of(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Per-stage minimum over repeated runs (the least disturbed timing), plus
+    the median and every sample so comparisons can tell noise from change.
+    """
+    best = dict(runs[0])
+    best["stages"] = {}
+    for name in runs[0]["stages"]:
+        samples = sorted(r["stages"][name]["seconds"] for r in runs)
+        entry = dict(min((r["stages"][name] for r in runs), key=lambda e: e["seconds"]))
+        entry["median_seconds"] = round(_median(samples), 6)
+        entry["samples"] = samples
+        best["stages"][name] = entry
+    best["total_seconds"] = round(sum(e["seconds"] for e in best["stages"].values()), 6)
+    best["peak_rss_kb"] = min(r["peak_rss_kb"] for r in runs)
+    best["base_rss_kb"] = min(r["base_rss_kb"] for r in runs)
+    return best
+
+
+def _run_child(icons: int, args: argparse.Namespace) -> Dict[str, Any]:
+    # The sheet is drawn here so building it doesn't count towards the child's peak RSS.
+    with tempfile.TemporaryDirectory() as tmp:
+        sheet_path = os.path.join(tmp, "iconsheet.png")
+        build_sheet(icons, args.tile_size, args.spacing).save(sheet_path)
+        cmd = [sys.executable, os.path.abspath(__file__), "--child", str(icons), "--sheet", sheet_path, "--tile-size", str(args.tile_size), "--spacing", str(args.spacing)]
+        if args.no_minimize:
+            cmd.append("--no-minimize")
+        runs = [json.loads(subprocess.run(cmd, check=True, capture_output=True, text=True).stdout) for _ in range(args.repeat)]
+    return _best_of(runs)
+
+
+def _noise_s(entry: Dict[str, Any]) -> float:
+    """Run-to-run spread of one stage: median minus fastest run."""
+    return entry.get("median_seconds", entry["seconds"]) - entry["seconds"]
+
+
+def _compare(results: List[Dict[str, Any]], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    Regression messages for runs that also appear in the baseline. A stage
+    regresses only when both its fastest and its median run are more than
+    `tolerance` slower, and the fastest run is slower by more than the noise
+    floor: MIN_SLOWDOWN_S or the spread seen across repeats in either
+    recording, whichever is larger.
+    """
+    base_runs = {run["icons"]: run for run in baseline.get("runs", [])}
+    problems: List[str] = []
+    for run in results:
+        base = base_runs.get(run["icons"])
+        if base is None:
+            continue
+        for name, entry in run["stages"].items():
+            ref = base["stages"].get(name)
+            if ref is None:
+                continue
+            now, was = entry["seconds"], ref["seconds"]
+            now_med, was_med = entry.get("median_seconds", now), ref.get("median_seconds", was)
+            floor = max(MIN_SLOWDOWN_S, _noise_s(entry) + _noise_s(ref))
+            if now > was * (1 + tolerance) and now_med > was_med * (1 + tolerance) and now - was >= floor:
+                problems.append(f"{run['icons']} icons: {name} {was * 1000:.1f} -> {now * 1000:.1f} ms (+{(now / was - 1) * 100 if was else float('inf'):.0f}%, median {was_med * 1000:.1f} -> {now_med * 1000:.1f} ms)")
+        now_rss, was_rss = run["peak_rss_kb"] - run["base_rss_kb"], base["peak_rss_kb"] - base["base_rss_kb"]
+        if now_rss > was_rss * (1 + tolerance) and now_rss - was_rss >= MIN_RSS_GROWTH_KB:
+            problems.append(f"{run['icons']} icons: peak RSS +{was_rss / 1024:.1f} -> +{now_rss / 1024:.1f} MiB")
+    return problems
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the icon generator stage by stage on synthetic sheets")
+    parser.add_argument("--icons", type=int, nargs="+", default=[48, 1000], help="Icon counts to run (default: 48 1000)")
+    parser.add_argument("--tile-size", type=int, default=32, help="Tile size in pixels (default: 32)")
+    parser.add_argument("--spacing", type=int, default=1, help="Spacing between tiles (default: 1)")
+    parser.add_argument("--no-minimize", action="store_true", help="Skip the PNG minimizer stage (pngMinimize: false)")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per icon count; each stage keeps its fastest and median (default: 5)")
+    parser.add_argument("--json", default=None, help="Write results as JSON to this path ('-' for stdout)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON to compare against (default: bench_pipeline_baseline.json)")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown / RSS growth before flagging (default: 0.25)")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--sheet", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.repeat < 1:
+        parser.error("--repeat must be >= 1")
+    if args.child is not None:
+        print(json.dumps(_child(args.sheet, args.child, args.tile_size, args.spacing, not args.no_minimize)))
+        return 0
+
+    config = {"tileSize": args.tile_size, "spacing": args.spacing, "pngMinimize": not args.no_minimize}
+    print(f"Icon counts: {', '.join(map(str, args.icons))} ({args.repeat} run(s) each, fastest and median per stage)")
+    results = [_run_child(n, args) for n in args.icons]
+    doc = {
+        "config": config,
+        "env": {"python": platform.python_version(), "pillow": PIL.__version__, "machine": platform.machine(), "cpus": os.cpu_count()},
+        "repeat": args.repeat,
+        "runs": results,
+    }
+
+    for run in results:
+        print(f"{run['icons']} icons ({run['sheet'][0]}x{run['sheet'][1]} sheet, {run['output_bytes']} B of C): {run['total_seconds'] * 1000:.1f} ms, peak RSS +{(run['peak_rss_kb'] - run['base_rss_kb']) / 1024:.1f} MiB")
+        for name, entry in run["stages"].items():
+            rate = f"{entry['icons_per_s']:>10.1f} icons/s" if entry["icons_per_s"] else " " * 17
+            mib = f"  {entry['mib_per_s']:8.2f} MiB/s" if entry.get("mib_per_s") else ""
+            print(f"  {name:<13}{entry['seconds'] * 1000:10.1f} ms {rate}{mib}  (median {entry['median_seconds'] * 1000:.1f} ms)")
+
+    if args.json == "-":
+        print(json.dumps(doc, indent=2))
+    elif args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(doc, f, indent=2)
+            f.write("\n")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(doc, f, indent=2)
+            f.write("\n")
+        print(f"Saved baseline: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline} (record one with --save-baseline)")
+        return 0
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("config") != config:
+        print(f"Baseline {args.baseline} was recorded with different settings {baseline.get('config')}; not compared")
+        return 0
+    if baseline.get("env") != doc["env"]:
+        print(f"Note: baseline was recorded on {baseline.get('env')}, this run is {doc['env']}; timings may not be comparable")
+    if baseline.get("repeat", 1) < 3 or args.repeat < 3:
+        print("Note: fewer than 3 runs per side; noise estimates are weak (use --repeat 5)")
+    problems = _compare(results, baseline, args.tolerance)
+    compared = sorted(set(r["icons"] for r in results) & set(r["icons"] for r in baseline.get("runs", [])))
+    if problems:
+        print(f"REGRESSIONS vs {args.baseline} (tolerance {args.tolerance:.0%}):")
+        for line in problems:
+            print(f"  {line}")
+        return 1
+    print(f"No regressions vs {args.baseline} for {', '.join(map(str, compared)) or 'no matching'} icon count(s) (tolerance {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,218 @@
+"""
+1bpp bitmap packing shared by the icon generators.
+
+Thresholding and bit packing are done as whole-image operations inside
+Pillow (a point() lookup table followed by the raw "1" packer) instead of
+one getpixel() call per pixel. A whole sprite sheet can be thresholded once
+and tiles cropped from the result.
+
+Layout: row-major, each row padded to a whole byte (stride = ceil(w / 8)),
+a set bit means the source pixel was brighter than the threshold.
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from PIL import Image
+
+
+BIT_ORDER_LSB = "lsb"  # leftmost pixel in bit 0 (the historic icons_embedded.cpp layout)
+BIT_ORDER_MSB = "msb"  # leftmost pixel in bit 7 (XBM / Adafruit GFX drawBitmap)
+
+_RAW_MODES = {
+    BIT_ORDER_LSB: "1;R",
+    BIT_ORDER_MSB: "1",
+}
+
+_threshold_luts: Dict[int, List[int]] = {}
+
+
+def _threshold_lut(threshold: int) -> List[int]:
+    lut = _threshold_luts.get(threshold)
+    if lut is None:
+        lut = [255 if v > threshold else 0 for v in range(256)]
+        _threshold_luts[threshold] = lut
+    return lut
+
+
+def row_stride(width: int) -> int:
+    return (width + 7) // 8
+
+
+def threshold_1bpp(img: Image.Image, threshold: int) -> Image.Image:
+    """Return a mode "1" image where pixels brighter than `threshold` are set."""
+    gray = img if img.mode == "L" else img.convert("L")
+    return gray.point(_threshold_lut(threshold), mode="1")
+
+
+def pack_1bpp(mono: Image.Image, bit_order: str = BIT_ORDER_LSB) -> bytes:
+    """Pack a mode "1" image into row-major bytes with the given bit order."""
+    raw_mode = _RAW_MODES.get(bit_order)
+    if raw_mode is None:
+        raise ValueError(f"Unknown bit order: {bit_order}")
+    if mono.mode != "1":
+        raise ValueError(f"Expected a mode '1' image, got '{mono.mode}'")
+    return mono.tobytes("raw", raw_mode)
+
+
+def pack_tile_1bpp(
+    img: Image.Image,
+    threshold: int,
+    size: Optional[Tuple[int, int]] = None,
+    bit_order: str = BIT_ORDER_LSB,
+) -> bytes:
+    """Threshold and pack a single tile, resampling (nearest) to `size` first if given."""
+    mono = threshold_1bpp(img, threshold)
+    if size is not None and mono.size != size:
+        mono = mono.resize(size, resample=Image.NEAREST)
+    return pack_1bpp(mono, bit_order)
+
+
+def pack_sheet_tiles(
+    sheet: Image.Image,
+    boxes: Sequence[Tuple[int, int, int, int]],
+    threshold: int,
+    size: Optional[Tuple[int, int]] = None,
+    bit_order: str = BIT_ORDER_LSB,
+) -> List[bytes]:
+    """
+    Threshold the whole sheet once, then crop and pack every (x0, y0, x1, y1) box.
+    """
+    mono = threshold_1bpp(sheet, threshold)
+    out: List[bytes] = []
+    for box in boxes:
+        tile = mono.crop(box)
+        if size is not None and tile.size != size:
+            tile = tile.resize(size, resample=Image.NEAREST)
+        out.append(pack_1bpp(tile, bit_order))
+    return out
+
+
+# Draw-time transforms, as bit flags. For destination pixel (dx, dy) the
+# source pixel is found by: swap (dx, dy) if SWAP_XY, then mirror x if FLIP_X,
+# then mirror y if FLIP_Y. The generated C blitter uses the same definition.
+XFORM_NONE = 0
+XFORM_FLIP_X = 1
+XFORM_FLIP_Y = 2
+XFORM_SWAP_XY = 4
+
+XFORM_NAMES = {
+    0: "none",
+    1: "flip_h",
+    2: "flip_v",
+    3: "rot180",
+    4: "transpose",
+    5: "rot270",
+    6: "rot90",
+    7: "transverse",
+}
+
+_XFORM_PIL = {
+    1: Image.Transpose.FLIP_LEFT_RIGHT,
+    2: Image.Transpose.FLIP_TOP_BOTTOM,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.TRANSPOSE,
+    5: Image.Transpose.ROTATE_90,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+}
+
+
+def unpack_1bpp(data: bytes, size: Tuple[int, int], bit_order: str = BIT_ORDER_LSB) -> Image.Image:
+    """Inverse of pack_1bpp()."""
+    raw_mode = _RAW_MODES.get(bit_order)
+    if raw_mode is None:
+        raise ValueError(f"Unknown bit order: {bit_order}")
+    return Image.frombytes("1", size, data, "raw", raw_mode)
+
+
+def transform_1bpp(data: bytes, size: Tuple[int, int], xform: int, bit_order: str = BIT_ORDER_LSB) -> bytes:
+    """Apply an XFORM_* flag combination to a packed bitmap. SWAP_XY needs a square bitmap."""
+    if xform == XFORM_NONE:
+        return data
+    if xform & XFORM_SWAP_XY and size[0] != size[1]:
+        raise ValueError("SWAP_XY transforms need a square bitmap")
+    img = unpack_1bpp(data, size, bit_order).transpose(_XFORM_PIL[xform])
+    return pack_1bpp(img, bit_order)
+
+
+def packbits_encode(data: bytes) -> bytes:
+    """
+    PackBits: header n in 0..127 -> n + 1 literal bytes follow; n in
+    -127..-1 -> the next byte repeats 1 - n times. -128 is never emitted.
+    """
+    out = bytearray()
+    i = 0
+    n = len(data)
+    while i < n:
+        j = i + 1
+        while j < n and j - i < 128 and data[j] == data[i]:
+            j += 1
+        if j - i >= 3:
+            out.append((1 - (j - i)) & 0xFF)
+            out.append(data[i])
+            i = j
+            continue
+
+        start = i
+        while i < n and i - start < 128:
+            if i + 2 < n and data[i] == data[i + 1] == data[i + 2]:
+                break
+            i += 1
+        out.append(i - start - 1)
+        out += data[start:i]
+    return bytes(out)
+
+
+def packbits_decode(data: bytes, size: Optional[int] = None) -> bytes:
+    """Reference decoder for packbits_encode(); stops early once `size` bytes are produced."""
+    out = bytearray()
+    i = 0
+    while i < len(data) and (size is None or len(out) < size):
+        h = data[i]
+        i += 1
+        if h < 128:
+            out += data[i : i + h + 1]
+            i += h + 1
+        elif h > 128:
+            out += bytes([data[i]]) * (257 - h)
+            i += 1
+    return bytes(out if size is None else out[:size])
+
+
+# Display-native layouts for pre-arranged bitmaps (bitmapFormat).
+FORMAT_XBM = "xbm"  # row-major, LSB = leftmost pixel (XBM, GFX drawXBitmap, registry bitmap)
+FORMAT_GFX = "gfx"  # row-major, MSB = leftmost pixel (Adafruit GFX drawBitmap)
+FORMAT_SSD1306 = "ssd1306"  # page-major: 8 vertical pixels per byte, LSB = top (SSD1306/SH1106 GDDRAM)
+
+BITMAP_FORMATS = (FORMAT_XBM, FORMAT_GFX, FORMAT_SSD1306)
+
+
+def pack_bitmap_format(mono: Image.Image, fmt: str) -> bytes:
+    """Pack a mode "1" image in one of BITMAP_FORMATS."""
+    if fmt == FORMAT_XBM:
+        return pack_1bpp(mono, BIT_ORDER_LSB)
+    if fmt == FORMAT_GFX:
+        return pack_1bpp(mono, BIT_ORDER_MSB)
+    if fmt == FORMAT_SSD1306:
+        # Rows of the transposed image are the source columns; LSB-first
+        # packing gives column-major page bytes, re-sliced into page-major.
+        pages = row_stride(mono.size[1])
+        col_major = pack_1bpp(mono.transpose(Image.Transpose.TRANSPOSE), BIT_ORDER_LSB)
+        return b"".join(col_major[p::pages] for p in range(pages))
+    raise ValueError(f"Unknown bitmap format: {fmt}")
+
+
+def unpack_bitmap_format(data: bytes, size: Tuple[int, int], fmt: str) -> Image.Image:
+    """Inverse of pack_bitmap_format()."""
+    if fmt == FORMAT_XBM:
+        return unpack_1bpp(data, size, BIT_ORDER_LSB)
+    if fmt == FORMAT_GFX:
+        return unpack_1bpp(data, size, BIT_ORDER_MSB)
+    if fmt == FORMAT_SSD1306:
+        w, h = size
+        pages = row_stride(h)
+        col_major = bytearray(len(data))
+        for p in range(pages):
+            col_major[p::pages] = data[p * w : (p + 1) * w]
+        return unpack_1bpp(bytes(col_major), (h, w), BIT_ORDER_LSB).transpose(Image.Transpose.TRANSPOSE)
+    raise ValueError(f"Unknown bitmap format: {fmt}")
@@ -0,0 +1,116 @@
+"""
+Colour / grayscale pixel packing for TFT targets (ST7789, ILI9341, ...).
+
+Like bitmap_pack, every conversion is a whole-image Pillow operation
+(point() lookup tables, ImageChops, merge() and the raw packers) rather than
+a per-pixel loop, so the bytes can be DMA'd to the panel as-is.
+
+Layouts (row-major, rows padded to a whole byte):
+- rgb565: 2 bytes per pixel. Byte-swapped (high byte first) by default,
+  which is the order SPI panels expect on the wire.
+- gray4 / gray2: 4 / 2 bits per pixel, leftmost pixel in the high bits,
+  0 = black.
+- alpha mask: 1bpp, alpha > 127, same layout as the registry bitmap.
+"""
+
+from typing import Dict, List, Tuple
+
+from PIL import Image, ImageChops
+
+from bitmap_pack import BIT_ORDER_LSB, pack_1bpp, threshold_1bpp
+
+
+COLOR_RGB565 = "rgb565"
+COLOR_GRAY4 = "gray4"
+COLOR_GRAY2 = "gray2"
+
+COLOR_FORMATS = (COLOR_RGB565, COLOR_GRAY4, COLOR_GRAY2)
+
+_GRAY_BPP = {COLOR_GRAY4: 4, COLOR_GRAY2: 2}
+_GRAY_RAW_MODES = {4: "P;4", 2: "P;2"}
+
+# RGB565 = RRRRRGGG GGGBBBBB: each LUT yields that channel's bits in one byte.
+_R_HI = [v & 0xF8 for v in range(256)]
+_G_HI = [v >> 5 for v in range(256)]
+_G_LO = [(v & 0x1C) << 3 for v in range(256)]
+_B_LO = [v >> 3 for v in range(256)]
+
+_gray_luts: Dict[int, List[int]] = {}
+
+
+def _gray_lut(bpp: int) -> List[int]:
+    lut = _gray_luts.get(bpp)
+    if lut is None:
+        levels = (1 << bpp) - 1
+        lut = [(v * levels + 127) // 255 for v in range(256)]
+        _gray_luts[bpp] = lut
+    return lut
+
+
+def flatten(img: Image.Image, background: Tuple[int, int, int] = (0, 0, 0)) -> Image.Image:
+    """Composite an image over a solid background and return it as mode "RGB"."""
+    rgba = img if img.mode == "RGBA" else img.convert("RGBA")
+    base = Image.new("RGBA", rgba.size, background + (255,))
+    return Image.alpha_composite(base, rgba).convert("RGB")
+
+
+def pack_rgb565(rgb: Image.Image, byte_swap: bool = True) -> bytes:
+    """Pack a mode "RGB" image as RGB565 (high byte first when `byte_swap`)."""
+    if rgb.mode != "RGB":
+        raise ValueError(f"Expected a mode 'RGB' image, got '{rgb.mode}'")
+    r, g, b = rgb.split()
+    # The channel bits don't overlap, so add() is a bitwise or.
+    hi = ImageChops.add(r.point(_R_HI), g.point(_G_HI))
+    lo = ImageChops.add(g.point(_G_LO), b.point(_B_LO))
+    return Image.merge("LA", (hi, lo) if byte_swap else (lo, hi)).tobytes()
+
+
+def unpack_rgb565(data: bytes, size: Tuple[int, int], byte_swap: bool = True) -> List[int]:
+    """Decode RGB565 bytes back into a list of 16-bit pixel values (for verification)."""
+    step = 1 if byte_swap else -1
+    return [int.from_bytes(data[i : i + 2][::step], "big") for i in range(0, len(data), 2)]
+
+
+def gray_bpp(fmt: str) -> int:
+    bpp = _GRAY_BPP.get(fmt)
+    if bpp is None:
+        raise ValueError(f"Unknown grayscale format: {fmt}")
+    return bpp
+
+
+def gray_stride(width: int, bpp: int) -> int:
+    return (width * bpp + 7) // 8
+
+
+def quantize_gray(img: Image.Image, bpp: int) -> Image.Image:
+    """A mode "P" image of gray level indices (0 .. 2**bpp - 1)."""
+    if bpp not in _GRAY_RAW_MODES:
+        raise ValueError(f"Unsupported grayscale depth: {bpp}")
+    gray = img if img.mode == "L" else img.convert("L")
+    return gray.point(_gray_lut(bpp), "P")
+
+
+def pack_gray(img: Image.Image, bpp: int) -> bytes:
+    """Quantize to 2**bpp gray levels and pack `bpp` bits per pixel, MSB-first."""
+    return quantize_gray(img, bpp).tobytes("raw", _GRAY_RAW_MODES[bpp])
+
+
+def unpack_gray(data: bytes, size: Tuple[int, int], bpp: int) -> Image.Image:
+    """Inverse of pack_gray(): a mode "P" image of level indices (0 .. 2**bpp - 1)."""
+    raw_mode = _GRAY_RAW_MODES.get(bpp)
+    if raw_mode is None:
+        raise ValueError(f"Unsupported grayscale depth: {bpp}")
+    return Image.frombytes("P", size, data, "raw", raw_mode)
+
+
+def pack_color_format(img: Image.Image, fmt: str, byte_swap: bool = True) -> bytes:
+    """Pack a flattened mode "RGB" image in one of COLOR_FORMATS."""
+    if fmt == COLOR_RGB565:
+        return pack_rgb565(img, byte_swap)
+    return pack_gray(img, gray_bpp(fmt))
+
+
+def pack_alpha_mask(img: Image.Image) -> bytes:
+    """1bpp opacity mask (alpha > 127), laid out like the registry bitmap."""
+    alpha = img.getchannel("A") if "A" in img.getbands() else Image.new("L", img.size, 255)
+    return pack_1bpp(threshold_1bpp(alpha, 127), BIT_ORDER_LSB)
@@ -4,10 +4,11 @@ Icon Extractor
 Extracts individual 32x32 icons from a sprite sheet template
 """
 
-from PIL import Image
 import os
 import sys
 
+from band_reader import BandReader
+
 def extract_icons(template_path, output_dir="extracted_icons", prefix="icon", tile_size=32, spacing=1):
     """
     Extract icons from template sprite sheet
@@ -27,12 +28,13 @@ def extract_icons(template_path, output_dir="extracted_icons", prefix="icon", ti
     # Create output directory
     os.makedirs(output_dir, exist_ok=True)
     
-    # Load template
-    img = Image.open(template_path)
+    # Open template (decoded one row of tiles at a time, so large sheets
+    # don't have to fit in memory)
+    reader = BandReader(template_path)
     
     # Calculate grid dimensions (start at 0)
-    icons_per_row = img.size[0] // (tile_size + spacing)
-    icons_per_col = img.size[1] // (tile_size + spacing)
+    icons_per_row = reader.size[0] // (tile_size + spacing)
+    icons_per_col = reader.size[1] // (tile_size + spacing)
     
     print(f"Extracting icons from: {template_path}")
     print(f"Icon size: {tile_size}x{tile_size}px")
@@ -43,13 +45,14 @@ def extract_icons(template_path, output_dir="extracted_icons", prefix="icon", ti
     
     # Extract each icon
     for row in range(icons_per_col):
+        y = row * (tile_size + spacing)
+        band = reader.rows(y, y + tile_size)
         for col in range(icons_per_row):
             # Calculate icon position (0-based grid)
             x = col * (tile_size + spacing)
-            y = row * (tile_size + spacing)
             
             # Extract icon region
-            icon = img.crop((x, y, x + tile_size, y + tile_size))
+            icon = band.crop((x, 0, x + tile_size, tile_size))
             
             # Check if icon is blank (all white or transparent)
             if is_blank(icon):
@@ -64,6 +67,7 @@ def extract_icons(template_path, output_dir="extracted_icons", prefix="icon", ti
             
             extracted_count += 1
             print(f"Extracted: {filename} (position {col},{row})")
+    reader.close()
     
     print(f"Extraction complete!")
     print(f"Extracted: {extracted_count} icons")
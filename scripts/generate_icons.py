@@ -6,19 +6,85 @@ Inputs:
 - icons/iconsheet.json (manifest)
 - icons/assets/iconsheet.png (sprite sheet)
 
-Output:
-- icons_embedded.cpp (generated in project root)
+Output (generated in project root):
+- icons_embedded.cpp
+- icons_embedded_gen.h (IconId enum + generated accessors)
 
 This avoids managing hundreds of individual icon PNG files.
 """
 
+import argparse
+import concurrent.futures
+import contextlib
+import cProfile
+import filecmp
+import functools
+import hashlib
 import io
 import json
 import os
+import pstats
 import sys
-from typing import Any, Dict, List, Tuple
+import tempfile
+import time
+import zlib
+from typing import IO, Any, Dict, Iterator, List, Optional, TextIO, Tuple
 
-from PIL import Image
+from PIL import Image, ImageChops
+
+from bitmap_pack import (
+    BIT_ORDER_LSB,
+    BITMAP_FORMATS,
+    FORMAT_XBM,
+    XFORM_FLIP_X,
+    XFORM_FLIP_Y,
+    XFORM_NAMES,
+    XFORM_NONE,
+    XFORM_SWAP_XY,
+    pack_1bpp,
+    pack_bitmap_format,
+    packbits_decode,
+    packbits_encode,
+    row_stride,
+    threshold_1bpp,
+    transform_1bpp,
+    unpack_1bpp,
+    unpack_bitmap_format,
+)
+from color_pack import COLOR_FORMATS, COLOR_RGB565, flatten, pack_alpha_mask, pack_color_format
+from host_harness import build_and_run, write_harness
+from icon_cache import IconCache
+from atlas_pack import shelf_pack
+from band_reader import BandReader
+from payload_blob import ALIGN, PayloadBlob
+from png_minimize import MINIMIZE_VERSION, describe_png, minimize_png
+from perfect_hash import FNV_OFFSET, FNV_PRIME, GOLDEN, PerfectHash, build_perfect_hash
+
+GEN_HEADER_NAME = "icons_embedded_gen.h"
+
+# Sharded payload files: icons_embedded_<key>.cpp, recognised by their first line.
+SHARD_PREFIX = "icons_embedded_"
+SHARD_MARKER = "// Auto-generated icon payload shard"
+
+# icon["fmt"] key for the optional 1bpp alpha mask (alongside bitmap/color formats).
+ALPHA_MASK = "alpha"
+
+# Rough request + response header bytes per HTTP round trip, for the atlas report.
+HTTP_OVERHEAD_BYTES = 250
+
+# Flash report estimate of one EmbeddedIcon registry row on a 32-bit target:
+# name / png / pngLen / bitmap words plus w/h, padded.
+REGISTRY_ENTRY_BYTES = 20
+POINTER_BYTES = 4
+FLASH_REPORT_NAME = "icons_flash_report.json"
+FLASH_REPORT_TOP = 10
+
+# Strong ETags: a quoted 64-bit prefix of the payload's SHA-256.
+ETAG_HEX_DIGITS = 16
+ETAG_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Encoder settings that affect _png_bytes() output; part of the cache key.
+PNG_OPTIONS: Dict[str, Any] = {"format": "PNG", "optimize": True}
 
 
 def _require(cond: bool, msg: str) -> None:
@@ -31,97 +97,1527 @@ def _load_manifest(path: str) -> Dict[str, Any]:
         return json.load(f)
 
 
-def _crop_tile(sheet: Image.Image, x: int, y: int, tile_size: int) -> Image.Image:
-    return sheet.crop((x, y, x + tile_size, y + tile_size))
+def _load_usage_profile(path: str) -> Dict[str, int]:
+    """
+    Icon name -> hit count, from {"name": hits} or a wrapper with the same
+    mapping under "hits" (so a firmware counter dump can be used as-is).
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict) and isinstance(data.get("hits"), dict):
+        data = data["hits"]
+    _require(isinstance(data, dict), f"{path}: usage profile must map icon names to hit counts")
+    for name, hits in data.items():
+        _require(isinstance(hits, int) and not isinstance(hits, bool) and hits >= 0, f"{path}: hit count for {name} must be a non-negative integer")
+    return data
+
+
+def _order_by_usage(icons: List[Dict[str, Any]], hits: Dict[str, int]) -> List[Dict[str, Any]]:
+    """Icons with hits first, most used first; the rest keep manifest order. Sets icon["hot"]."""
+    for icon in icons:
+        icon["hot"] = hits.get(icon["name"], 0) > 0
+    hot = sorted((i for i in icons if i["hot"]), key=lambda i: -hits[i["name"]])
+    return hot + [i for i in icons if hits.get(i["name"], 0) == 0]
 
 
 def _png_bytes(img: Image.Image) -> bytes:
     buf = io.BytesIO()
-    img.save(buf, format="PNG", optimize=True)
+    img.save(buf, **PNG_OPTIONS)
     return buf.getvalue()
 
 
-def _bitmap_1bpp_32x32(img: Image.Image, tile_size: int, threshold: int) -> bytes:
-    # OLED output is 32x32. If the source tile isn't 32x32, resize to match.
-    if tile_size != 32:
-        img = img.resize((32, 32), resample=Image.NEAREST)
-
-    gray = img.convert("L")
-    out = bytearray()
-    for y in range(32):
-        for x0 in range(0, 32, 8):
-            b = 0
-            for bit in range(8):
-                x = x0 + bit
-                px = gray.getpixel((x, y))
-                if px > threshold:
-                    b |= (1 << bit)
-            out.append(b)
-    _require(len(out) == 128, "Internal error: expected 128-byte bitmap")
-    return bytes(out)
+def _bitmap_1bpp(mono: Image.Image, size: Tuple[int, int]) -> bytes:
+    # `mono` is a tile cropped from the thresholded (mode "1") sheet. If it
+    # isn't the icon's output size, resize (nearest) to match.
+    if mono.size != size:
+        mono = mono.resize(size, resample=Image.NEAREST)
+
+    out = pack_1bpp(mono, BIT_ORDER_LSB)
+    _require(len(out) == row_stride(size[0]) * size[1], f"Internal error: expected {row_stride(size[0]) * size[1]}-byte bitmap")
+    return out
+
+
+def _parse_size(value: Any, what: str) -> Tuple[int, int]:
+    """N or [w, h] -> (w, h); registry dimensions are uint16_t."""
+    if isinstance(value, int):
+        value = [value, value]
+    _require(isinstance(value, list) and len(value) == 2 and all(isinstance(v, int) and 0 < v <= 0xFFFF for v in value), f"{what} must be N or [w, h] with 1..65535 pixels")
+    return value[0], value[1]
+
+
+# Source region (x, y, w, h) on the sheet + output bitmap size.
+TileKey = Tuple[int, int, int, int, int, int]
+
+# Encode task for --jobs workers: the tile's pixels (mode, size, raw bytes,
+# palette, transparency) + output bitmap size. Tiles are a few KB, so
+# workers never need the sheet.
+EncodeTask = Tuple[str, Tuple[int, int], bytes, Optional[List[int]], Dict[str, Any], Tuple[int, int]]
+
+
+def _encode_tile(tile: Image.Image, mono: Image.Image, size: Tuple[int, int], minimize: bool) -> Tuple[bytes, bytes]:
+    png = _png_bytes(tile)
+    if minimize:
+        png = minimize_png(tile, baseline=png)
+    return png, _bitmap_1bpp(mono, size)
+
+
+def _encode_task(tile: Image.Image, size: Tuple[int, int]) -> EncodeTask:
+    palette = tile.getpalette() if tile.mode in ("P", "PA") else None
+    info = {k: v for k, v in tile.info.items() if k == "transparency"}
+    return (tile.mode, tile.size, tile.tobytes(), palette, info, size)
+
+
+_worker_threshold = 128
+_worker_minimize = False
+
+
+def _worker_init(threshold: int, minimize: bool) -> None:
+    global _worker_threshold, _worker_minimize
+    _worker_threshold = threshold
+    _worker_minimize = minimize
+
 
+def _worker_encode(task: EncodeTask) -> Tuple[bytes, bytes]:
+    mode, src, raw, palette, info, size = task
+    tile = Image.frombytes(mode, src, raw)
+    if palette is not None:
+        tile.putpalette(palette)
+    tile.info.update(info)
+    return _encode_tile(tile, threshold_1bpp(tile, _worker_threshold), size, _worker_minimize)
 
-def _c_array(name: str, data: bytes, cols: int = 16) -> str:
-    lines = []
-    lines.append(f"static const uint8_t PROGMEM {name}[] = {{")
-    for i in range(0, len(data), cols):
-        chunk = data[i : i + cols]
-        lines.append("  " + ", ".join(f"0x{b:02X}" for b in chunk) + ",")
-    lines.append("};")
-    return "\n".join(lines)
 
+def _encode_parallel(tasks: List[EncodeTask], threshold: int, minimize: bool, jobs: int) -> List[Tuple[bytes, bytes]]:
+    chunksize = max(1, len(tasks) // (jobs * 4))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, initializer=_worker_init, initargs=(threshold, minimize)) as pool:
+        # map() yields results in task order, so output stays deterministic.
+        return list(pool.map(_worker_encode, tasks, chunksize=chunksize))
 
-def _generate_cpp(icons: List[Dict[str, Any]]) -> str:
-    lines: List[str] = []
-    lines.append('#include "icons_embedded.h"')
-    lines.append("")
-    lines.append("// Auto-generated icon arrays")
-    lines.append("// DO NOT EDIT - regenerate with icons/scripts/generate_icons.py")
-    lines.append("")
 
-    # Arrays
+# Byte -> "0xNN, " lookup; arrays are formatted by joining table entries in
+# bulk and slicing the result into fixed-width rows.
+_HEX_ITEM = [f"0x{b:02X}, " for b in range(256)]
+_HEX_BLOCK_ROWS = 4096
+
+
+def _write_c_array(out: TextIO, name: str, data: bytes, cols: int = 16, linkage: str = "static", storage: str = "PROGMEM") -> None:
+    out.write(f"{linkage} const uint8_t {storage} {name}[] = {{\n")
+    width = len(_HEX_ITEM[0]) * cols
+    block = cols * _HEX_BLOCK_ROWS
+    # Format in bounded blocks so multi-megabyte payloads don't balloon into
+    # one giant string.
+    for start in range(0, len(data), block):
+        text = "".join(map(_HEX_ITEM.__getitem__, data[start : start + block]))
+        out.write("".join("  " + text[i : i + width].rstrip() + "\n" for i in range(0, len(text), width)))
+    out.write("};\n")
+
+
+def _write_payload(out: TextIO, name: str, data: bytes, opts: Dict[str, Any], cols: int = 16, linkage: str = "static", storage: str = "PROGMEM") -> None:
+    """A payload array: C hex text, or (blob output modes) a slice of the payload blob."""
+    blob: Optional[PayloadBlob] = opts.get("blob")
+    if blob is None:
+        _write_c_array(out, name, data, cols, linkage, storage)
+        return
+    offset = blob.add(name, data)
+    if opts["output"] == "incbin":
+        out.write(f"#define {name} (EMBEDDED_ICON_BLOB + {offset})\n")
+    else:
+        out.write(f"#define {name} ((const uint8_t*)nullptr)  // blob offset {offset}\n")
+
+
+def _write_hot_section_decl(out: TextIO) -> None:
+    out.write("// Drawing arrays of the usage profile's hot icons share one section, so the\n")
+    out.write("// linker keeps them contiguous. Override EMBEDDED_ICONS_HOT_SECTION as needed.\n")
+    out.write("#ifndef EMBEDDED_ICONS_HOT_SECTION\n")
+    out.write("#if defined(__AVR__)\n")
+    out.write('#define EMBEDDED_ICONS_HOT_SECTION ".progmem.data.icons_hot"\n')
+    out.write("#elif defined(ESP8266)\n")
+    out.write('#define EMBEDDED_ICONS_HOT_SECTION ".irom.text.icons_hot"\n')
+    out.write("#else\n")
+    out.write('#define EMBEDDED_ICONS_HOT_SECTION ".rodata.icons_hot"\n')
+    out.write("#endif\n")
+    out.write("#endif\n")
+    out.write("#define EMBEDDED_ICON_HOT __attribute__((section(EMBEDDED_ICONS_HOT_SECTION)))\n")
+    out.write("\n")
+
+
+def _write_blob_decl(out: TextIO, opts: Dict[str, Any]) -> None:
+    out.write(f"// Payloads live in {opts['blobName']} ({ALIGN}-byte aligned), not in this file.\n")
+    if opts["output"] == "incbin":
+        out.write("// The assembler resolves the path against its include dirs (-Wa,-I<dir>) or the\n")
+        out.write("// build's working directory; override EMBEDDED_ICONS_BLOB_PATH/_SECTION as needed\n")
+        out.write("// (e.g. \".progmem.data\" on AVR).\n")
+        out.write("#ifndef EMBEDDED_ICONS_BLOB_PATH\n")
+        out.write(f'#define EMBEDDED_ICONS_BLOB_PATH "{opts["blobName"]}"\n')
+        out.write("#endif\n")
+        out.write("#ifndef EMBEDDED_ICONS_BLOB_SECTION\n")
+        out.write('#define EMBEDDED_ICONS_BLOB_SECTION ".rodata"\n')
+        out.write("#endif\n")
+        out.write("__asm__(\".section \" EMBEDDED_ICONS_BLOB_SECTION \"\\n\"\n")
+        out.write(f'        ".balign {ALIGN}\\n"\n')
+        out.write('        ".global EMBEDDED_ICON_BLOB\\n"\n')
+        out.write('        "EMBEDDED_ICON_BLOB:\\n"\n')
+        out.write('        ".incbin \\"" EMBEDDED_ICONS_BLOB_PATH "\\"\\n"\n')
+        out.write('        ".previous\\n");\n')
+        out.write('extern "C" const uint8_t EMBEDDED_ICON_BLOB[];\n')
+    else:
+        out.write("// Registry/payload pointers are nullptr: read payloads from the file system at\n")
+        out.write("// getEmbeddedIconBlobRange() offsets.\n")
+    out.write("\n")
+
+
+def _write_blob_ranges(out: TextIO, icons: List[Dict[str, Any]], blob: PayloadBlob) -> None:
+    values: List[int] = []
     for icon in icons:
-        name = icon["name"]
-        png = icon["png"]
-        bmp = icon["bmp"]
-        lines.append(f"// {name} PNG data ({len(png)} bytes)")
-        lines.append(_c_array(f"icon_{name}_png", png))
-        lines.append("")
-        lines.append(f"// {name} monochrome bitmap (32x32 = 128 bytes)")
-        lines.append(_c_array(f"icon_{name}_bitmap", bmp, cols=8))
-        lines.append("")
+        values.extend(blob.range(icon["png_sym"]))
+        values.extend(blob.range(icon["bmp_sym"]))
+    out.write("// Per registry entry: PNG offset, PNG size, bitmap offset, bitmap size (stored bytes)\n")
+    _write_c_int_array(out, "uint32_t", "EMBEDDED_ICON_BLOB_RANGES", values, cols=4)
+    out.write("\n")
+    out.write("bool getEmbeddedIconBlobRange(const EmbeddedIcon* icon, EmbeddedIconPayload payload, EmbeddedIconBlobRange* out) {\n")
+    out.write("  size_t i = icon - EMBEDDED_ICONS;\n")
+    out.write("  if (i >= EMBEDDED_ICONS_COUNT || out == nullptr) {\n")
+    out.write("    return false;\n")
+    out.write("  }\n")
+    out.write("  const uint32_t* r = &EMBEDDED_ICON_BLOB_RANGES[i * 4 + (payload == EmbeddedIconPayload::Bitmap ? 2 : 0)];\n")
+    out.write("  out->offset = pgm_read_dword(&r[0]);\n")
+    out.write("  out->size = pgm_read_dword(&r[1]);\n")
+    out.write("  return true;\n")
+    out.write("}\n")
+
+
+def _write_icon_arrays(out: TextIO, icon: Dict[str, Any], opts: Dict[str, Any], linkage: str = "static", png: bool = True, bitmaps: bool = True, storage: str = "PROGMEM") -> None:
+    """
+    One icon's PNG / bitmap / extra-format arrays (or a note naming the array
+    it shares). `png` / `bitmaps` select which part to write, for layouts
+    that group PNGs apart from the drawing arrays; `storage` is the
+    attribute macro for the drawing arrays.
+    """
+    name = icon["name"]
+    if png:
+        if icon["png_sym"] == f"icon_{name}_png":
+            out.write(f"// {name} PNG data ({len(icon['png'])} bytes)\n")
+            _write_payload(out, icon["png_sym"], icon["png"], opts, linkage=linkage)
+        else:
+            out.write(f"// {name} PNG data: identical to {icon['png_sym']}\n")
+        out.write("\n")
+    if not bitmaps:
+        return
+    bmp = icon["bmp"]
+    if icon["bmp_sym"] == f"icon_{name}_bitmap" and "bmp_stored" in icon:
+        out.write(f"// {name} monochrome bitmap ({icon['w']}x{icon['h']} = {len(bmp)} bytes, PackBits {len(icon['bmp_stored'])} bytes)\n")
+        _write_payload(out, icon["bmp_sym"], icon["bmp_stored"], opts, cols=8, linkage=linkage, storage=storage)
+    elif icon["bmp_sym"] == f"icon_{name}_bitmap":
+        out.write(f"// {name} monochrome bitmap ({icon['w']}x{icon['h']} = {len(bmp)} bytes)\n")
+        _write_payload(out, icon["bmp_sym"], bmp, opts, cols=8, linkage=linkage, storage=storage)
+    elif "bmp_delta" in icon:
+        out.write(f"// {name} monochrome bitmap: {icon['bmp_sym']} + {len(icon['bmp_delta']) // 2}-byte XOR delta\n")
+    elif icon["bmp_xform"] != XFORM_NONE:
+        out.write(f"// {name} monochrome bitmap: {XFORM_NAMES[icon['bmp_xform']]} of {icon['bmp_sym']}\n")
+    else:
+        out.write(f"// {name} monochrome bitmap: identical to {icon['bmp_sym']}\n")
+    out.write("\n")
+    for fmt, sym in icon.get("fmt_sym", {}).items():
+        if sym == _format_sym(name, fmt):
+            out.write(f"// {name} {_format_label(fmt)} ({len(icon['fmt'][fmt])} bytes)\n")
+            _write_payload(out, sym, icon["fmt"][fmt], opts, cols=16 if fmt == COLOR_RGB565 else 8, linkage=linkage, storage=storage)
+        else:
+            out.write(f"// {name} {_format_label(fmt)}: identical to {sym}\n")
+        out.write("\n")
+
+
+def _owned_payload_syms(icon: Dict[str, Any]) -> List[str]:
+    """Arrays _write_icon_arrays() defines for this icon."""
+    name = icon["name"]
+    syms = [sym for sym in (icon["png_sym"], icon["bmp_sym"]) if sym in (f"icon_{name}_png", f"icon_{name}_bitmap")]
+    syms += [sym for fmt, sym in icon.get("fmt_sym", {}).items() if sym == _format_sym(name, fmt)]
+    return syms
+
+
+def _write_shard(out: TextIO, key: str, icons: List[Dict[str, Any]], opts: Dict[str, Any]) -> None:
+    out.write(f"{SHARD_MARKER} ({key})\n")
+    out.write("// DO NOT EDIT - regenerate with icons/scripts/generate_icons.py\n")
+    out.write('#include "icons_embedded.h"\n')
+    out.write("\n")
+    for icon in icons:
+        _write_icon_arrays(out, icon, opts, linkage="extern")
+
+
+def _shard_keys(icons: List[Dict[str, Any]], shard_by: Any, declared: Optional[Dict[str, List[str]]]) -> Dict[str, str]:
+    """
+    Icon name -> shard file suffix. Keys only depend on the icon itself (its
+    sheet row, family or name hash), so adding or editing one icon leaves the
+    other shards' contents untouched.
+    """
+    if shard_by == "row":
+        return {icon["name"]: f"row{icon['row']:02d}" for icon in icons}
+    if shard_by == "family":
+        keys = {icon["name"]: "misc" for icon in icons}
+        for family, members in _family_groups(icons, declared).items():
+            for m in members:
+                keys[m["name"]] = f"fam_{family}"
+        return keys
+    digits = len(str(shard_by - 1))
+    return {icon["name"]: f"shard{zlib.crc32(icon['name'].encode('ascii')) % shard_by:0{digits}d}" for icon in icons}
+
+
+@contextlib.contextmanager
+def _write_if_changed(path: str, changed: List[str], binary: bool = False) -> Iterator[IO[Any]]:
+    """
+    Stream into a temp file and only replace `path` when the bytes differ,
+    so unchanged outputs keep their mtime and the firmware build skips them.
+    """
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") if binary else open(tmp, "w", encoding="utf-8") as f:
+            yield f
+        if os.path.exists(path) and filecmp.cmp(tmp, path, shallow=False):
+            os.remove(tmp)
+        else:
+            os.replace(tmp, path)
+            changed.append(path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _remove_stale_shards(out_dir: str, keep: List[str]) -> List[str]:
+    removed = []
+    for fname in sorted(os.listdir(out_dir)):
+        path = os.path.join(out_dir, fname)
+        if not (fname.startswith(SHARD_PREFIX) and fname.endswith(".cpp")) or path in keep:
+            continue
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            if not f.readline().startswith(SHARD_MARKER):
+                continue
+        os.remove(path)
+        removed.append(path)
+    return removed
+
+
+def _write_cpp(out: TextIO, icons: List[Dict[str, Any]], ph: PerfectHash, opts: Dict[str, Any], atlas: Optional[Dict[str, Any]] = None) -> None:
+    out.write('#include "icons_embedded.h"\n')
+    out.write(f'#include "{GEN_HEADER_NAME}"\n')
+    out.write("\n")
+    out.write("// Auto-generated icon arrays\n")
+    out.write("// DO NOT EDIT - regenerate with icons/scripts/generate_icons.py\n")
+    out.write("\n")
+    if "blob" in opts:
+        _write_blob_decl(out, opts)
+
+    # Arrays, streamed one icon at a time; shared payloads are emitted once
+    if opts["shardBy"]:
+        out.write(f"// Payload arrays are defined in the {SHARD_PREFIX}*.cpp shards.\n")
+        for icon in icons:
+            for sym in _owned_payload_syms(icon):
+                out.write(f"extern const uint8_t {sym}[];\n")
+        out.write("\n")
+    elif opts["hotFirst"]:
+        # Usage-profile order: drawing arrays ahead of the PNGs, which only
+        # the web UI reads. Compilers don't keep definition order in flash,
+        # so the hot icons' drawing arrays also get a section of their own.
+        if "blob" not in opts:
+            _write_hot_section_decl(out)
+        out.write("// Bitmap arrays, most used icons first (usage profile)\n")
+        out.write("\n")
+        for icon in icons:
+            _write_icon_arrays(out, icon, opts, png=False, storage="EMBEDDED_ICON_HOT" if icon.get("hot") else "PROGMEM")
+        out.write("// Cold PNG payloads\n")
+        out.write("\n")
+        for icon in icons:
+            _write_icon_arrays(out, icon, opts, bitmaps=False)
+    else:
+        for icon in icons:
+            _write_icon_arrays(out, icon, opts)
 
     # Registry
-    lines.append("// Icon registry")
-    lines.append("const EmbeddedIcon EMBEDDED_ICONS[] PROGMEM = {")
+    out.write("// Icon registry\n")
+    out.write("const EmbeddedIcon EMBEDDED_ICONS[] PROGMEM = {\n")
     for icon in icons:
         name = icon["name"]
-        lines.append(f'  {{"{name}", icon_{name}_png, {len(icon["png"])}, icon_{name}_bitmap, 32, 32}},')
-    lines.append("};")
-    lines.append("")
-    lines.append(f"const size_t EMBEDDED_ICONS_COUNT = {len(icons)};")
-    lines.append("")
-
-    # Lookup
-    lines.append("const EmbeddedIcon* findEmbeddedIcon(const char* name) {")
-    lines.append("  for (size_t i = 0; i < EMBEDDED_ICONS_COUNT; i++) {")
-    lines.append("    char iconName[32];")
-    lines.append("    strcpy_P(iconName, (PGM_P)pgm_read_ptr(&EMBEDDED_ICONS[i].name));")
-    lines.append("    if (strcmp(iconName, name) == 0) {")
-    lines.append("      return &EMBEDDED_ICONS[i];")
-    lines.append("    }")
-    lines.append("  }")
-    lines.append("  return nullptr;")
-    lines.append("}")
-
-    lines.append("")
-    return "\n".join(lines)
-
-
-def main() -> int:
+        out.write(f'  {{"{name}", {icon["png_sym"]}, {len(icon["png"])}, {icon["bmp_sym"]}, {icon["w"]}, {icon["h"]}}},\n')
+    out.write("};\n")
+    out.write("\n")
+    out.write(f"const size_t EMBEDDED_ICONS_COUNT = {len(icons)};\n")
+    out.write("\n")
+
+    if "blob" in opts:
+        _write_blob_ranges(out, icons, opts["blob"])
+        out.write("\n")
+
+    _write_lookup(out, ph)
+    out.write("\n")
+    out.write("const EmbeddedIcon* getEmbeddedIcon(IconId id) {\n")
+    out.write("  size_t i = (size_t)id;\n")
+    out.write("  return i < EMBEDDED_ICONS_COUNT ? &EMBEDDED_ICONS[i] : nullptr;\n")
+    out.write("}\n")
+
+    if opts["bitmapFormats"]:
+        out.write("\n")
+        _write_format_tables(out, icons, opts)
+
+    if opts["colorFormats"] or opts["alphaMask"]:
+        out.write("\n")
+        _write_color_tables(out, icons, opts)
+
+    if opts["etags"]:
+        out.write("\n")
+        _write_etags(out, icons)
+
+    if atlas is not None:
+        out.write("\n")
+        _write_atlas(out, atlas, opts)
+
+    if _has_draw_helpers(opts):
+        out.write("\n")
+        _write_draw_helpers(out, icons, opts)
+
+
+# C++ keywords that are valid Python identifiers (and so valid icon names)
+# but can't be used as enumerator names.
+_CPP_KEYWORDS = frozenset(
+    "alignas alignof and and_eq asm auto bitand bitor bool break case catch char char16_t char32_t class compl "
+    "const constexpr const_cast continue decltype default delete do double dynamic_cast else enum explicit "
+    "export extern false float for friend goto if inline int long mutable namespace new noexcept not not_eq "
+    "nullptr operator or or_eq private protected public register reinterpret_cast return short signed sizeof "
+    "static static_assert static_cast struct switch template this thread_local throw true try typedef typeid "
+    "typename union unsigned using virtual void volatile wchar_t while xor xor_eq".split()
+)
+
+
+# Macros the Arduino cores (Arduino.h, binary.h, pins/ESP headers) define,
+# which would be expanded inside the IconId enum. Matched case-insensitively,
+# so "input" is escaped alongside "INPUT".
+_ARDUINO_MACROS = frozenset(
+    name.casefold()
+    for name in "min max abs constrain round radians degrees sq bit bitRead bitSet bitClear bitWrite lowByte "
+    "highByte interrupts noInterrupts digitalPinToInterrupt clockCyclesPerMicrosecond clockCyclesToMicroseconds "
+    "microsecondsToClockCycles HIGH LOW INPUT OUTPUT INPUT_PULLUP INPUT_PULLDOWN OUTPUT_OPEN_DRAIN LED_BUILTIN "
+    "PI HALF_PI TWO_PI DEG_TO_RAD RAD_TO_DEG EULER SERIAL DISPLAY LSBFIRST MSBFIRST CHANGE FALLING RISING ONLOW "
+    "ONHIGH DEC HEX OCT BIN DEFAULT EXTERNAL INTERNAL INTERNAL1V1 INTERNAL2V56 NULL F PSTR PROGMEM PGM_P "
+    "A0 A1 A2 A3 A4 A5 A6 A7 SS MOSI MISO SCK SDA SCL TX RX".split()
+)
+
+
+def _enum_name(name: str) -> str:
+    # binary.h also defines B0 .. B11111111.
+    binary = name[:1] in ("B", "b") and 2 <= len(name) <= 9 and set(name[1:]) <= {"0", "1"}
+    reserved = name in _CPP_KEYWORDS or name.casefold() in _ARDUINO_MACROS or binary
+    return name + "_" if reserved else name
+
+
+def _check_enum_names(names: List[str]) -> None:
+    """Reject icons whose IconId enumerators collide after escaping and case folding."""
+    seen: Dict[str, str] = {}
+    for name in names:
+        key = _enum_name(name).casefold()
+        if key in seen:
+            raise RuntimeError(f"Icon names '{seen[key]}' and '{name}' give clashing IconId enumerators ({_enum_name(seen[key])} / {_enum_name(name)}, compared case-insensitively); rename one")
+        seen[key] = name
+
+
+def _write_gen_header(out: TextIO, icons: List[Dict[str, Any]], opts: Dict[str, Any], atlas: Optional[Dict[str, Any]] = None) -> None:
+    id_type = "uint16_t" if len(icons) <= 0xFFFF else "uint32_t"
+    out.write("#pragma once\n")
+    out.write("\n")
+    out.write("// Auto-generated icon IDs and accessors\n")
+    out.write("// DO NOT EDIT - regenerate with icons/scripts/generate_icons.py\n")
+    out.write("\n")
+    out.write('#include "icons_embedded.h"\n')
+    out.write("\n")
+    out.write("// Registry indices: EMBEDDED_ICONS[(size_t)IconId::name]\n")
+    out.write(f"enum class IconId : {id_type} {{\n")
+    for i, icon in enumerate(icons):
+        out.write(f"  {_enum_name(icon['name'])} = {i},\n")
+    out.write("};\n")
+    out.write("\n")
+    out.write(f"constexpr size_t EMBEDDED_ICON_ID_COUNT = {len(icons)};\n")
+    out.write("\n")
+    out.write("// O(1) registry access for hot paths; findEmbeddedIcon() remains for name lookups.\n")
+    out.write("const EmbeddedIcon* getEmbeddedIcon(IconId id);\n")
+
+    if opts["output"] != "source":
+        out.write("\n")
+        out.write(f"// Payloads are stored in one {ALIGN}-byte aligned binary blob ({opts['blobName']}).\n")
+        out.write(f"#define EMBEDDED_ICONS_BLOB_FILE \"{opts['blobName']}\"\n")
+        if opts["output"] == "incbin":
+            out.write("#define EMBEDDED_ICONS_BLOB_INCBIN 1\n")
+        out.write("enum class EmbeddedIconPayload : uint8_t {\n")
+        out.write("  Png,\n")
+        out.write("  Bitmap,\n")
+        out.write("};\n")
+        out.write("struct EmbeddedIconBlobRange {\n")
+        out.write("  uint32_t offset;\n")
+        out.write("  uint32_t size;\n")
+        out.write("};\n")
+        out.write("bool getEmbeddedIconBlobRange(const EmbeddedIcon* icon, EmbeddedIconPayload payload, EmbeddedIconBlobRange* out);\n")
+
+    if opts["bitmapFormats"]:
+        out.write("\n")
+        out.write("// Display-native bitmap layouts (bitmapFormat):\n")
+        out.write("//   Xbm     - row-major, LSB = leftmost pixel (drawXBitmap)\n")
+        out.write("//   Gfx     - row-major, MSB = leftmost pixel (Adafruit GFX drawBitmap)\n")
+        out.write("//   Ssd1306 - page-major, 8 vertical pixels per byte, LSB = top (SSD1306/SH1106)\n")
+        out.write("enum class IconBitmapFormat : uint8_t {\n")
+        for fmt in BITMAP_FORMATS:
+            out.write(f"  {_format_enum(fmt)},\n")
+        out.write("};\n")
+        for fmt in opts["bitmapFormats"]:
+            out.write(f"#define EMBEDDED_ICONS_HAVE_FORMAT_{fmt.upper()} 1\n")
+        out.write("const uint8_t* getEmbeddedIconBitmap(const EmbeddedIcon* icon, IconBitmapFormat format);\n")
+
+    if opts["colorFormats"] or opts["alphaMask"]:
+        out.write("\n")
+        out.write("// TFT pixel data (colorFormat), row-major, ready to DMA to the panel:\n")
+        out.write(f"//   Rgb565 - 2 bytes per pixel, {'high byte first (byte-swapped)' if opts['rgb565ByteSwap'] else 'little-endian'}\n")
+        out.write("//   Gray4 / Gray2 - 4 / 2 bits per pixel, leftmost pixel in the high bits, 0 = black\n")
+        out.write("enum class IconColorFormat : uint8_t {\n")
+        for fmt in COLOR_FORMATS:
+            out.write(f"  {_format_enum(fmt)},\n")
+        out.write("};\n")
+        for fmt in opts["colorFormats"]:
+            out.write(f"#define EMBEDDED_ICONS_HAVE_{fmt.upper()} 1\n")
+        if opts["colorFormats"] and opts["rgb565ByteSwap"]:
+            out.write("#define EMBEDDED_ICONS_RGB565_BYTE_SWAPPED 1\n")
+        out.write("const uint8_t* getEmbeddedIconPixels(const EmbeddedIcon* icon, IconColorFormat format);\n")
+        if opts["alphaMask"]:
+            out.write("// 1bpp opacity mask (alpha > 127), same layout as the registry bitmap.\n")
+            out.write("#define EMBEDDED_ICONS_HAVE_ALPHA_MASK 1\n")
+            out.write("const uint8_t* getEmbeddedIconAlphaMask(const EmbeddedIcon* icon);\n")
+
+    if opts["etags"]:
+        out.write("\n")
+        out.write("// Build-time strong ETags (quoted, PROGMEM) for conditional GETs: answer\n")
+        out.write("// 304 Not Modified when embeddedIconEtagMatches(etag, If-None-Match header).\n")
+        out.write("// Content is immutable for a given firmware, so it can be cached long-term.\n")
+        out.write("#define EMBEDDED_ICONS_HAVE_ETAGS 1\n")
+        out.write(f"#define EMBEDDED_ICON_ETAG_LEN {ETAG_HEX_DIGITS + 2}\n")
+        out.write(f'#define EMBEDDED_ICONS_CACHE_CONTROL "{ETAG_CACHE_CONTROL}"\n')
+        out.write("PGM_P getEmbeddedIconEtag(const EmbeddedIcon* icon);\n")
+        out.write("bool embeddedIconEtagMatches(PGM_P etag, const char* ifNoneMatch);\n")
+
+    if atlas is not None:
+        out.write("\n")
+        out.write("// Web UI sprite atlas: one PNG with every icon plus its offset map, as CSS\n")
+        out.write(f"// (.icon.icon-<name>, background {atlas['url']}) and JSON ({{\"icons\": {{name: [x, y, w, h]}}}}).\n")
+        out.write("#define EMBEDDED_ICONS_HAVE_ATLAS 1\n")
+        out.write("const uint8_t* getEmbeddedIconAtlasPng(size_t* size);\n")
+        out.write("const uint8_t* getEmbeddedIconAtlasCss(size_t* size);\n")
+        out.write("const uint8_t* getEmbeddedIconAtlasJson(size_t* size);\n")
+        if opts["etags"]:
+            out.write("PGM_P getEmbeddedIconAtlasPngEtag();\n")
+            out.write("PGM_P getEmbeddedIconAtlasCssEtag();\n")
+            out.write("PGM_P getEmbeddedIconAtlasJsonEtag();\n")
+
+    if _has_draw_helpers(opts):
+        out.write("\n")
+        out.write("// icon->bitmap may not be the upright raw image (transformDedup / familyDelta /\n")
+        out.write("// bitmapEncoding); draw through these helpers.\n")
+        out.write("#define EMBEDDED_ICONS_HAVE_DRAW_HELPERS 1\n")
+        if opts["transformDedup"]:
+            out.write("#define EMBEDDED_ICONS_HAVE_TRANSFORMS 1\n")
+            out.write(f"#define EMBEDDED_ICON_XFORM_NONE 0x{XFORM_NONE:02X}\n")
+            out.write(f"#define EMBEDDED_ICON_XFORM_FLIP_X 0x{XFORM_FLIP_X:02X}\n")
+            out.write(f"#define EMBEDDED_ICON_XFORM_FLIP_Y 0x{XFORM_FLIP_Y:02X}\n")
+            out.write(f"#define EMBEDDED_ICON_XFORM_SWAP_XY 0x{XFORM_SWAP_XY:02X}\n")
+            out.write("uint8_t getEmbeddedIconTransform(const EmbeddedIcon* icon);\n")
+        if opts["familyDelta"]:
+            out.write("#define EMBEDDED_ICONS_HAVE_DELTAS 1\n")
+        if opts["bitmapEncoding"] == "packbits":
+            out.write("#define EMBEDDED_ICONS_HAVE_PACKBITS 1\n")
+        out.write("bool embeddedIconPixel(const EmbeddedIcon* icon, uint16_t x, uint16_t y);\n")
+        out.write("void blitEmbeddedIcon(const EmbeddedIcon* icon, uint8_t* out);\n")
+        out.write("void drawEmbeddedIcon(const EmbeddedIcon* icon, uint8_t* fb, uint16_t fbW, uint16_t fbH, int16_t x, int16_t y);\n")
+
+
+def _format_enum(fmt: str) -> str:
+    return fmt.capitalize()
+
+
+def _format_sym(name: str, fmt: str) -> str:
+    return f"icon_{name}_bitmap_{fmt}" if fmt in BITMAP_FORMATS else f"icon_{name}_{fmt}"
+
+
+def _format_label(fmt: str) -> str:
+    if fmt in BITMAP_FORMATS:
+        return f"bitmap, {fmt} layout"
+    if fmt == ALPHA_MASK:
+        return "alpha mask"
+    return f"{fmt} pixels"
+
+
+def _format_array_list(opts: Dict[str, Any]) -> List[str]:
+    """bitmapFormat entries that need their own arrays (xbm reuses the registry bitmap when it's plain)."""
+    return [f for f in opts["bitmapFormats"] if f != FORMAT_XBM or _has_draw_helpers(opts)]
+
+
+def _write_format_tables(out: TextIO, icons: List[Dict[str, Any]], opts: Dict[str, Any]) -> None:
+    own = _format_array_list(opts)
+    for fmt in own:
+        out.write(f"// {fmt} bitmaps per registry entry\n")
+        out.write(f"static const uint8_t* const EMBEDDED_ICON_BITMAPS_{fmt.upper()}[] PROGMEM = {{\n")
+        for icon in icons:
+            out.write(f"  {icon['fmt_sym'][fmt]},\n")
+        out.write("};\n")
+        out.write("\n")
+    out.write("// Bitmap pre-arranged for a display controller; nullptr if the format wasn't built.\n")
+    out.write("const uint8_t* getEmbeddedIconBitmap(const EmbeddedIcon* icon, IconBitmapFormat format) {\n")
+    out.write("  size_t i = icon - EMBEDDED_ICONS;\n")
+    out.write("  (void)i;\n")
+    out.write("  switch (format) {\n")
+    for fmt in opts["bitmapFormats"]:
+        out.write(f"    case IconBitmapFormat::{_format_enum(fmt)}:\n")
+        if fmt in own:
+            out.write(f"      return (const uint8_t*)pgm_read_ptr(&EMBEDDED_ICON_BITMAPS_{fmt.upper()}[i]);\n")
+        else:
+            out.write("      return (const uint8_t*)pgm_read_ptr(&icon->bitmap);\n")
+    out.write("    default:\n")
+    out.write("      return nullptr;\n")
+    out.write("  }\n")
+    out.write("}\n")
+
+
+def _write_color_tables(out: TextIO, icons: List[Dict[str, Any]], opts: Dict[str, Any]) -> None:
+    for fmt in opts["colorFormats"]:
+        out.write(f"// {fmt} pixels per registry entry\n")
+        out.write(f"static const uint8_t* const EMBEDDED_ICON_PIXELS_{fmt.upper()}[] PROGMEM = {{\n")
+        for icon in icons:
+            out.write(f"  {icon['fmt_sym'][fmt]},\n")
+        out.write("};\n")
+        out.write("\n")
+    out.write("// TFT pixel data; nullptr if the format wasn't built.\n")
+    out.write("const uint8_t* getEmbeddedIconPixels(const EmbeddedIcon* icon, IconColorFormat format) {\n")
+    out.write("  size_t i = icon - EMBEDDED_ICONS;\n")
+    out.write("  (void)i;\n")
+    out.write("  switch (format) {\n")
+    for fmt in opts["colorFormats"]:
+        out.write(f"    case IconColorFormat::{_format_enum(fmt)}:\n")
+        out.write(f"      return (const uint8_t*)pgm_read_ptr(&EMBEDDED_ICON_PIXELS_{fmt.upper()}[i]);\n")
+    out.write("    default:\n")
+    out.write("      return nullptr;\n")
+    out.write("  }\n")
+    out.write("}\n")
+    if opts["alphaMask"]:
+        out.write("\n")
+        out.write("static const uint8_t* const EMBEDDED_ICON_ALPHA_MASKS[] PROGMEM = {\n")
+        for icon in icons:
+            out.write(f"  {icon['fmt_sym'][ALPHA_MASK]},\n")
+        out.write("};\n")
+        out.write("\n")
+        out.write("const uint8_t* getEmbeddedIconAlphaMask(const EmbeddedIcon* icon) {\n")
+        out.write("  return (const uint8_t*)pgm_read_ptr(&EMBEDDED_ICON_ALPHA_MASKS[icon - EMBEDDED_ICONS]);\n")
+        out.write("}\n")
+
+
+def _build_atlas(icons: List[Dict[str, Any]], opts: Dict[str, Any], memo: Optional[Dict[str, bytes]] = None) -> Dict[str, Any]:
+    """
+    Pack every distinct icon PNG into one atlas image and build its CSS and
+    JSON offset maps. Icons sharing a PNG (dedup, size variants) share a rect.
+    `memo` maps atlas pixel digests to encoded PNGs (watch mode).
+    """
+    owners = [icon for icon in icons if icon["png_sym"] == f"icon_{icon['name']}_png"]
+    images = [Image.open(io.BytesIO(icon["png"])).convert("RGBA") for icon in owners]
+    (aw, ah), pos = shelf_pack([img.size for img in images], opts["atlasPadding"])
+
+    sheet = Image.new("RGBA", (aw, ah), (0, 0, 0, 0))
+    rects: Dict[str, Tuple[int, int, int, int]] = {}
+    for icon, img, (x, y) in zip(owners, images, pos):
+        sheet.paste(img, (x, y))
+        rects[icon["png_sym"]] = (x, y, img.size[0], img.size[1])
+    digest = hashlib.sha256(f"{aw}x{ah}:{opts['pngMinimize']}:".encode("ascii") + sheet.tobytes()).hexdigest()
+    png = memo.get(digest) if memo is not None else None
+    if png is None:
+        png = _png_bytes(sheet)
+        if opts["pngMinimize"]:
+            png = minimize_png(sheet, baseline=png)
+        if memo is not None:
+            memo.clear()
+            memo[digest] = png
+
+    url = opts["atlasUrl"]
+    css = [f".icon{{display:inline-block;background:url({url}) no-repeat}}"]
+    entries: Dict[str, List[int]] = {}
+    for icon in icons:
+        x, y, w, h = rects[icon["png_sym"]]
+        css.append(f".icon-{icon['name']}{{width:{w}px;height:{h}px;background-position:{-x}px {-y}px}}")
+        entries[icon["name"]] = [x, y, w, h]
+    doc = {"image": url, "w": aw, "h": ah, "icons": entries}
+    return {
+        "url": url,
+        "size": (aw, ah),
+        "png": png,
+        "css": ("\n".join(css) + "\n").encode("utf-8"),
+        "json": json.dumps(doc, separators=(",", ":")).encode("utf-8"),
+    }
+
+
+def _etag(data: bytes) -> str:
+    return '"' + hashlib.sha256(data).hexdigest()[:ETAG_HEX_DIGITS] + '"'
+
+
+def _c_string(text: str) -> str:
+    return '"' + text.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _write_etags(out: TextIO, icons: List[Dict[str, Any]]) -> None:
+    """One ETag string per PNG array (shared PNGs share it) + per-entry pointer table."""
+    out.write("// Strong ETags over each PNG payload\n")
+    for icon in icons:
+        if icon["png_sym"] == f"icon_{icon['name']}_png":
+            out.write(f"static const char {icon['png_sym']}_etag[] PROGMEM = {_c_string(_etag(icon['png']))};\n")
+    out.write("\n")
+    out.write("static const char* const EMBEDDED_ICON_ETAGS[] PROGMEM = {\n")
+    for icon in icons:
+        out.write(f"  {icon['png_sym']}_etag,\n")
+    out.write("};\n")
+    out.write("\n")
+    out.write("PGM_P getEmbeddedIconEtag(const EmbeddedIcon* icon) {\n")
+    out.write("  return (PGM_P)pgm_read_ptr(&EMBEDDED_ICON_ETAGS[icon - EMBEDDED_ICONS]);\n")
+    out.write("}\n")
+    out.write("\n")
+    out.write("// If-None-Match uses weak comparison: any listed tag (W/ prefix ignored) or *.\n")
+    out.write("bool embeddedIconEtagMatches(PGM_P etag, const char* ifNoneMatch) {\n")
+    out.write("  if (etag == nullptr || ifNoneMatch == nullptr) {\n")
+    out.write("    return false;\n")
+    out.write("  }\n")
+    out.write("  const char* p = ifNoneMatch;\n")
+    out.write("  while (*p) {\n")
+    out.write("    while (*p == ' ' || *p == '\\t' || *p == ',') {\n")
+    out.write("      p++;\n")
+    out.write("    }\n")
+    out.write("    if (*p == '*') {\n")
+    out.write("      return true;\n")
+    out.write("    }\n")
+    out.write("    if (p[0] == 'W' && p[1] == '/') {\n")
+    out.write("      p += 2;\n")
+    out.write("    }\n")
+    out.write("    size_t k = 0;\n")
+    out.write("    while (k < EMBEDDED_ICON_ETAG_LEN && p[k] == (char)pgm_read_byte(&etag[k])) {\n")
+    out.write("      k++;\n")
+    out.write("    }\n")
+    out.write("    if (k == EMBEDDED_ICON_ETAG_LEN && (p[k] == '\\0' || p[k] == ',' || p[k] == ' ' || p[k] == '\\t')) {\n")
+    out.write("      return true;\n")
+    out.write("    }\n")
+    out.write("    while (*p && *p != ',') {\n")
+    out.write("      p++;\n")
+    out.write("    }\n")
+    out.write("  }\n")
+    out.write("  return false;\n")
+    out.write("}\n")
+
+
+def _write_atlas(out: TextIO, atlas: Dict[str, Any], opts: Dict[str, Any]) -> None:
+    w, h = atlas["size"]
+    for kind, label in (("png", f"sprite atlas PNG ({w}x{h})"), ("css", "atlas CSS"), ("json", "atlas JSON offset map")):
+        out.write(f"// Web UI {label} ({len(atlas[kind])} bytes)\n")
+        _write_payload(out, f"EMBEDDED_ICON_ATLAS_{kind.upper()}", atlas[kind], opts)
+        out.write("\n")
+    for kind, fn in (("png", "Png"), ("css", "Css"), ("json", "Json")):
+        out.write(f"const uint8_t* getEmbeddedIconAtlas{fn}(size_t* size) {{\n")
+        out.write(f"  *size = {len(atlas[kind])};\n")
+        out.write(f"  return EMBEDDED_ICON_ATLAS_{kind.upper()};\n")
+        out.write("}\n")
+        if opts["etags"]:
+            out.write("\n")
+            out.write(f"static const char EMBEDDED_ICON_ATLAS_{kind.upper()}_ETAG[] PROGMEM = {_c_string(_etag(atlas[kind]))};\n")
+            out.write(f"PGM_P getEmbeddedIconAtlas{fn}Etag() {{\n")
+            out.write(f"  return EMBEDDED_ICON_ATLAS_{kind.upper()}_ETAG;\n")
+            out.write("}\n")
+        if kind != "json":
+            out.write("\n")
+
+
+def _share_format(icons: List[Dict[str, Any]], fmt: str) -> int:
+    """Point icon["fmt_sym"][fmt] at the first identical array; returns the bytes emitted."""
+    owners: Dict[bytes, str] = {}
+    used = 0
+    for icon in icons:
+        data = icon["fmt"][fmt]
+        owner = owners.setdefault(hashlib.sha256(data).digest(), icon["name"])
+        icon.setdefault("fmt_sym", {})[fmt] = _format_sym(owner, fmt)
+        if owner == icon["name"]:
+            used += len(data)
+    return used
+
+
+def _build_formats(icons: List[Dict[str, Any]], formats: List[str]) -> Dict[str, int]:
+    """
+    Re-pack every icon bitmap in each extra layout (icon["fmt"][fmt]), verify
+    the round trip and share identical arrays (icon["fmt_sym"][fmt]).
+    Returns the flash used per format.
+    """
+    used: Dict[str, int] = {}
+    for fmt in formats:
+        for icon in icons:
+            mono = unpack_1bpp(icon["bmp"], (icon["w"], icon["h"]))
+            data = pack_bitmap_format(mono, fmt)
+            _require(unpack_bitmap_format(data, mono.size, fmt).tobytes() == mono.tobytes(), f"Internal error: {fmt} layout round-trip failed for {icon['name']}")
+            icon.setdefault("fmt", {})[fmt] = data
+        used[fmt] = _share_format(icons, fmt)
+    return used
+
+
+def _build_color_formats(icons: List[Dict[str, Any]], opts: Dict[str, Any]) -> Dict[str, int]:
+    """
+    Convert each icon's PNG (lossless, so exactly the sheet tile) to the
+    colorFormat layouts and optional alpha mask, at the icon's registry size.
+    Returns the flash used per format.
+    """
+    formats = list(opts["colorFormats"]) + ([ALPHA_MASK] if opts["alphaMask"] else [])
+    if not formats:
+        return {}
+    for icon in icons:
+        img = Image.open(io.BytesIO(icon["png"])).convert("RGBA")
+        if img.size != (icon["w"], icon["h"]):
+            img = img.resize((icon["w"], icon["h"]), resample=Image.NEAREST)
+        rgb = flatten(img, opts["colorBackground"])
+        fmt_data = icon.setdefault("fmt", {})
+        for fmt in opts["colorFormats"]:
+            fmt_data[fmt] = pack_color_format(rgb, fmt, opts["rgb565ByteSwap"])
+        if opts["alphaMask"]:
+            fmt_data[ALPHA_MASK] = pack_alpha_mask(img)
+
+    return {fmt: _share_format(icons, fmt) for fmt in formats}
+
+
+def _has_draw_helpers(opts: Dict[str, Any]) -> bool:
+    return opts["transformDedup"] or opts["familyDelta"] or opts["bitmapEncoding"] != "raw"
+
+
+def _dedup_payloads(icons: List[Dict[str, Any]], transforms: bool = False) -> Dict[str, int]:
+    """
+    Point icons whose PNG (or bitmap) bytes are identical at a single shared
+    array, owned by the first icon in registry order. Sets icon["png_sym"] /
+    icon["bmp_sym"] and returns the flash saved per payload kind.
+
+    With `transforms`, a bitmap that equals a rotation/mirror of an earlier
+    bitmap of the same size also shares it, and icon["bmp_xform"] records the
+    XFORM_* flags to apply at draw time. Non-square bitmaps only share via
+    mirrors (a transpose would change their shape).
+    """
+    saved = {"png": 0, "bmp": 0}
+    for kind, suffix in (("png", "png"), ("bmp", "bitmap")):
+        owners: Dict[Tuple[Tuple[int, int], bytes], Tuple[str, int]] = {}
+        for icon in icons:
+            # Bitmaps only match at the same size; PNGs carry their own.
+            size = (icon["w"], icon["h"]) if kind == "bmp" else (0, 0)
+            digest = hashlib.sha256(icon[kind]).digest()
+            owner, xform = owners.get((size, digest), (icon["name"], XFORM_NONE))
+            icon[f"{kind}_sym"] = f"icon_{owner}_{suffix}"
+            if owner != icon["name"]:
+                saved[kind] += len(icon[kind])
+            elif transforms and kind == "bmp":
+                # New canonical payload: register every variant it can be drawn as.
+                for t in range(8) if size[0] == size[1] else (XFORM_NONE, XFORM_FLIP_X, XFORM_FLIP_Y, XFORM_FLIP_X | XFORM_FLIP_Y):
+                    variant = transform_1bpp(icon[kind], size, t) if t else icon[kind]
+                    owners.setdefault((size, hashlib.sha256(variant).digest()), (owner, t))
+            else:
+                owners[(size, digest)] = (owner, XFORM_NONE)
+            if kind == "bmp":
+                icon["bmp_xform"] = xform
+    return saved
+
+
+def _write_draw_helpers(out: TextIO, icons: List[Dict[str, Any]], opts: Dict[str, Any]) -> None:
+    """Tables + C helpers that rebuild the upright bitmap when it isn't stored verbatim."""
+    transforms = opts["transformDedup"]
+    deltas = opts["familyDelta"]
+    packbits = opts["bitmapEncoding"] == "packbits"
+
+    if transforms:
+        # Flag semantics must match the XFORM_* definition in icons/scripts/bitmap_pack.py.
+        out.write("// Draw-time transform per registry entry (EMBEDDED_ICON_XFORM_* flags)\n")
+        _write_c_int_array(out, "uint8_t", "EMBEDDED_ICON_TRANSFORMS", [icon["bmp_xform"] for icon in icons])
+        out.write("\n")
+        out.write("uint8_t getEmbeddedIconTransform(const EmbeddedIcon* icon) {\n")
+        out.write("  return pgm_read_byte(&EMBEDDED_ICON_TRANSFORMS[icon - EMBEDDED_ICONS]);\n")
+        out.write("}\n")
+        out.write("\n")
+        out.write("// Maps an upright pixel to its position in the stored bitmap.\n")
+        out.write("static void embeddedIconMapXY(uint8_t t, const EmbeddedIcon& e, uint16_t* x, uint16_t* y) {\n")
+        out.write("  uint16_t sx = *x, sy = *y;\n")
+        out.write("  if (t & EMBEDDED_ICON_XFORM_SWAP_XY) {\n")
+        out.write("    sx = *y;\n")
+        out.write("    sy = *x;\n")
+        out.write("  }\n")
+        out.write("  if (t & EMBEDDED_ICON_XFORM_FLIP_X) {\n")
+        out.write("    sx = e.w - 1 - sx;\n")
+        out.write("  }\n")
+        out.write("  if (t & EMBEDDED_ICON_XFORM_FLIP_Y) {\n")
+        out.write("    sy = e.h - 1 - sy;\n")
+        out.write("  }\n")
+        out.write("  *x = sx;\n")
+        out.write("  *y = sy;\n")
+        out.write("}\n")
+        out.write("\n")
+        out.write("// Transformed icons always read a raw, delta-free source bitmap.\n")
+        out.write("static bool embeddedIconRawPixel(const EmbeddedIcon& e, uint8_t t, uint16_t x, uint16_t y) {\n")
+        out.write("  embeddedIconMapXY(t, e, &x, &y);\n")
+        out.write("  return (pgm_read_byte(&e.bitmap[y * ((e.w + 7) / 8) + x / 8]) >> (x & 7)) & 1;\n")
+        out.write("}\n")
+        out.write("\n")
+
+    if deltas:
+        data = bytearray()
+        offsets = [0]
+        for icon in icons:
+            data += icon.get("bmp_delta", b"")
+            offsets.append(len(data))
+        offset_type, read_offset = _delta_offset_type(len(data))
+        out.write("// Family deltas: (byte offset, XOR mask) pairs applied to the base bitmap.\n")
+        out.write("// Records for registry entry i are DATA[OFFSETS[i] .. OFFSETS[i + 1]).\n")
+        _write_c_array(out, "EMBEDDED_ICON_DELTA_DATA", bytes(data) or b"\x00")
+        _write_c_int_array(out, offset_type, "EMBEDDED_ICON_DELTA_OFFSETS", offsets)
+        out.write("\n")
+
+    if packbits:
+        out.write("// Bitmap storage per registry entry: 0 = raw, 1 = PackBits\n")
+        _write_c_int_array(out, "uint8_t", "EMBEDDED_ICON_BITMAP_ENCODINGS", [icon["bmp_enc"] for icon in icons])
+        out.write("\n")
+
+    # Streaming reader: yields the upright bitmap bytes in order, decoding
+    # PackBits and applying family deltas on the fly (no scratch buffer).
+    out.write("struct EmbeddedIconReader {\n")
+    out.write("  const uint8_t* src;\n")
+    out.write("  size_t off;\n")
+    if packbits:
+        out.write("  uint8_t packbits;\n")
+        out.write("  uint8_t literal;\n")
+        out.write("  uint8_t run;\n")
+        out.write("  uint8_t value;\n")
+    if deltas:
+        out.write("  size_t delta;\n")
+        out.write("  size_t deltaEnd;\n")
+    out.write("};\n")
+    out.write("\n")
+    out.write("static void embeddedIconReaderInit(EmbeddedIconReader* r, const EmbeddedIcon* icon, const uint8_t* bitmap) {\n")
+    out.write("  size_t i = icon - EMBEDDED_ICONS;\n")
+    out.write("  (void)i;\n")
+    out.write("  r->src = bitmap;\n")
+    out.write("  r->off = 0;\n")
+    if packbits:
+        out.write("  r->packbits = pgm_read_byte(&EMBEDDED_ICON_BITMAP_ENCODINGS[i]);\n")
+        out.write("  r->literal = 0;\n")
+        out.write("  r->run = 0;\n")
+        out.write("  r->value = 0;\n")
+    if deltas:
+        out.write(f"  r->delta = {read_offset}(&EMBEDDED_ICON_DELTA_OFFSETS[i]);\n")
+        out.write(f"  r->deltaEnd = {read_offset}(&EMBEDDED_ICON_DELTA_OFFSETS[i + 1]);\n")
+    out.write("}\n")
+    out.write("\n")
+    out.write("static uint8_t embeddedIconReaderNext(EmbeddedIconReader* r) {\n")
+    out.write("  uint8_t b;\n")
+    if packbits:
+        out.write("  if (r->packbits) {\n")
+        out.write("    while (r->literal == 0 && r->run == 0) {\n")
+        out.write("      int8_t n = (int8_t)pgm_read_byte(r->src++);\n")
+        out.write("      if (n >= 0) {\n")
+        out.write("        r->literal = (uint8_t)(n + 1);\n")
+        out.write("      } else if (n != -128) {\n")
+        out.write("        r->run = (uint8_t)(1 - n);\n")
+        out.write("        r->value = pgm_read_byte(r->src++);\n")
+        out.write("      }\n")
+        out.write("    }\n")
+        out.write("    if (r->literal) {\n")
+        out.write("      r->literal--;\n")
+        out.write("      b = pgm_read_byte(r->src++);\n")
+        out.write("    } else {\n")
+        out.write("      r->run--;\n")
+        out.write("      b = r->value;\n")
+        out.write("    }\n")
+        out.write("  } else {\n")
+        out.write("    b = pgm_read_byte(r->src++);\n")
+        out.write("  }\n")
+    else:
+        out.write("  b = pgm_read_byte(r->src++);\n")
+    if deltas:
+        out.write("  if (r->delta < r->deltaEnd && pgm_read_byte(&EMBEDDED_ICON_DELTA_DATA[r->delta]) == r->off) {\n")
+        out.write("    b ^= pgm_read_byte(&EMBEDDED_ICON_DELTA_DATA[r->delta + 1]);\n")
+        out.write("    r->delta += 2;\n")
+        out.write("  }\n")
+    out.write("  r->off++;\n")
+    out.write("  return b;\n")
+    out.write("}\n")
+    out.write("\n")
+    out.write("static void embeddedIconReaderSkip(EmbeddedIconReader* r, size_t n) {\n")
+    if packbits:
+        out.write("  if (r->packbits) {\n")
+        out.write("    while (n--) {\n")
+        out.write("      embeddedIconReaderNext(r);\n")
+        out.write("    }\n")
+        out.write("    return;\n")
+        out.write("  }\n")
+    out.write("  r->src += n;\n")
+    out.write("  r->off += n;\n")
+    if deltas:
+        out.write("  while (r->delta < r->deltaEnd && pgm_read_byte(&EMBEDDED_ICON_DELTA_DATA[r->delta]) < r->off) {\n")
+        out.write("    r->delta += 2;\n")
+        out.write("  }\n")
+    out.write("}\n")
+    out.write("\n")
+
+    out.write("bool embeddedIconPixel(const EmbeddedIcon* icon, uint16_t x, uint16_t y) {\n")
+    out.write("  EmbeddedIcon e;\n")
+    out.write("  memcpy_P(&e, icon, sizeof(e));\n")
+    out.write("  uint16_t sx = x, sy = y;\n")
+    if transforms:
+        out.write("  embeddedIconMapXY(getEmbeddedIconTransform(icon), e, &sx, &sy);\n")
+    out.write("  EmbeddedIconReader r;\n")
+    out.write("  embeddedIconReaderInit(&r, icon, e.bitmap);\n")
+    out.write("  embeddedIconReaderSkip(&r, sy * ((e.w + 7) / 8) + sx / 8);\n")
+    out.write("  return (embeddedIconReaderNext(&r) >> (sx & 7)) & 1;\n")
+    out.write("}\n")
+    out.write("\n")
+    out.write("// Writes the upright bitmap (LSB-first rows, stride (w + 7) / 8) into out.\n")
+    out.write("void blitEmbeddedIcon(const EmbeddedIcon* icon, uint8_t* out) {\n")
+    out.write("  EmbeddedIcon e;\n")
+    out.write("  memcpy_P(&e, icon, sizeof(e));\n")
+    out.write("  size_t stride = (e.w + 7) / 8;\n")
+    if transforms:
+        out.write("  uint8_t t = getEmbeddedIconTransform(icon);\n")
+        out.write("  if (t != EMBEDDED_ICON_XFORM_NONE) {\n")
+        out.write("    memset(out, 0, stride * e.h);\n")
+        out.write("    for (uint16_t y = 0; y < e.h; y++) {\n")
+        out.write("      for (uint16_t x = 0; x < e.w; x++) {\n")
+        out.write("        if (embeddedIconRawPixel(e, t, x, y)) {\n")
+        out.write("          out[y * stride + x / 8] |= (uint8_t)(1 << (x & 7));\n")
+        out.write("        }\n")
+        out.write("      }\n")
+        out.write("    }\n")
+        out.write("    return;\n")
+        out.write("  }\n")
+    out.write("  EmbeddedIconReader r;\n")
+    out.write("  embeddedIconReaderInit(&r, icon, e.bitmap);\n")
+    if packbits:
+        out.write("  if (r.packbits) {\n")
+        out.write("    const uint8_t* src = e.bitmap;\n")
+        out.write("    for (size_t k = 0, n = stride * e.h; k < n;) {\n")
+        out.write("      int8_t h = (int8_t)pgm_read_byte(src++);\n")
+        out.write("      if (h >= 0) {\n")
+        out.write("        size_t len = (size_t)h + 1 < n - k ? (size_t)h + 1 : n - k;\n")
+        out.write("        memcpy_P(out + k, src, len);\n")
+        out.write("        src += h + 1;\n")
+        out.write("        k += len;\n")
+        out.write("      } else if (h != -128) {\n")
+        out.write("        size_t len = (size_t)(1 - h) < n - k ? (size_t)(1 - h) : n - k;\n")
+        out.write("        memset(out + k, pgm_read_byte(src++), len);\n")
+        out.write("        k += len;\n")
+        out.write("      }\n")
+        out.write("    }\n")
+        out.write("  } else {\n")
+        out.write("    memcpy_P(out, e.bitmap, stride * e.h);\n")
+        out.write("  }\n")
+    else:
+        out.write("  memcpy_P(out, e.bitmap, stride * e.h);\n")
+    if deltas:
+        out.write("  for (size_t k = r.delta; k < r.deltaEnd; k += 2) {\n")
+        out.write("    out[pgm_read_byte(&EMBEDDED_ICON_DELTA_DATA[k])] ^= pgm_read_byte(&EMBEDDED_ICON_DELTA_DATA[k + 1]);\n")
+        out.write("  }\n")
+    out.write("}\n")
+    out.write("\n")
+    out.write("// ORs the icon's set pixels into a 1bpp LSB-first row-major framebuffer\n")
+    out.write("// (stride (fbW + 7) / 8) at (x, y), clipped to fbW x fbH.\n")
+    out.write("void drawEmbeddedIcon(const EmbeddedIcon* icon, uint8_t* fb, uint16_t fbW, uint16_t fbH, int16_t x, int16_t y) {\n")
+    out.write("  EmbeddedIcon e;\n")
+    out.write("  memcpy_P(&e, icon, sizeof(e));\n")
+    out.write("  size_t stride = (e.w + 7) / 8;\n")
+    out.write("  size_t fbStride = (fbW + 7) / 8;\n")
+    if transforms:
+        out.write("  uint8_t t = getEmbeddedIconTransform(icon);\n")
+        out.write("  if (t != EMBEDDED_ICON_XFORM_NONE) {\n")
+        out.write("    for (uint16_t row = 0; row < e.h; row++) {\n")
+        out.write("      for (uint16_t col = 0; col < e.w; col++) {\n")
+        out.write("        int32_t px = x + col, py = y + row;\n")
+        out.write("        if (px >= 0 && py >= 0 && px < fbW && py < fbH && embeddedIconRawPixel(e, t, col, row)) {\n")
+        out.write("          fb[py * fbStride + px / 8] |= (uint8_t)(1 << (px & 7));\n")
+        out.write("        }\n")
+        out.write("      }\n")
+        out.write("    }\n")
+        out.write("    return;\n")
+        out.write("  }\n")
+    out.write("  EmbeddedIconReader r;\n")
+    out.write("  embeddedIconReaderInit(&r, icon, e.bitmap);\n")
+    out.write("  for (uint16_t row = 0; row < e.h; row++) {\n")
+    out.write("    int32_t py = y + row;\n")
+    out.write("    for (size_t col = 0; col < stride; col++) {\n")
+    out.write("      uint8_t b = embeddedIconReaderNext(&r);\n")
+    out.write("      if (b == 0 || py < 0 || py >= fbH) {\n")
+    out.write("        continue;\n")
+    out.write("      }\n")
+    out.write("      int32_t px0 = x + (int32_t)col * 8;\n")
+    out.write("      if (px0 >= 0 && px0 + 8 <= fbW) {\n")
+    out.write("        uint8_t* dst = &fb[py * fbStride + px0 / 8];\n")
+    out.write("        uint8_t sh = px0 & 7;\n")
+    out.write("        dst[0] |= (uint8_t)(b << sh);\n")
+    out.write("        if (sh) {\n")
+    out.write("          dst[1] |= (uint8_t)(b >> (8 - sh));\n")
+    out.write("        }\n")
+    out.write("        continue;\n")
+    out.write("      }\n")
+    out.write("      for (uint8_t bit = 0; bit < 8; bit++) {\n")
+    out.write("        int32_t px = px0 + bit;\n")
+    out.write("        if ((b >> bit) & 1 && px >= 0 && px < fbW) {\n")
+    out.write("          fb[py * fbStride + px / 8] |= (uint8_t)(1 << (px & 7));\n")
+    out.write("        }\n")
+    out.write("      }\n")
+    out.write("    }\n")
+    out.write("  }\n")
+    out.write("}\n")
+
+
+def _encode_bitmaps(icons: List[Dict[str, Any]], encoding: str) -> int:
+    """
+    Compress each stored bitmap array with `encoding` ("packbits"), keeping
+    it raw when that isn't smaller or when a transformed icon reads it by
+    random access. Sets icon["bmp_enc"] (0 raw, 1 packbits) on every icon and
+    icon["bmp_stored"] on array owners; returns bytes saved.
+    """
+    random_access = {icon["bmp_sym"] for icon in icons if icon.get("bmp_xform", XFORM_NONE) != XFORM_NONE}
+    enc_by_sym: Dict[str, int] = {}
+    saved = 0
+    for icon in icons:
+        sym = icon["bmp_sym"]
+        if sym != f"icon_{icon['name']}_bitmap":
+            continue
+        enc = 0
+        if encoding == "packbits" and sym not in random_access:
+            packed = packbits_encode(icon["bmp"])
+            _require(packbits_decode(packed, len(icon["bmp"])) == icon["bmp"], f"Internal error: PackBits round-trip failed for {icon['name']}")
+            if len(packed) < len(icon["bmp"]):
+                icon["bmp_stored"] = packed
+                saved += len(icon["bmp"]) - len(packed)
+                enc = 1
+        enc_by_sym[sym] = enc
+    for icon in icons:
+        icon["bmp_enc"] = enc_by_sym[icon["bmp_sym"]]
+    return saved
+
+
+def _family_groups(icons: List[Dict[str, Any]], declared: Optional[Dict[str, List[str]]]) -> Dict[str, List[Dict[str, Any]]]:
+    """Families from the manifest's "families" map, else by name prefix (text before the last '_')."""
+    by_name = {icon["name"]: icon for icon in icons}
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    if declared is not None:
+        _require(isinstance(declared, dict), "families must be an object of family -> [icon names]")
+        claimed = set()
+        for family, members in declared.items():
+            _require(isinstance(members, list), f"families.{family} must be a list of icon names")
+            for name in members:
+                _require(name in by_name, f"families.{family}: unknown icon '{name}'")
+                _require(name not in claimed, f"Icon '{name}' is in more than one family")
+                claimed.add(name)
+            groups[family] = [by_name[n] for n in members]
+    else:
+        for icon in icons:
+            if "_" in icon["name"]:
+                groups.setdefault(icon["name"].rsplit("_", 1)[0], []).append(icon)
+    return {k: v for k, v in groups.items() if len(v) > 1}
+
+
+def _xor_delta(base: bytes, bmp: bytes) -> bytes:
+    return bytes(b for off, (x, y) in enumerate(zip(base, bmp)) if x != y for b in (off, x ^ y))
+
+
+def _apply_xor_delta(base: bytes, delta: bytes) -> bytes:
+    out = bytearray(base)
+    for k in range(0, len(delta), 2):
+        out[delta[k]] ^= delta[k + 1]
+    return bytes(out)
+
+
+def _delta_encode_families(icons: List[Dict[str, Any]], declared: Optional[Dict[str, List[str]]]) -> Dict[str, Any]:
+    """
+    Within each family, store one base bitmap and encode the other members
+    as sparse XOR deltas against it (icon["bmp_delta"], icon["bmp_sym"] ->
+    base). A member falls back to its raw bitmap when the delta isn't
+    smaller. Only bitmaps stored verbatim (not aliases or transformed) take
+    part, and arrays other icons share are never replaced. Returns a small
+    report.
+    """
+    report: Dict[str, Any] = {"families": 0, "icons": 0, "saved": 0}
+    refs: Dict[str, int] = {}
+    for icon in icons:
+        refs[icon["bmp_sym"]] = refs.get(icon["bmp_sym"], 0) + 1
+    for family, members in _family_groups(icons, declared).items():
+        # Deltas are byte-for-byte, so bases and members must share a size.
+        by_size: Dict[Tuple[int, int], List[Dict[str, Any]]] = {}
+        for m in members:
+            if m["bmp_sym"] == f"icon_{m['name']}_bitmap" and m["bmp_xform"] == XFORM_NONE and len(m["bmp"]) <= 256:
+                by_size.setdefault((m["w"], m["h"]), []).append(m)
+        coded = 0
+        for own in by_size.values():
+            if len(own) < 2:
+                continue
+
+            def cost(base: Dict[str, Any]) -> int:
+                return sum(min(len(_xor_delta(base["bmp"], m["bmp"])), len(m["bmp"])) for m in own if m is not base)
+
+            base = min(own, key=cost)
+            for m in own:
+                if m is base or refs[m["bmp_sym"]] > 1:
+                    # Arrays shared with other icons must stay as they are.
+                    continue
+                delta = _xor_delta(base["bmp"], m["bmp"])
+                if len(delta) >= len(m["bmp"]):
+                    continue
+                _require(_apply_xor_delta(base["bmp"], delta) == m["bmp"], f"Internal error: delta round-trip failed for {m['name']}")
+                m["bmp_delta"] = delta
+                m["bmp_sym"] = base["bmp_sym"]
+                report["saved"] += len(m["bmp"]) - len(delta)
+                coded += 1
+        if coded:
+            report["families"] += 1
+            report["icons"] += coded
+    return report
+
+
+def _write_c_int_array(out: TextIO, ctype: str, name: str, values: List[int], cols: int = 16) -> None:
+    out.write(f"static const {ctype} PROGMEM {name}[] = {{\n")
+    for i in range(0, len(values), cols):
+        out.write("  " + ", ".join(str(v) for v in values[i : i + cols]) + ",\n")
+    out.write("};\n")
+
+
+def _write_lookup(out: TextIO, ph: PerfectHash) -> None:
+    # Hash/mix constants must match icons/scripts/perfect_hash.py.
+    wide_displace = any(d < -0x8000 or d > 0x7FFF for d in ph.displace)
+    wide_slots = len(ph) > 0xFFFF
+    displace_type, read_displace = ("int32_t", "(int32_t)pgm_read_dword") if wide_displace else ("int16_t", "(int16_t)pgm_read_word")
+    slot_type, read_slot = ("uint32_t", "pgm_read_dword") if wide_slots else ("uint16_t", "pgm_read_word")
+
+    out.write("// Minimal perfect hash over icon names (see icons/scripts/perfect_hash.py)\n")
+    out.write(f"static const uint32_t EMBEDDED_ICON_HASH_SEED = 0x{ph.seed:08X}UL;\n")
+    _write_c_int_array(out, displace_type, "EMBEDDED_ICON_HASH_DISPLACE", ph.displace)
+    _write_c_int_array(out, slot_type, "EMBEDDED_ICON_HASH_SLOTS", ph.slots)
+    out.write("\n")
+    out.write("static uint32_t embeddedIconHash(const char* s) {\n")
+    out.write(f"  uint32_t h = 0x{FNV_OFFSET:08X}UL ^ EMBEDDED_ICON_HASH_SEED;\n")
+    out.write("  while (*s) {\n")
+    out.write("    h ^= (uint8_t)*s++;\n")
+    out.write(f"    h *= 0x{FNV_PRIME:08X}UL;\n")
+    out.write("  }\n")
+    out.write("  return h;\n")
+    out.write("}\n")
+    out.write("\n")
+    out.write("static uint32_t embeddedIconMix(uint32_t h, uint32_t d) {\n")
+    out.write(f"  uint32_t x = h + d * 0x{GOLDEN:08X}UL;\n")
+    out.write("  x ^= x >> 16;\n")
+    out.write("  x *= 0x85EBCA6BUL;\n")
+    out.write("  x ^= x >> 13;\n")
+    out.write("  x *= 0xC2B2AE35UL;\n")
+    out.write("  x ^= x >> 16;\n")
+    out.write("  return x;\n")
+    out.write("}\n")
+    out.write("\n")
+    out.write("// Lookup: one hash, one PROGMEM compare, no stack copy\n")
+    out.write("const EmbeddedIcon* findEmbeddedIcon(const char* name) {\n")
+    out.write("  if (name == nullptr) {\n")
+    out.write("    return nullptr;\n")
+    out.write("  }\n")
+    out.write("  uint32_t h = embeddedIconHash(name);\n")
+    out.write(f"  int32_t d = {read_displace}(&EMBEDDED_ICON_HASH_DISPLACE[h % EMBEDDED_ICONS_COUNT]);\n")
+    out.write("  uint32_t slot = d < 0 ? (uint32_t)(-d - 1) : embeddedIconMix(h, (uint32_t)d) % EMBEDDED_ICONS_COUNT;\n")
+    out.write(f"  size_t i = {read_slot}(&EMBEDDED_ICON_HASH_SLOTS[slot]);\n")
+    out.write("  if (strcmp_P(name, (PGM_P)pgm_read_ptr(&EMBEDDED_ICONS[i].name)) != 0) {\n")
+    out.write("    return nullptr;\n")
+    out.write("  }\n")
+    out.write("  return &EMBEDDED_ICONS[i];\n")
+    out.write("}\n")
+
+
+def _lookup_probes(names: List[str]) -> List[str]:
+    """Near-miss names that must not resolve."""
+    known = set(names)
+    return [p for name in names for p in (name + "_", name[:-1], name.upper(), "x" + name) if p not in known]
+
+
+def _verify_lookup(ph: PerfectHash, names: List[str]) -> None:
+    """Host-side check of the lookup model: every name resolves, near-misses don't."""
+    for i, name in enumerate(names):
+        _require(ph.lookup(name.encode("ascii")) == i, f"Perfect hash does not resolve '{name}'")
+    for probe in _lookup_probes(names):
+        _require(names[ph.lookup(probe.encode("ascii"))] != probe, f"Perfect hash matched unknown name '{probe}'")
+
+
+class _Timers:
+    """
+    Wall time per pipeline stage and per icon for --profile. lap(stage)
+    charges the time since the previous lap to `stage` (and to `icon` if
+    given), so timing a stage costs one perf_counter() call.
+    """
+
+    def __init__(self) -> None:
+        self.stages: Dict[str, float] = {}
+        self.icons: Dict[str, float] = {}
+        self._last = time.perf_counter()
+
+    def lap(self, stage: str, icon: Optional[str] = None) -> None:
+        now = time.perf_counter()
+        elapsed = now - self._last
+        self._last = now
+        self.stages[stage] = self.stages.get(stage, 0.0) + elapsed
+        if icon is not None:
+            self.icons[icon] = self.icons.get(icon, 0.0) + elapsed
+
+
+def _print_profile(timers: _Timers, jobs: int) -> None:
+    total = sum(timers.stages.values())
+    print(f"Profile: {total * 1000:.1f} ms")
+    for stage, seconds in timers.stages.items():
+        share = 100 * seconds / total if total else 0.0
+        print(f"  {stage:<16} {seconds * 1000:9.1f} ms {share:5.1f}%")
+    if timers.icons:
+        slowest = sorted(timers.icons.items(), key=lambda kv: -kv[1])[:FLASH_REPORT_TOP]
+        note = " (cache lookup only; -j encodes in workers)" if jobs > 1 else ""
+        print(f"  slowest icons{note}:")
+        for name, seconds in slowest:
+            print(f"    {name}: {seconds * 1000:.2f} ms")
+
+
+def _delta_offset_type(data_len: int) -> Tuple[str, str]:
+    """C type and PROGMEM reader for EMBEDDED_ICON_DELTA_OFFSETS entries."""
+    return ("uint16_t", "pgm_read_word") if data_len <= 0xFFFF else ("uint32_t", "pgm_read_dword")
+
+
+def _flash_report(icons: List[Dict[str, Any]], opts: Dict[str, Any], ph: PerfectHash, atlas: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Flash bytes per icon, split into the arrays it owns (shared arrays count
+    once, for their first user) and its registry/table overhead, plus the
+    shared tables. Registry sizes are estimates for a 32-bit target.
+    """
+    per_entry = REGISTRY_ENTRY_BYTES + POINTER_BYTES * len(_format_array_list(opts) + opts["colorFormats"] + ([ALPHA_MASK] if opts["alphaMask"] else []))
+    per_entry += int(opts["transformDedup"]) + 2 * int(opts["familyDelta"]) + int(opts["bitmapEncoding"] != "raw")
+    rows: List[Dict[str, Any]] = []
+    for icon in icons:
+        name = icon["name"]
+        png = len(icon["png"]) if icon["png_sym"] == f"icon_{name}_png" else 0
+        if icon["bmp_sym"] == f"icon_{name}_bitmap":
+            bmp = len(icon.get("bmp_stored", icon["bmp"]))
+        else:
+            bmp = len(icon.get("bmp_delta", b""))
+        formats = sum(len(data) for fmt, data in icon.get("fmt", {}).items() if icon["fmt_sym"][fmt] == _format_sym(name, fmt))
+        registry = per_entry + len(name) + 1
+        if opts["etags"]:
+            registry += POINTER_BYTES + (len(_etag(icon["png"])) + 1 if png else 0)
+        rows.append({"name": name, "png": png, "bitmap": bmp, "formats": formats, "registry": registry, "total": png + bmp + formats + registry})
+
+    shared = {"hash": 2 * len(ph.displace) + (4 if len(ph) > 0xFFFF else 2) * len(ph.slots)}
+    if opts["familyDelta"]:
+        # EMBEDDED_ICON_DELTA_OFFSETS (one entry per icon plus the end) and
+        # the placeholder byte DATA gets when no icon has a delta; the
+        # records themselves are counted under their icons.
+        data_len = sum(len(icon.get("bmp_delta", b"")) for icon in icons)
+        offset_bytes = 2 if _delta_offset_type(data_len)[0] == "uint16_t" else 4
+        shared["delta_offsets"] = offset_bytes * (len(icons) + 1) + (0 if data_len else 1)
+    if atlas is not None:
+        shared["atlas"] = sum(len(atlas[kind]) for kind in ("png", "css", "json"))
+    totals = {key: sum(r[key] for r in rows) for key in ("png", "bitmap", "formats", "registry")}
+    totals["shared"] = sum(shared.values())
+    totals["total"] = sum(totals.values())
+    return {
+        "icons": rows,
+        "shared": shared,
+        "totals": totals,
+        "largest": [r["name"] for r in sorted(rows, key=lambda r: -r["total"])[:FLASH_REPORT_TOP]],
+    }
+
+
+def _flash_delta(report: Dict[str, Any], previous: Dict[str, Any]) -> Dict[str, Any]:
+    """Per-icon and total byte changes against a previous report (added/removed icons included)."""
+    old = {r["name"]: r["total"] for r in previous.get("icons", [])}
+    new = {r["name"]: r["total"] for r in report["icons"]}
+    icons = {name: new.get(name, 0) - old.get(name, 0) for name in list(new) + [n for n in old if n not in new]}
+    return {
+        "total": report["totals"]["total"] - int(previous.get("totals", {}).get("total", 0)),
+        "icons": {name: change for name, change in icons.items() if change},
+        "added": [name for name in new if name not in old],
+        "removed": [name for name in old if name not in new],
+    }
+
+
+def _print_flash_report(report: Dict[str, Any], budget: Optional[int]) -> None:
+    totals = report["totals"]
+    print(f"Flash report: {totals['total']}B (png={totals['png']}B, bmp={totals['bitmap']}B, formats={totals['formats']}B, registry~{totals['registry']}B, shared={totals['shared']}B)")
+    if budget is not None:
+        print(f"  budget: {budget}B, {budget - totals['total']}B headroom")
+    by_name = {r["name"]: r for r in report["icons"]}
+    print("  largest:")
+    for name in report["largest"]:
+        r = by_name[name]
+        print(f"    {name}: {r['total']}B (png={r['png']}B, bmp={r['bitmap']}B)")
+    delta = report.get("delta")
+    if delta is not None:
+        print(f"  vs previous build: {delta['total']:+d}B, {len(delta['icons'])} icon(s) changed, {len(delta['added'])} added, {len(delta['removed'])} removed")
+        for name, change in sorted(delta["icons"].items(), key=lambda kv: -abs(kv[1]))[:FLASH_REPORT_TOP]:
+            print(f"    {name}: {change:+d}B")
+
+
+def _print_png_report(icons: List[Dict[str, Any]]) -> None:
+    """Compare each stored PNG against Pillow's plain encoding of the same tile."""
+    print("PNG sizes (pillow -> stored):")
+    before_total = after_total = 0
+    for icon in icons:
+        if icon["png_sym"] != f"icon_{icon['name']}_png":
+            continue
+        before = icon["png_plain"]
+        after = len(icon["png"])
+        before_total += before
+        after_total += after
+        print(f"  {icon['name']}: {before}B -> {after}B ({before - after}B saved, {describe_png(icon['png'])})")
+    print(f"  total: {before_total}B -> {after_total}B ({before_total - after_total}B saved)")
+
+
+def _harness_expected(icons: List[Dict[str, Any]]) -> List[Tuple[str, bytes, bytes]]:
+    """What the host harness checks the compiled registry against, in registry order."""
+    return [(icon["name"], icon["bmp"], icon["png"]) for icon in icons]
+
+
+def _print_host_bench(cpp_path: str, header_path: str, icons: List[Dict[str, Any]], extra_files: List[str], json_path: Optional[str] = None) -> None:
+    with tempfile.TemporaryDirectory(prefix="icons_harness_") as work_dir:
+        result = build_and_run(work_dir, cpp_path, header_path, _harness_expected(icons), extra_files=extra_files)
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+            f.write("\n")
+    _require(not result["failures"], "Host harness checks failed:\n  " + "\n  ".join(result["failures"]))
+
+    by_name = {icon["name"]: icon for icon in icons}
+    groups: Dict[str, List[float]] = {}
+    fb_groups: Dict[str, List[float]] = {}
+    for r in result["icons"]:
+        icon = by_name[r["name"]]
+        if "bmp_delta" in icon:
+            kind = "delta"
+        elif icon.get("bmp_enc"):
+            kind = "packbits"
+        elif icon.get("bmp_xform", XFORM_NONE) != XFORM_NONE:
+            kind = "transformed"
+        else:
+            kind = "verbatim"
+        groups.setdefault(kind, []).append(r["blit_ns"])
+        fb_groups.setdefault(kind, []).append(r["fb_ns"])
+    n = len(result["icons"])
+    copy_ns = sum(r["copy_ns"] for r in result["icons"]) / n
+
+    formats = list(result["icons"][0]["formats"])
+    print(f"Host bench: {result['checks']} checks passed")
+    lookup = result["lookup"]
+    for label, key in (("findEmbeddedIcon (perfect hash)", "perfect_hash_ns"), ("findEmbeddedIcon miss", "miss_ns"), ("linear strcmp_P scan", "linear_ns"), ("getEmbeddedIcon(IconId)", "id_ns")):
+        ns = lookup[key]
+        print(f"  {label:<31}: {ns:8.1f} ns/lookup ({1e9 / ns if ns else 0:,.0f} lookups/s)")
+    print(f"  raw memcpy {copy_ns:.1f} ns/icon ({result['iterations']} iterations/icon)")
+    for kind in ("verbatim", "packbits", "delta", "transformed"):
+        if kind in groups:
+            avg = sum(groups[kind]) / len(groups[kind])
+            fb = sum(fb_groups[kind]) / len(fb_groups[kind])
+            print(f"  blit {kind:<11}: {avg:8.1f} ns/icon, draw into {result['framebuffer'][0]}x{result['framebuffer'][1]} framebuffer {fb:8.1f} ns/icon, over {len(groups[kind])} icon(s)")
+    for fmt in formats:
+        avg = sum(r["formats"][fmt] for r in result["icons"]) / n
+        print(f"  {fmt} layout fetch + copy: {avg:8.1f} ns/icon")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Generate icons_embedded.cpp from the icon sheet + manifest")
+    parser.add_argument("--no-cache", action="store_true", help="Re-encode every icon, ignoring the build cache")
+    parser.add_argument("--cache-dir", default=None, help="Build cache directory (default: icons/.icon_cache)")
+    parser.add_argument("--png-report", action="store_true", help="Print per-icon PNG sizes before/after the minimizer")
+    parser.add_argument("--host-bench", action="store_true", help="Compile the generated C++ on the host and time bitmap blits")
+    parser.add_argument("--host-bench-json", metavar="PATH", default=None, help="With --host-bench, also write the harness results as JSON")
+    parser.add_argument("--emit-harness", metavar="DIR", default=None, help="Write the host test harness (shim, sources, expected data, Makefile) to DIR for CI")
+    parser.add_argument("--jobs", "-j", type=int, default=1, help="Encode icons in N worker processes (0 = one per CPU, default: 1)")
+    parser.add_argument("--watch", action="store_true", help="Keep running and rebuild incrementally when the manifest or sheet changes")
+    parser.add_argument("--poll", type=float, default=0.1, help="--watch polling interval in seconds (default: 0.1)")
+    parser.add_argument("--usage-profile", metavar="PATH", default=None, help="JSON of icon name -> hits; hot icons go first in the registry and arrays (overrides usageProfile)")
+    parser.add_argument("--profile", action="store_true", help="Print wall time per pipeline stage and the slowest icons")
+    parser.add_argument("--cprofile", metavar="PATH", default=None, help="Run the build under cProfile and dump the stats to PATH")
+    parser.add_argument("--flash-report", nargs="?", const=True, default=None, metavar="PATH", help=f"Write per-icon flash usage as JSON (default: {FLASH_REPORT_NAME} next to icons_embedded.cpp) with the change since the previous report")
+    args = parser.parse_args(argv)
+    _require(args.jobs >= 0, "--jobs must be >= 0")
+    _require(args.poll > 0, "--poll must be > 0")
+
     repo_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
     icons_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 
+    if args.watch:
+        return _watch(args, repo_root, icons_root)
+
+    if args.cprofile:
+        profiler = cProfile.Profile()
+        try:
+            profiler.runcall(_build, args, repo_root, icons_root)
+        finally:
+            profiler.dump_stats(args.cprofile)
+        print(f"cProfile stats: {args.cprofile} (top functions by cumulative time:)")
+        pstats.Stats(args.cprofile).sort_stats("cumulative").print_stats(15)
+    else:
+        _build(args, repo_root, icons_root)
+    print("")
+    print("Next steps:")
+    print("  1) Build + flash firmware")
+    print("  2) Verify in browser:")
+    print("     - http://<device-ip>/icons/test")
+    print("     - http://<device-ip>/api/icon?name=folder")
+
+    return 0
+
+
+def _parse_options(manifest: Dict[str, Any]) -> Dict[str, Any]:
+    """Validated output options from the manifest's top-level keys."""
+    opts: Dict[str, Any] = {
+        "transformDedup": bool(manifest.get("transformDedup", False)),
+        "familyDelta": bool(manifest.get("familyDelta", "families" in manifest)),
+        "bitmapEncoding": str(manifest.get("bitmapEncoding", "raw")),
+        "pngMinimize": bool(manifest.get("pngMinimize", False)),
+        "output": str(manifest.get("output", "source")),
+        "shardBy": manifest.get("shardBy"),
+        "etags": bool(manifest.get("etags", True)),
+        "atlas": bool(manifest.get("atlas", False)),
+        "atlasUrl": str(manifest.get("atlasUrl", "/icons/atlas.png")),
+        "atlasPadding": int(manifest.get("atlasPadding", 1)),
+        "flashBudget": manifest.get("flashBudget"),
+        "usageProfile": manifest.get("usageProfile"),
+        "hotFirst": False,
+    }
+    _require(opts["flashBudget"] is None or (isinstance(opts["flashBudget"], int) and opts["flashBudget"] > 0), "flashBudget must be a positive number of bytes")
+    _require(opts["bitmapEncoding"] in ("raw", "packbits"), f"Unknown bitmapEncoding: {opts['bitmapEncoding']} (expected raw or packbits)")
+    formats = manifest.get("bitmapFormat", [])
+    formats = [formats] if isinstance(formats, str) else formats
+    _require(isinstance(formats, list) and all(f in BITMAP_FORMATS for f in formats), f"bitmapFormat must list formats from: {', '.join(BITMAP_FORMATS)}")
+    opts["bitmapFormats"] = list(dict.fromkeys(formats))
+    colors = manifest.get("colorFormat", [])
+    colors = [colors] if isinstance(colors, str) else colors
+    _require(isinstance(colors, list) and all(f in COLOR_FORMATS for f in colors), f"colorFormat must list formats from: {', '.join(COLOR_FORMATS)}")
+    opts["colorFormats"] = list(dict.fromkeys(colors))
+    opts["alphaMask"] = bool(manifest.get("alphaMask", False))
+    opts["rgb565ByteSwap"] = bool(manifest.get("rgb565ByteSwap", True))
+    background = manifest.get("colorBackground", [0, 0, 0])
+    _require(isinstance(background, list) and len(background) == 3 and all(isinstance(c, int) and 0 <= c <= 255 for c in background), "colorBackground must be [r, g, b] with 0..255 components")
+    opts["colorBackground"] = tuple(background)
+    _require(opts["output"] in ("source", "incbin", "file"), f"Unknown output mode: {opts['output']} (expected source, incbin or file)")
+    shard_by = opts["shardBy"]
+    _require(
+        shard_by is None or shard_by in ("row", "family") or (isinstance(shard_by, int) and not isinstance(shard_by, bool) and shard_by > 0),
+        "shardBy must be \"row\", \"family\" or a shard count",
+    )
+    _require(shard_by is None or opts["output"] == "source", "shardBy only applies to output \"source\" (blob modes have no payload arrays to split)")
+    if opts["output"] == "file":
+        _require(
+            not (_has_draw_helpers(opts) or opts["bitmapFormats"] or opts["colorFormats"] or opts["alphaMask"] or opts["atlas"]),
+            "output \"file\" only supports plain PNG + bitmap payloads (no draw helpers, bitmapFormat, colorFormat, alphaMask or atlas)",
+        )
+    return opts
+
+
+def _build(args: argparse.Namespace, repo_root: str, icons_root: str, memo: Optional[Dict[str, Any]] = None) -> List[str]:
+    """
+    Run one generation and return the input paths (manifest, sheet and
+    usage profile if any).
+
+    `memo` (watch mode) keeps the decoded sheet and per-tile results between
+    calls: a tile whose pixel region did not change since the previous call
+    reuses its PNG/bitmap without hashing or re-encoding.
+    """
+    jobs = args.jobs or os.cpu_count() or 1
+    timers = _Timers()
     manifest_path = os.path.join(icons_root, "iconsheet.json")
     _require(os.path.exists(manifest_path), f"Missing manifest: {manifest_path}")
 
@@ -130,18 +1626,51 @@ def main() -> int:
     tile_size = int(manifest.get("tileSize", 16))
     spacing = int(manifest.get("spacing", 1))
     threshold = int(manifest.get("threshold", 128))
+    opts = _parse_options(manifest)
     sheet_rel = manifest.get("sheet", "assets/iconsheet.png")
     sheet_path = os.path.join(icons_root, sheet_rel)
+    profile_path: Optional[str] = args.usage_profile or (os.path.join(icons_root, str(opts["usageProfile"])) if opts["usageProfile"] else None)
+    hits: Dict[str, int] = {}
+    if profile_path is not None:
+        _require(os.path.exists(profile_path), f"Missing usage profile: {profile_path}")
+        hits = _load_usage_profile(profile_path)
+        opts["hotFirst"] = True
 
     _require(os.path.exists(sheet_path), f"Missing sprite sheet image: {sheet_path}")
 
     icons_list = manifest.get("icons", [])
     _require(isinstance(icons_list, list) and len(icons_list) > 0, "Manifest has no icons[]")
 
-    sheet = Image.open(sheet_path)
+    timers.lap("manifest")
+    # One-shot builds read the sheet a band of rows at a time (see
+    # band_reader); watch mode keeps the whole decoded sheet to diff against.
+    reader = BandReader(sheet_path, full=memo is not None)
+
+    png_settings = dict(PNG_OPTIONS, minimize=MINIMIZE_VERSION if opts["pngMinimize"] else 0)
+    settings = {"tileSize": tile_size, "threshold": threshold, "png": png_settings}
+    cache: Optional[IconCache] = None
+    if not args.no_cache:
+        cache_dir = args.cache_dir or os.path.join(icons_root, ".icon_cache")
+        cache = IconCache(cache_dir, settings)
+
+    # Watch mode: diff the sheet against the previous build once; tiles are
+    # then checked against the changed-pixel mask by region.
+    reused: Dict[TileKey, Tuple[bytes, bytes]] = {}
+    changed_mask: Optional[Image.Image] = None
+    if memo is not None:
+        assert reader.image is not None
+        rgba = reader.image.convert("RGBA")
+        prev = memo.get("sheet")
+        state = dict(settings, mode=reader.mode)
+        if prev is not None and prev.size == rgba.size and memo.get("settings") == state:
+            reused = memo["tiles"]
+            changed_mask = functools.reduce(ImageChops.lighter, ImageChops.difference(prev, rgba).split())
+    timers.lap("decode")
 
     icons_out: List[Dict[str, Any]] = []
     seen = set()
+    # (x, y, source size, indices into icons_out) per manifest entry.
+    regions: List[Tuple[int, int, Tuple[int, int], List[int]]] = []
 
     for item in icons_list:
         _require(isinstance(item, dict), "icons[] entries must be objects")
@@ -160,34 +1689,293 @@ def main() -> int:
             step = tile_size + spacing
             x = col * step
             y = row * step
+        row = y // (tile_size + spacing)
+
+        # Explicit w/h: a native-size region, stored as-is. Otherwise a
+        # tileSize cell resized to the classic 32x32 OLED bitmap.
+        if "w" in item or "h" in item:
+            src = _parse_size([item.get("w", item.get("h")), item.get("h", item.get("w"))], f"{name}: w/h")
+            sizes = [src]
+        else:
+            src = (tile_size, tile_size)
+            sizes = [(32, 32)]
+        extra = item.get("sizes", [])
+        _require(isinstance(extra, list), f"{name}: sizes must be a list of N or [w, h]")
+        for value in extra:
+            size = _parse_size(value, f"{name}: sizes")
+            if size not in sizes:
+                sizes.append(size)
 
-        tile = _crop_tile(sheet, x, y, tile_size)
-        _require(tile.size == (tile_size, tile_size), f"Failed to crop tile for {name}")
+        members: List[int] = []
+        for k, (w, h) in enumerate(sizes):
+            # Additional sizes become their own registry entries, <name>_<w>x<h>.
+            entry = name if k == 0 else f"{name}_{w}x{h}"
+            _require(entry == name or entry not in seen, f"Duplicate icon name in manifest: {entry}")
+            seen.add(entry)
+            members.append(len(icons_out))
+            icons_out.append({"name": entry, "x": x, "y": y, "row": row, "src": src, "w": w, "h": h})
+        regions.append((x, y, src, members))
+    _check_enum_names([icon["name"] for icon in icons_out])
+    timers.lap("manifest")
 
-        png = _png_bytes(tile)
-        bmp = _bitmap_1bpp_32x32(tile, tile_size=tile_size, threshold=threshold)
+    # Walk the regions top to bottom so the reader only holds the rows under
+    # the current tile; pixels are released as soon as a tile is encoded.
+    pending: List[int] = []
+    tasks: List[EncodeTask] = []
+    parallel = jobs > 1
+    for x, y, src, members in sorted(regions, key=lambda r: (r[1], r[0])):
+        tile = reader.crop((x, y, x + src[0], y + src[1]))
+        _require(tile.size == src, f"Failed to crop tile for {icons_out[members[0]]['name']}")
+        timers.lap("decode")
+        mono: Optional[Image.Image] = None
+        for i in members:
+            icon = icons_out[i]
+            key = (x, y, src[0], src[1], icon["w"], icon["h"])
+            if args.png_report:
+                icon["png_plain"] = len(_png_bytes(tile))
+            if key in reused and changed_mask is not None and changed_mask.crop((x, y, x + src[0], y + src[1])).getbbox() is None:
+                icon["png"], icon["bmp"] = reused[key]
+                icon["reused"] = True
+                timers.lap("cache", icon["name"])
+                continue
+            if cache is not None:
+                icon["key"] = cache.key(tile, (icon["w"], icon["h"]))
+                cached = cache.get(icon["key"])
+                timers.lap("cache", icon["name"])
+                if cached is not None:
+                    icon["png"], icon["bmp"] = cached
+                    continue
+            pending.append(i)
+            if parallel:
+                tasks.append(_encode_task(tile, (icon["w"], icon["h"])))
+                continue
+            if mono is None:
+                mono = threshold_1bpp(tile, threshold)
+            icon["png"], icon["bmp"] = _encode_tile(tile, mono, (icon["w"], icon["h"]), opts["pngMinimize"])
+            timers.lap("encode", icon["name"])
+    reader.close()
+    timers.lap("decode")
 
-        icons_out.append({"name": name, "png": png, "bmp": bmp})
+    if parallel and tasks:
+        results = _encode_parallel(tasks, threshold, opts["pngMinimize"], min(jobs, len(tasks)))
+        for i, (png, bmp) in zip(pending, results):
+            icons_out[i]["png"], icons_out[i]["bmp"] = png, bmp
+        timers.lap("encode")
+    if cache is not None:
+        for i in pending:
+            icon = icons_out[i]
+            cache.put(icon["key"], icon["png"], icon["bmp"])
+        timers.lap("cache")
+    if memo is not None:
+        # Stored together so a failed build never pairs a new sheet with old tiles.
+        memo["sheet"], memo["settings"] = rgba, state
+        memo["tiles"] = {(i["x"], i["y"], i["src"][0], i["src"][1], i["w"], i["h"]): (i["png"], i["bmp"]) for i in icons_out}
+        memo["changed"] = [i["name"] for i in icons_out if not i.get("reused")]
+        memo["encoded"] = [icons_out[k]["name"] for k in pending]
 
-    cpp = _generate_cpp(icons_out)
+    if opts["hotFirst"]:
+        # Registry, IconId and payload order all follow; shared arrays are
+        # owned by their hottest user.
+        icons_out = _order_by_usage(icons_out, hits)
+        timers.lap("usage_order")
+    saved = _dedup_payloads(icons_out, transforms=opts["transformDedup"])
+    timers.lap("dedup")
+    delta_report = _delta_encode_families(icons_out, manifest.get("families")) if opts["familyDelta"] else None
+    timers.lap("family_delta")
+    packed_saved = _encode_bitmaps(icons_out, opts["bitmapEncoding"])
+    timers.lap("bitmap_encoding")
+    format_bytes = _build_formats(icons_out, _format_array_list(opts))
+    format_bytes.update(_build_color_formats(icons_out, opts))
+    timers.lap("formats")
+    atlas = _build_atlas(icons_out, opts, memo.setdefault("atlas", {}) if memo is not None else None) if opts["atlas"] else None
+    timers.lap("atlas")
+
+    names = [i["name"] for i in icons_out]
+    ph = build_perfect_hash([n.encode("ascii") for n in names])
+    _verify_lookup(ph, names)
+    timers.lap("perfect_hash")
+
+    # Checked before any output is written, so an over-budget build leaves
+    # the previous (in-budget) sources and flash report in place; the next
+    # build's "vs previous build" then compares against the last good one.
+    report: Optional[Dict[str, Any]] = None
+    if args.flash_report or opts["flashBudget"] is not None:
+        report = _flash_report(icons_out, opts, ph, atlas)
+        budget = opts["flashBudget"]
+        if budget is not None:
+            total = report["totals"]["total"]
+            _require(total <= budget, f"Icons need ~{total}B of flash, {total - budget}B over flashBudget ({budget}B); largest: {', '.join(report['largest'][:5])}")
+        if args.flash_report:
+            report_path = os.path.join(repo_root, FLASH_REPORT_NAME) if args.flash_report is True else args.flash_report
+            if os.path.exists(report_path):
+                with open(report_path, "r", encoding="utf-8") as f:
+                    report["delta"] = _flash_delta(report, json.load(f))
+            with open(report_path, "w", encoding="utf-8") as f:
+                json.dump(dict(report, budget=opts["flashBudget"]), f, indent=2)
+                f.write("\n")
+            print(f"Flash report: {report_path}")
+        timers.lap("flash_report")
 
     out_cpp_path = os.path.join(repo_root, "icons_embedded.cpp")
-    with open(out_cpp_path, "w", encoding="utf-8") as f:
-        f.write(cpp)
+    blob_path: Optional[str] = None
+    if opts["output"] != "source":
+        default_blob = "icons_embedded.bin" if opts["output"] == "incbin" else os.path.join("data", "icons_embedded.bin")
+        blob_path = os.path.join(repo_root, str(manifest.get("blobPath", default_blob)))
+        opts["blobName"] = os.path.basename(blob_path)
+        opts["blob"] = PayloadBlob()
+    # Outputs are only rewritten when their bytes change (keeps mtimes for incremental builds).
+    changed: List[str] = []
+    with _write_if_changed(out_cpp_path, changed) as f:
+        _write_cpp(f, icons_out, ph, opts, atlas)
+    if blob_path is not None:
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        with _write_if_changed(blob_path, changed, binary=True) as f:
+            f.write(opts["blob"].data)
+
+    shard_paths: List[str] = []
+    if opts["shardBy"]:
+        keys = _shard_keys(icons_out, opts["shardBy"], manifest.get("families"))
+        shards: Dict[str, List[Dict[str, Any]]] = {}
+        for icon in icons_out:
+            shards.setdefault(keys[icon["name"]], []).append(icon)
+        for key, members in shards.items():
+            path = os.path.join(repo_root, f"{SHARD_PREFIX}{key}.cpp")
+            with _write_if_changed(path, changed) as f:
+                _write_shard(f, key, members, opts)
+            shard_paths.append(path)
+    stale = _remove_stale_shards(repo_root, shard_paths)
 
-    total_png = sum(len(i["png"]) for i in icons_out)
-    total_bmp = 128 * len(icons_out)
+    out_h_path = os.path.join(repo_root, GEN_HEADER_NAME)
+    with _write_if_changed(out_h_path, changed) as f:
+        _write_gen_header(f, icons_out, opts, atlas)
+    timers.lap("emit")
 
-    print(f"Generated: {out_cpp_path}")
+    total_png = sum(len(i["png"]) for i in icons_out) - saved["png"]
+    total_bmp = sum(len(i["bmp"]) for i in icons_out) - saved["bmp"]
+    if delta_report is not None:
+        total_bmp -= delta_report["saved"]
+    total_bmp -= packed_saved
+
+    for path in [out_cpp_path, out_h_path] + ([blob_path] if blob_path is not None else []):
+        print(f"{'Generated' if path in changed else 'Unchanged'}: {path}")
+    if blob_path is not None:
+        print(f"Blob: {len(opts['blob'])} bytes, {len(opts['blob'].entries)} payloads")
+    if shard_paths:
+        rewritten = sum(1 for p in shard_paths if p in changed)
+        print(f"Shards ({opts['shardBy']}): {len(shard_paths)} file(s), {rewritten} rewritten, {len(shard_paths) - rewritten} unchanged")
+    for path in stale:
+        print(f"Removed stale shard: {path}")
     print(f"Icons: {len(icons_out)}")
+    if opts["hotFirst"]:
+        hot = [i["name"] for i in icons_out if hits.get(i["name"], 0) > 0]
+        unknown = sorted(set(hits) - set(names))
+        listed = f"{', '.join(hot[:8])}{', ...' if len(hot) > 8 else ''}"
+        if opts["shardBy"]:
+            print(f"Usage profile: {len(hot)} hot icon(s) first in the registry and IconId ({listed}); arrays stay in their shard files, not regrouped")
+        elif opts["output"] == "source":
+            print(f"Usage profile: {len(hot)} hot icon(s) first ({listed}), drawing arrays in section EMBEDDED_ICONS_HOT_SECTION, PNGs grouped after the bitmaps")
+        else:
+            print(f"Usage profile: {len(hot)} hot icon(s) first ({listed}), blob payloads ordered hottest first, PNGs after the bitmaps")
+        if unknown:
+            print(f"  ignored {len(unknown)} name(s) not in the manifest: {', '.join(unknown[:8])}{', ...' if len(unknown) > 8 else ''}")
     print(f"Approx flash usage: png={total_png}B + bmp={total_bmp}B + registry")
-    print("")
-    print("Next steps:")
-    print("  1) Build + flash firmware")
-    print("  2) Verify in browser:")
-    print("     - http://<device-ip>/icons/test")
-    print("     - http://<device-ip>/api/icon?name=folder")
+    if saved["png"] or saved["bmp"]:
+        print(f"Dedup: saved {saved['png'] + saved['bmp']}B (png={saved['png']}B, bmp={saved['bmp']}B) via shared arrays")
+    if opts["transformDedup"]:
+        transformed = [i for i in icons_out if i["bmp_xform"] != XFORM_NONE]
+        reclaimed = sum(len(i["bmp"]) for i in transformed) - len(icons_out)
+        print(f"Transforms: {len(transformed)} bitmap(s) stored as rotations/mirrors, reclaimed {reclaimed}B net of the {len(icons_out)}B transform table")
+        for i in transformed:
+            print(f"  {i['name']} = {XFORM_NAMES[i['bmp_xform']]}({i['bmp_sym']})")
+    if delta_report is not None:
+        table = 2 * (len(icons_out) + 1)
+        print(f"Family deltas: {delta_report['icons']} bitmap(s) in {delta_report['families']} family(ies) stored as XOR deltas, reclaimed {delta_report['saved'] - table}B net of the {table}B offset table")
+    if opts["bitmapEncoding"] != "raw":
+        packed = sum(1 for i in icons_out if "bmp_stored" in i)
+        print(f"Bitmap encoding ({opts['bitmapEncoding']}): {packed} array(s) compressed, reclaimed {packed_saved - len(icons_out)}B net of the {len(icons_out)}B encoding table")
+    if format_bytes:
+        print("Extra formats: " + ", ".join(f"{fmt}=+{n}B" for fmt, n in format_bytes.items()))
+    if atlas is not None:
+        # /icons/test-style page: one request per icon vs. atlas + offset map.
+        per_icon = sum(len(i["png"]) for i in icons_out) + HTTP_OVERHEAD_BYTES * len(icons_out)
+        atlas_total = len(atlas["png"]) + len(atlas["css"]) + 2 * HTTP_OVERHEAD_BYTES
+        atlas_flash = len(atlas["png"]) + len(atlas["css"]) + len(atlas["json"])
+        print(f"Atlas: {atlas['size'][0]}x{atlas['size'][1]} PNG {len(atlas['png'])}B + CSS {len(atlas['css'])}B + JSON {len(atlas['json'])}B (+{atlas_flash}B flash)")
+        print(f"  web UI page (est. {HTTP_OVERHEAD_BYTES}B headers/request): {len(icons_out)} requests / {per_icon}B -> 2 requests / {atlas_total}B")
+    if report is not None:
+        _print_flash_report(report, opts["flashBudget"])
+    if args.png_report:
+        _print_png_report(icons_out)
+    if args.host_bench:
+        _require(opts["output"] != "file", "--host-bench needs the payloads linked in (output source or incbin)")
+        _print_host_bench(out_cpp_path, out_h_path, icons_out, ([blob_path] if blob_path else []) + shard_paths, args.host_bench_json)
+    if args.emit_harness:
+        _require(opts["output"] != "file", "--emit-harness needs the payloads linked in (output source or incbin)")
+        write_harness(args.emit_harness, out_cpp_path, out_h_path, _harness_expected(icons_out), ([blob_path] if blob_path else []) + shard_paths)
+        print(f"Host harness: {args.emit_harness} (make -C {args.emit_harness} run)")
+    if cache is not None:
+        # Tiles reused from memory never touch the cache, so leave eviction
+        # to the next one-shot run.
+        evicted = cache.evict_unused() if memo is None else 0
+        print(f"Cache: {cache.hits} hit(s), {cache.misses} miss(es), {evicted} stale evicted")
+    if args.profile:
+        timers.lap("report")
+        _print_profile(timers, jobs)
+
+    return [manifest_path, sheet_path] + ([profile_path] if profile_path is not None else [])
+
 
+def _input_stamp(paths: List[str]) -> Tuple[Optional[Tuple[int, int]], ...]:
+    stamp: List[Optional[Tuple[int, int]]] = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            stamp.append(None)
+            continue
+        stamp.append((st.st_mtime_ns, st.st_size))
+    return tuple(stamp)
+
+
+def _watch(args: argparse.Namespace, repo_root: str, icons_root: str) -> int:
+    """
+    Rebuild whenever the manifest or sheet changes, keeping decoded state in
+    memory between builds. Inputs are polled (mtime + size); a change is
+    acted on once it reads the same on two consecutive polls, so a
+    half-written file from an editor save isn't picked up.
+    """
+    memo: Dict[str, Any] = {}
+    paths = [os.path.join(icons_root, "iconsheet.json")]
+    built: Optional[Tuple[Optional[Tuple[int, int]], ...]] = None
+    last = _input_stamp(paths)
+    first = True
+    try:
+        while True:
+            stamp = _input_stamp(paths)
+            if first or (stamp != built and stamp == last):
+                initial, first = first, False
+                start = time.perf_counter()
+                try:
+                    new_paths = _build(args, repo_root, icons_root, memo)
+                except Exception as e:
+                    print(f"ERROR: {e}")
+                else:
+                    ms = (time.perf_counter() - start) * 1000
+                    changed = memo["changed"]
+                    shown = ", ".join(changed[:8]) + (", ..." if len(changed) > 8 else "")
+                    if initial:
+                        print(f"Built in {ms:.0f} ms: {len(memo['tiles'])} tile(s), {len(memo['encoded'])} encoded")
+                    else:
+                        print(f"Rebuilt in {ms:.0f} ms: {len(changed)} tile(s) changed" + (f" ({shown})" if changed else "") + f", {len(memo['encoded'])} re-encoded")
+                    if new_paths != paths:
+                        paths = new_paths
+                        stamp = _input_stamp(paths)
+                built = stamp
+                print(f"Watching {', '.join(paths)} (Ctrl-C to stop)")
+            last = stamp
+            time.sleep(args.poll)
+    except KeyboardInterrupt:
+        print("")
     return 0
 
 
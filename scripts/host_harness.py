@@ -0,0 +1,510 @@
+"""
+Host-compiled harness for the generated icon C++.
+
+Copies icons_embedded.cpp / icons_embedded_gen.h into a scratch directory
+next to a PROGMEM/pgmspace shim (which stands in for the firmware's
+icons_embedded.h), compiles everything with the host C++ compiler and runs
+checks and micro-benchmarks: every name resolves through findEmbeddedIcon()
+(near-misses don't), names copy out with strcpy_P, PNGs, blits, framebuffer
+draws and bitmapFormat layouts match the expected pixels, ETags match. It
+then times lookups (perfect hash, linear strcmp_P scan, IconId), blits,
+framebuffer draws and format copies, and prints one JSON object on stdout.
+
+run_lookup() compiles just the emitted findEmbeddedIcon() against a
+names-only registry (used by icons/tests/test_lookup.py).
+"""
+
+import json
+import os
+import shutil
+import struct
+import subprocess
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+
+SHIM_HEADER = r"""#pragma once
+// Host shim for icons_embedded.h: flat address space, PROGMEM is a no-op.
+#include <stddef.h>
+#include <stdint.h>
+#include <string.h>
+
+#define PROGMEM
+#define PGM_P const char*
+#define pgm_read_byte(p) (*(const uint8_t*)(p))
+#define pgm_read_word(p) (*(const uint16_t*)(p))
+#define pgm_read_dword(p) (*(const uint32_t*)(p))
+#define pgm_read_ptr(p) (*(const void* const*)(p))
+#define memcpy_P memcpy
+#define strcmp_P strcmp
+#define strcpy_P strcpy
+
+struct EmbeddedIcon {
+  const char* name;
+  const uint8_t* png;
+  size_t pngSize;
+  const uint8_t* bitmap;
+  uint16_t w;
+  uint16_t h;
+};
+
+extern const EmbeddedIcon EMBEDDED_ICONS[];
+extern const size_t EMBEDDED_ICONS_COUNT;
+const EmbeddedIcon* findEmbeddedIcon(const char* name);
+"""
+
+HARNESS_MAIN = r"""#include <chrono>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string>
+#include <vector>
+
+#include "icons_embedded.h"
+#include "icons_embedded_gen.h"
+
+#if defined(EMBEDDED_ICONS_HAVE_DRAW_HELPERS)
+#define HARNESS_BLIT(icon, out) blitEmbeddedIcon(icon, out)
+#else
+#define HARNESS_BLIT(icon, out) memcpy_P(out, (icon)->bitmap, (((icon)->w + 7) / 8) * (icon)->h)
+#endif
+
+// Simulated 1bpp framebuffer: row-major, LSB = leftmost pixel (the
+// drawEmbeddedIcon() layout), at least a 128x64 OLED.
+static uint16_t g_fbW = 128;
+static uint16_t g_fbH = 64;
+static uint8_t g_fb[1 << 16];
+static uint8_t g_buf[1 << 16];
+static volatile uintptr_t g_sink;
+
+struct Expected {
+  std::string name;
+  std::vector<uint8_t> bitmap;  // upright, row-major, LSB first
+  std::vector<uint8_t> png;
+};
+
+static std::vector<Expected> g_expected;
+static std::vector<std::string> g_failures;
+static long g_checks = 0;
+
+static void check(bool ok, const std::string& what) {
+  g_checks++;
+  if (!ok && g_failures.size() < 20) {
+    g_failures.push_back(what);
+  }
+}
+
+static uint32_t readU32(FILE* f) {
+  uint8_t b[4] = {0, 0, 0, 0};
+  if (fread(b, 1, 4, f) != 4) {
+    fprintf(stderr, "truncated expected-data file\n");
+    exit(2);
+  }
+  return b[0] | (b[1] << 8) | (b[2] << 16) | ((uint32_t)b[3] << 24);
+}
+
+static void readBytes(FILE* f, uint32_t n, std::vector<uint8_t>* out) {
+  out->resize(n);
+  if (n && fread(out->data(), 1, n, f) != n) {
+    fprintf(stderr, "truncated expected-data file\n");
+    exit(2);
+  }
+}
+
+static bool loadExpected(const char* path) {
+  FILE* f = fopen(path, "rb");
+  if (f == nullptr) {
+    return false;
+  }
+  uint32_t count = readU32(f);
+  g_expected.resize(count);
+  for (uint32_t i = 0; i < count; i++) {
+    std::vector<uint8_t> name;
+    readBytes(f, readU32(f), &name);
+    g_expected[i].name.assign(name.begin(), name.end());
+    readBytes(f, readU32(f), &g_expected[i].bitmap);
+    readBytes(f, readU32(f), &g_expected[i].png);
+  }
+  fclose(f);
+  return true;
+}
+
+static bool rawPixel(const std::vector<uint8_t>& bmp, uint16_t w, uint16_t x, uint16_t y) {
+  return (bmp[y * ((w + 7) / 8) + x / 8] >> (x & 7)) & 1;
+}
+
+static void harnessDraw(const EmbeddedIcon* icon, int16_t x, int16_t y) {
+#if defined(EMBEDDED_ICONS_HAVE_DRAW_HELPERS)
+  drawEmbeddedIcon(icon, g_fb, g_fbW, g_fbH, x, y);
+#else
+  // Plain bitmaps: the same shifted-OR loop drawEmbeddedIcon() uses.
+  uint16_t w = icon->w, h = icon->h;
+  size_t stride = (w + 7) / 8, fbStride = (g_fbW + 7) / 8;
+  const uint8_t* src = (const uint8_t*)pgm_read_ptr(&icon->bitmap);
+  for (uint16_t row = 0; row < h; row++) {
+    int32_t py = y + row;
+    if (py < 0 || py >= g_fbH) {
+      continue;
+    }
+    for (size_t col = 0; col < stride; col++) {
+      uint8_t b = pgm_read_byte(&src[row * stride + col]);
+      if (b == 0) {
+        continue;
+      }
+      int32_t px0 = x + (int32_t)col * 8;
+      if (px0 < 0 || px0 + 8 > g_fbW) {
+        for (uint8_t bit = 0; bit < 8; bit++) {
+          int32_t px = px0 + bit;
+          if ((b >> bit) & 1 && px >= 0 && px < g_fbW) {
+            g_fb[py * fbStride + px / 8] |= (uint8_t)(1 << (px & 7));
+          }
+        }
+        continue;
+      }
+      uint8_t* dst = &g_fb[py * fbStride + px0 / 8];
+      uint8_t sh = px0 & 7;
+      dst[0] |= (uint8_t)(b << sh);
+      if (sh) {
+        dst[1] |= (uint8_t)(b >> (8 - sh));
+      }
+    }
+  }
+#endif
+}
+
+static const EmbeddedIcon* linearFind(const char* name) {
+  for (size_t i = 0; i < EMBEDDED_ICONS_COUNT; i++) {
+    if (strcmp_P(name, (PGM_P)pgm_read_ptr(&EMBEDDED_ICONS[i].name)) == 0) {
+      return &EMBEDDED_ICONS[i];
+    }
+  }
+  return nullptr;
+}
+
+template <typename F>
+static double nsPerOp(long iters, F f) {
+  auto t0 = std::chrono::steady_clock::now();
+  for (long n = 0; n < iters; n++) {
+    f(n);
+  }
+  auto t1 = std::chrono::steady_clock::now();
+  return std::chrono::duration<double, std::nano>(t1 - t0).count() / iters;
+}
+
+// Extra bitmap layouts in the build (bitmapFormat).
+#if defined(EMBEDDED_ICONS_HAVE_FORMAT_XBM) || defined(EMBEDDED_ICONS_HAVE_FORMAT_GFX) || defined(EMBEDDED_ICONS_HAVE_FORMAT_SSD1306)
+#define HARNESS_FORMATS 1
+#endif
+
+struct Format {
+  const char* name;
+  uint8_t id;
+  int pageMajor;  // ssd1306
+  int msbFirst;   // gfx
+};
+static const Format kFormats[] = {
+#if defined(EMBEDDED_ICONS_HAVE_FORMAT_XBM)
+    {"xbm", (uint8_t)IconBitmapFormat::Xbm, 0, 0},
+#endif
+#if defined(EMBEDDED_ICONS_HAVE_FORMAT_GFX)
+    {"gfx", (uint8_t)IconBitmapFormat::Gfx, 0, 1},
+#endif
+#if defined(EMBEDDED_ICONS_HAVE_FORMAT_SSD1306)
+    {"ssd1306", (uint8_t)IconBitmapFormat::Ssd1306, 1, 0},
+#endif
+    {nullptr, 0, 0, 0},
+};
+
+#if defined(HARNESS_FORMATS)
+static size_t formatBytes(const Format& f, uint16_t w, uint16_t h) {
+  return f.pageMajor ? (size_t)w * ((h + 7) / 8) : (size_t)((w + 7) / 8) * h;
+}
+
+static bool formatPixel(const Format& f, const uint8_t* data, uint16_t w, uint16_t x, uint16_t y) {
+  if (f.pageMajor) {
+    return (pgm_read_byte(&data[(y / 8) * w + x]) >> (y & 7)) & 1;
+  }
+  uint8_t b = pgm_read_byte(&data[y * ((w + 7) / 8) + x / 8]);
+  return (b >> (f.msbFirst ? 7 - (x & 7) : (x & 7))) & 1;
+}
+#endif
+
+static void checkIcon(size_t i) {
+  const EmbeddedIcon* icon = &EMBEDDED_ICONS[i];
+  const Expected& e = g_expected[i];
+  const std::string& n = e.name;
+  char name[256];
+  strcpy_P(name, (PGM_P)pgm_read_ptr(&icon->name));
+  check(n == name, "registry[" + std::to_string(i) + "] name is '" + name + "', expected '" + n + "'");
+  check(findEmbeddedIcon(n.c_str()) == icon, "findEmbeddedIcon('" + n + "') does not return its registry entry");
+  check(getEmbeddedIcon((IconId)i) == icon, "getEmbeddedIcon(IconId) mismatch for " + n);
+  check(findEmbeddedIcon((n + "_").c_str()) == nullptr && findEmbeddedIcon(("x" + n).c_str()) == nullptr, "findEmbeddedIcon matched a near-miss of " + n);
+
+  uint16_t w = icon->w, h = icon->h;
+  size_t stride = (w + 7) / 8;
+  check(e.bitmap.size() == stride * h, n + ": registry size " + std::to_string(w) + "x" + std::to_string(h) + " does not match the bitmap");
+  if (e.bitmap.size() != stride * h) {
+    return;
+  }
+  const uint8_t* png = (const uint8_t*)pgm_read_ptr(&icon->png);
+  check(icon->pngSize == e.png.size() && png != nullptr && memcmp(png, e.png.data(), e.png.size()) == 0, n + ": PNG payload differs");
+
+  memset(g_buf, 0, stride * h);
+  HARNESS_BLIT(icon, g_buf);
+  check(memcmp(g_buf, e.bitmap.data(), stride * h) == 0, n + ": blitted bitmap differs");
+
+  // Unaligned draw into the framebuffer, then compare every icon pixel.
+  memset(g_fb, 0, (size_t)((g_fbW + 7) / 8) * g_fbH);
+  harnessDraw(icon, 3, 5);
+  bool same = true;
+  for (uint16_t y = 0; y < h && same; y++) {
+    for (uint16_t x = 0; x < w && same; x++) {
+      int px = x + 3, py = y + 5;
+      if (px < g_fbW && py < g_fbH) {
+        same = (((g_fb[py * ((g_fbW + 7) / 8) + px / 8] >> (px & 7)) & 1) != 0) == rawPixel(e.bitmap, w, x, y);
+      }
+    }
+  }
+  check(same, n + ": framebuffer draw differs");
+
+#if defined(HARNESS_FORMATS)
+  for (const Format* f = kFormats; f->name; f++) {
+    const uint8_t* data = getEmbeddedIconBitmap(icon, (IconBitmapFormat)f->id);
+    bool ok = data != nullptr;
+    for (uint16_t y = 0; y < h && ok; y++) {
+      for (uint16_t x = 0; x < w && ok; x++) {
+        ok = formatPixel(*f, data, w, x, y) == rawPixel(e.bitmap, w, x, y);
+      }
+    }
+    check(ok, n + ": " + f->name + " layout differs");
+  }
+#endif
+
+#if defined(EMBEDDED_ICONS_HAVE_ETAGS)
+  PGM_P etag = getEmbeddedIconEtag(icon);
+  check(etag != nullptr && strlen(etag) == EMBEDDED_ICON_ETAG_LEN, n + ": missing ETag");
+  if (etag != nullptr) {
+    std::string weak = std::string("\"0\", W/") + etag;
+    check(embeddedIconEtagMatches(etag, etag) && embeddedIconEtagMatches(etag, weak.c_str()) && embeddedIconEtagMatches(etag, "*"), n + ": ETag does not match itself");
+    check(!embeddedIconEtagMatches(etag, "\"0\""), n + ": ETag matches a different tag");
+  }
+#endif
+}
+
+int main(int argc, char** argv) {
+  long iters = argc > 1 ? atol(argv[1]) : 20000;
+  if (argc < 3 || !loadExpected(argv[2])) {
+    fprintf(stderr, "usage: %s ITERATIONS EXPECTED_DATA\n", argv[0]);
+    return 2;
+  }
+  if (g_expected.size() != EMBEDDED_ICONS_COUNT) {
+    fprintf(stderr, "expected data has %zu icons, registry has %zu\n", g_expected.size(), (size_t)EMBEDDED_ICONS_COUNT);
+    return 2;
+  }
+  for (size_t i = 0; i < EMBEDDED_ICONS_COUNT; i++) {
+    // Every icon must fit the framebuffer at the (3, 5) test offset.
+    if (EMBEDDED_ICONS[i].w + 11 > g_fbW) {
+      g_fbW = (uint16_t)((EMBEDDED_ICONS[i].w + 11 + 7) / 8 * 8);
+    }
+    if (EMBEDDED_ICONS[i].h + 5 > g_fbH) {
+      g_fbH = EMBEDDED_ICONS[i].h + 5;
+    }
+  }
+  if ((size_t)((g_fbW + 7) / 8) * g_fbH > sizeof(g_fb)) {
+    fprintf(stderr, "icons too large for the simulated framebuffer\n");
+    return 2;
+  }
+  check(findEmbeddedIcon("") == nullptr && findEmbeddedIcon(nullptr) == nullptr, "findEmbeddedIcon accepts an empty or null name");
+  for (size_t i = 0; i < EMBEDDED_ICONS_COUNT; i++) {
+    checkIcon(i);
+  }
+
+  std::vector<std::string> misses;
+  for (const Expected& e : g_expected) {
+    misses.push_back(e.name + "_");
+  }
+  size_t count = EMBEDDED_ICONS_COUNT;
+  long lookups = iters * 10;
+  double hashNs = nsPerOp(lookups, [&](long n) { g_sink = (uintptr_t)findEmbeddedIcon(g_expected[n % count].name.c_str()); });
+  double missNs = nsPerOp(lookups, [&](long n) { g_sink = (uintptr_t)findEmbeddedIcon(misses[n % count].c_str()); });
+  double linearNs = nsPerOp(lookups, [&](long n) { g_sink = (uintptr_t)linearFind(g_expected[n % count].name.c_str()); });
+  double idNs = nsPerOp(lookups, [&](long n) { g_sink = (uintptr_t)getEmbeddedIcon((IconId)(n % count)); });
+
+  printf("{\"iterations\": %ld, \"checks\": %ld, \"failures\": [", iters, g_checks);
+  for (size_t i = 0; i < g_failures.size(); i++) {
+    printf("%s\"%s\"", i ? ", " : "", g_failures[i].c_str());
+  }
+  printf("], \"framebuffer\": [%u, %u], ", g_fbW, g_fbH);
+  printf("\"lookup\": {\"perfect_hash_ns\": %.2f, \"miss_ns\": %.2f, \"linear_ns\": %.2f, \"id_ns\": %.2f}, \"icons\": [", hashNs, missNs, linearNs, idNs);
+  for (size_t i = 0; i < EMBEDDED_ICONS_COUNT; i++) {
+    const EmbeddedIcon* icon = &EMBEDDED_ICONS[i];
+    size_t bytes = ((icon->w + 7) / 8) * icon->h;
+    double copyNs = nsPerOp(iters, [&](long) {
+      memcpy_P(g_buf, icon->bitmap, bytes);
+      g_sink = g_buf[0];
+    });
+    double blitNs = nsPerOp(iters, [&](long) {
+      HARNESS_BLIT(icon, g_buf);
+      g_sink = g_buf[0];
+    });
+    double fbNs = nsPerOp(iters, [&](long n) {
+      harnessDraw(icon, (int16_t)(n & 7), 0);
+      g_sink = g_fb[0];
+    });
+    printf("%s{\"name\": \"%s\", \"copy_ns\": %.2f, \"blit_ns\": %.2f, \"fb_ns\": %.2f, \"formats\": {", i ? ", " : "", icon->name, copyNs, blitNs, fbNs);
+#if defined(HARNESS_FORMATS)
+    for (const Format* f = kFormats; f->name; f++) {
+      size_t n = formatBytes(*f, icon->w, icon->h);
+      double ns = nsPerOp(iters, [&](long) {
+        memcpy_P(g_buf, getEmbeddedIconBitmap(icon, (IconBitmapFormat)f->id), n);
+        g_sink = g_buf[0];
+      });
+      printf("%s\"%s\": %.2f", f == kFormats ? "" : ", ", f->name, ns);
+    }
+#endif
+    printf("}}");
+  }
+  printf("]}\n");
+  return g_failures.empty() ? 0 : 1;
+}
+"""
+
+
+def find_compiler() -> Optional[str]:
+    for cxx in (os.environ.get("CXX"), "g++", "clang++"):
+        if cxx and shutil.which(cxx):
+            return cxx
+    return None
+
+
+MAKEFILE = """# Host build of the generated icon C++ (see icons/scripts/host_harness.py).
+# `make run` checks lookups, payloads and blits, then prints benchmark JSON;
+# it exits non-zero when a check fails.
+CXX ?= g++
+CXXFLAGS ?= -std=c++11 -O2 -Wall
+ITERATIONS ?= 20000
+SOURCES = {sources}
+
+icons_harness: $(SOURCES) icons_embedded.h icons_embedded_gen.h
+\t$(CXX) $(CXXFLAGS) -I. -o $@ $(SOURCES)
+
+run: icons_harness
+\t./icons_harness $(ITERATIONS) harness_expected.bin
+
+.PHONY: run
+"""
+
+EXPECTED_NAME = "harness_expected.bin"
+
+
+def _write_expected(path: str, expected: Sequence[Tuple[str, bytes, bytes]]) -> None:
+    """(name, upright 1bpp bitmap, PNG) per registry entry, length-prefixed, little-endian."""
+    with open(path, "wb") as f:
+        f.write(struct.pack("<I", len(expected)))
+        for name, bitmap, png in expected:
+            for data in (name.encode("ascii"), bitmap, png):
+                f.write(struct.pack("<I", len(data)))
+                f.write(data)
+
+
+def write_harness(work_dir: str, cpp_path: str, header_path: str, expected: Sequence[Tuple[str, bytes, bytes]], extra_files: Sequence[str] = ()) -> List[str]:
+    """
+    Harness sources, the generated files, the expected registry contents and
+    a Makefile in `work_dir`; returns the sources to compile.
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    with open(os.path.join(work_dir, "icons_embedded.h"), "w", encoding="utf-8") as f:
+        f.write(SHIM_HEADER)
+    with open(os.path.join(work_dir, "harness_main.cpp"), "w", encoding="utf-8") as f:
+        f.write(HARNESS_MAIN)
+    shutil.copyfile(cpp_path, os.path.join(work_dir, "icons_embedded.cpp"))
+    shutil.copyfile(header_path, os.path.join(work_dir, os.path.basename(header_path)))
+    _write_expected(os.path.join(work_dir, EXPECTED_NAME), expected)
+    sources = ["harness_main.cpp", "icons_embedded.cpp"]
+    for path in extra_files:
+        # Payload shards (compiled too) or the .incbin blob, resolved relative to the compiler's cwd
+        shutil.copyfile(path, os.path.join(work_dir, os.path.basename(path)))
+        if path.endswith(".cpp"):
+            sources.append(os.path.basename(path))
+    with open(os.path.join(work_dir, "Makefile"), "w", encoding="utf-8") as f:
+        f.write(MAKEFILE.format(sources=" ".join(sources)))
+    return sources
+
+
+def build_and_run(work_dir: str, cpp_path: str, header_path: str, expected: Sequence[Tuple[str, bytes, bytes]], iterations: int = 20000, extra_files: Sequence[str] = ()) -> Dict[str, Any]:
+    """
+    Compile and run the harness. The result carries "failures" (empty when
+    every check passed) alongside the timings.
+    """
+    cxx = find_compiler()
+    if cxx is None:
+        raise RuntimeError("No host C++ compiler found (set CXX or install g++/clang++)")
+
+    sources = write_harness(work_dir, cpp_path, header_path, expected, extra_files)
+    exe = os.path.join(work_dir, "icons_harness")
+    subprocess.run([cxx, "-std=c++11", "-O2", "-Wall", "-I", work_dir, "-o", exe] + sources, check=True, cwd=work_dir)
+    result = subprocess.run([exe, str(iterations), EXPECTED_NAME], capture_output=True, text=True, cwd=work_dir)
+    if result.returncode not in (0, 1):
+        raise RuntimeError(f"Host harness failed ({result.returncode}): {result.stderr.strip()}")
+    return json.loads(result.stdout)
+
+
+LOOKUP_MAIN = r"""#include <stdio.h>
+#include <stdlib.h>
+#include "icons_embedded.h"
+
+// One probe name per line on stdin; prints the registry index
+// findEmbeddedIcon() returns for each, or -1 for nullptr.
+int main() {
+  size_t len = 0, cap = 4096;
+  char* buf = (char*)malloc(cap);
+  size_t n;
+  while ((n = fread(buf + len, 1, cap - len, stdin)) > 0) {
+    len += n;
+    if (len == cap) {
+      cap *= 2;
+      buf = (char*)realloc(buf, cap);
+    }
+  }
+  for (size_t start = 0; start < len;) {
+    char* end = (char*)memchr(buf + start, '\n', len - start);
+    if (end == nullptr) {
+      break;
+    }
+    *end = '\0';
+    const EmbeddedIcon* icon = findEmbeddedIcon(buf + start);
+    printf("%ld\n", icon ? (long)(icon - EMBEDDED_ICONS) : -1L);
+    start = (size_t)(end - buf) + 1;
+  }
+  free(buf);
+  return 0;
+}
+"""
+
+
+def run_lookup(work_dir: str, lookup_source: str, names: Sequence[str], probes: Sequence[str]) -> List[int]:
+    """
+    Compile the emitted findEmbeddedIcon() (`lookup_source`: its hash tables
+    and function as written into icons_embedded.cpp) against a registry that
+    holds only `names`, and return the index it resolves for each probe
+    (-1 for nullptr).
+    """
+    cxx = find_compiler()
+    if cxx is None:
+        raise RuntimeError("No host C++ compiler found (set CXX or install g++/clang++)")
+
+    os.makedirs(work_dir, exist_ok=True)
+    with open(os.path.join(work_dir, "icons_embedded.h"), "w", encoding="utf-8") as f:
+        f.write(SHIM_HEADER)
+    with open(os.path.join(work_dir, "lookup_main.cpp"), "w", encoding="utf-8") as f:
+        f.write(LOOKUP_MAIN)
+    with open(os.path.join(work_dir, "lookup_registry.cpp"), "w", encoding="utf-8") as f:
+        f.write('#include "icons_embedded.h"\n\n')
+        f.write("const EmbeddedIcon EMBEDDED_ICONS[] = {\n")
+        for name in names:
+            f.write(f'  {{"{name}", nullptr, 0, nullptr, 0, 0}},\n')
+        f.write("};\n")
+        f.write(f"const size_t EMBEDDED_ICONS_COUNT = {len(names)};\n\n")
+        f.write(lookup_source)
+    exe = os.path.join(work_dir, "icons_lookup")
+    subprocess.run([cxx, "-std=c++11", "-Wall", "-I", work_dir, "-o", exe, "lookup_main.cpp", "lookup_registry.cpp"], check=True, cwd=work_dir)
+    result = subprocess.run([exe], input="".join(p + "\n" for p in probes), capture_output=True, text=True, check=True, cwd=work_dir)
+    return [int(line) for line in result.stdout.split()]
@@ -0,0 +1,102 @@
+"""
+Content-addressed on-disk cache for per-icon encode results.
+
+Each entry is keyed by a SHA-256 over the tile's pixels (plus palette and
+transparency for P/PA tiles) and the encode settings (tile and output size,
+threshold, PNG options, Pillow version), so a cached entry is only reused
+when re-encoding would produce the same bytes. Entries
+hold the icon's PNG bytes and packed bitmap bytes.
+
+Entries not touched during a build are stale (the tile changed or was
+removed) and are evicted by evict_unused().
+"""
+
+import hashlib
+import json
+import os
+import struct
+from typing import Any, Dict, Optional, Set, Tuple
+
+import PIL
+from PIL import Image
+
+
+CACHE_VERSION = 3
+
+_ENTRY_SUFFIX = ".bin"
+_HEADER = struct.Struct("<I")  # PNG length; bitmap bytes follow the PNG
+
+
+class IconCache:
+    def __init__(self, root: str, settings: Dict[str, Any]) -> None:
+        self.root = root
+        self.hits = 0
+        self.misses = 0
+        self._used: Set[str] = set()
+
+        salt = dict(settings)
+        salt["cacheVersion"] = CACHE_VERSION
+        salt["pillow"] = PIL.__version__
+        self._salt = json.dumps(salt, sort_keys=True).encode("utf-8")
+
+        os.makedirs(self.root, exist_ok=True)
+
+    def key(self, tile: Image.Image, size: Tuple[int, int]) -> str:
+        """Key for encoding `tile` into a `size` (w, h) bitmap."""
+        h = hashlib.sha256(self._salt)
+        h.update(f"{tile.mode}:{tile.size[0]}x{tile.size[1]}->{size[0]}x{size[1]}:".encode("ascii"))
+        h.update(tile.tobytes())
+        if tile.mode in ("P", "PA"):
+            # Indices alone don't pin the pixels: a palette-only edit keeps them.
+            h.update(bytes(tile.getpalette("RGBA") or []))
+            h.update(repr(tile.info.get("transparency")).encode("ascii"))
+        return h.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key + _ENTRY_SUFFIX)
+
+    def get(self, key: str) -> Optional[Tuple[bytes, bytes]]:
+        self._used.add(key)
+        try:
+            with open(self._path(key), "rb") as f:
+                data = f.read()
+        except OSError:
+            self.misses += 1
+            return None
+
+        if len(data) < _HEADER.size:
+            self.misses += 1
+            return None
+        (png_len,) = _HEADER.unpack_from(data, 0)
+        start = _HEADER.size
+        if start + png_len > len(data):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return data[start : start + png_len], data[start + png_len :]
+
+    def put(self, key: str, png: bytes, bmp: bytes) -> None:
+        self._used.add(key)
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(_HEADER.pack(len(png)))
+            f.write(png)
+            f.write(bmp)
+        os.replace(tmp, path)
+
+    def evict_unused(self) -> int:
+        """Delete every entry not read or written since this cache was opened."""
+        evicted = 0
+        for fname in os.listdir(self.root):
+            if not fname.endswith(_ENTRY_SUFFIX):
+                continue
+            if fname[: -len(_ENTRY_SUFFIX)] in self._used:
+                continue
+            try:
+                os.remove(os.path.join(self.root, fname))
+                evicted += 1
+            except OSError:
+                pass
+        return evicted
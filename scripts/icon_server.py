@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Host-side emulator of the firmware's icon endpoints.
+
+Loads the generated icons_embedded.cpp (payload arrays, registry, ETags,
+atlas; plus its shards or payload blob for the other output modes) with a
+small parser and serves what the device does:
+
+  /api/icon?name=<name>   the icon PNG, with ETag / Cache-Control and
+                          304 Not Modified for a matching If-None-Match
+  /icons/test             a page showing every icon (one <img> per icon,
+                          or the sprite atlas when it was built; ?atlas=0/1)
+  <atlasUrl>, .css, .json the sprite atlas and its offset maps
+
+so request counts, bytes and latency of different output options can be
+measured without flashing a board (see bench_icon_server.py).
+`--single-threaded` serves one connection at a time like the Arduino
+WebServer; `--throttle` / `--latency` approximate the Wi-Fi link and
+per-request handling time.
+
+Example:
+  python3 icons/scripts/icon_server.py --port 8080 --single-threaded --throttle 200000
+"""
+
+import argparse
+import glob
+import html
+import http.server
+import os
+import re
+import socketserver
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import generate_icons as gen
+
+ATLAS_KINDS = {"png": "image/png", "css": "text/css", "json": "application/json"}
+
+# Throttled bodies are written one TCP segment at a time.
+_SEGMENT = 1460
+
+_ARRAY_RE = re.compile(r"const uint8_t PROGMEM (\w+)\[\] = \{([^}]*)\};")
+_BLOB_DEFINE_RE = re.compile(r"#define (\w+) (?:\(EMBEDDED_ICON_BLOB \+ (\d+)\)|\(\(const uint8_t\*\)nullptr\)  // blob offset (\d+))")
+_BLOB_NAME_RE = re.compile(r"// Payloads live in (\S+) \(")
+_REGISTRY_RE = re.compile(r'\{"(\w+)", (\w+), (\d+), (\w+), (\d+), (\d+)\},')
+_ETAG_RE = re.compile(r'static const char (\w+)_ETAG\[\] PROGMEM = "((?:[^"\\]|\\.)*)";|static const char (\w+)_etag\[\] PROGMEM = "((?:[^"\\]|\\.)*)";')
+_ATLAS_SIZE_RE = re.compile(r"getEmbeddedIconAtlas(Png|Css|Json)\(size_t\* size\) \{\n  \*size = (\d+);")
+_CACHE_CONTROL_RE = re.compile(r'#define EMBEDDED_ICONS_CACHE_CONTROL "([^"]*)"')
+_ATLAS_URL_RE = re.compile(rb"url\(([^)]+)\)")
+
+
+def _c_unescape(text: str) -> str:
+    return re.sub(r"\\(.)", r"\1", text)
+
+
+class IconStore:
+    """Icon PNGs, ETags and atlas parsed from a generated icons_embedded.cpp."""
+
+    def __init__(self, cpp_path: str, blob_path: Optional[str] = None) -> None:
+        self.cpp_path = cpp_path
+        with open(cpp_path, "r", encoding="utf-8") as f:
+            source = f.read()
+        out_dir = os.path.dirname(os.path.abspath(cpp_path))
+
+        arrays: Dict[str, bytes] = {}
+        texts = [source]
+        for path in sorted(glob.glob(os.path.join(out_dir, f"{gen.SHARD_PREFIX}*.cpp"))):
+            with open(path, "r", encoding="utf-8") as f:
+                text = f.read()
+            if text.startswith(gen.SHARD_MARKER):
+                texts.append(text)
+        for text in texts:
+            for sym, body in _ARRAY_RE.findall(text):
+                arrays[sym] = bytes.fromhex("".join(re.findall(r"0x([0-9A-Fa-f]{2})", body)))
+
+        offsets = {sym: int(a or b) for sym, a, b in _BLOB_DEFINE_RE.findall(source)}
+        blob = b""
+        if offsets:
+            match = _BLOB_NAME_RE.search(source)
+            gen._require(match is not None, f"{cpp_path}: blob output without a blob name")
+            assert match is not None
+            if blob_path is None:
+                candidates = [os.path.join(out_dir, match.group(1)), os.path.join(out_dir, "data", match.group(1))]
+                blob_path = next((p for p in candidates if os.path.exists(p)), candidates[0])
+            gen._require(os.path.exists(blob_path), f"Missing payload blob: {blob_path} (pass --blob)")
+            with open(blob_path, "rb") as f:
+                blob = f.read()
+
+        def payload(sym: str, size: int) -> bytes:
+            if sym in arrays:
+                return arrays[sym][:size]
+            gen._require(sym in offsets, f"{cpp_path}: no data for {sym}")
+            return blob[offsets[sym] : offsets[sym] + size]
+
+        etags: Dict[str, str] = {}
+        for atlas_sym, atlas_tag, png_sym, png_tag in _ETAG_RE.findall(source):
+            etags[atlas_sym or png_sym] = _c_unescape(atlas_tag or png_tag)
+
+        registry = source[source.index("EMBEDDED_ICONS[] PROGMEM") :]
+        registry = registry[: registry.index("};")]
+        self.icons: Dict[str, Tuple[bytes, Optional[str]]] = {}
+        self.order: List[str] = []
+        self.sizes: Dict[str, Tuple[int, int]] = {}
+        for name, png_sym, png_len, _, w, h in _REGISTRY_RE.findall(registry):
+            self.icons[name] = (payload(png_sym, int(png_len)), etags.get(png_sym))
+            self.order.append(name)
+            self.sizes[name] = (int(w), int(h))
+        gen._require(len(self.icons) > 0, f"{cpp_path}: no icon registry found")
+
+        self.atlas: Dict[str, Tuple[bytes, Optional[str]]] = {}
+        for fn, size in _ATLAS_SIZE_RE.findall(source):
+            sym = f"EMBEDDED_ICON_ATLAS_{fn.upper()}"
+            self.atlas[fn.lower()] = (payload(sym, int(size)), etags.get(sym))
+        self.atlas_url: Optional[str] = None
+        if "css" in self.atlas:
+            match = _ATLAS_URL_RE.search(self.atlas["css"][0])
+            self.atlas_url = match.group(1).decode("utf-8") if match else None
+
+        self.cache_control: Optional[str] = None
+        header = os.path.join(out_dir, gen.GEN_HEADER_NAME)
+        if os.path.exists(header):
+            with open(header, "r", encoding="utf-8") as f:
+                match = _CACHE_CONTROL_RE.search(f.read())
+            self.cache_control = match.group(1) if match else None
+
+    def routes(self) -> Dict[str, Tuple[bytes, Optional[str], str]]:
+        """Static paths -> (body, etag, content type): the atlas files."""
+        out: Dict[str, Tuple[bytes, Optional[str], str]] = {}
+        if self.atlas_url:
+            base = os.path.splitext(self.atlas_url)[0]
+            for kind, (data, etag) in self.atlas.items():
+                out[self.atlas_url if kind == "png" else f"{base}.{kind}"] = (data, etag, ATLAS_KINDS[kind])
+        return out
+
+    def test_page(self, atlas: bool) -> bytes:
+        lines = ["<!DOCTYPE html>", "<html><head><meta charset=\"utf-8\"><title>Embedded icons</title>"]
+        if atlas:
+            css = os.path.splitext(self.atlas_url or "")[0] + ".css"
+            lines.append(f'<link rel="stylesheet" href="{html.escape(css)}">')
+        lines.append("<style>.cell{display:inline-block;margin:4px;text-align:center;font:10px sans-serif}</style>")
+        lines.append(f"</head><body><h1>{len(self.order)} embedded icons</h1>")
+        for name in self.order:
+            w, h = self.sizes[name]
+            if atlas:
+                lines.append(f'<div class="cell"><span class="icon icon-{name}"></span><br>{name}</div>')
+            else:
+                lines.append(f'<div class="cell"><img src="/api/icon?name={name}" width="{w}" height="{h}" alt="{name}"><br>{name}</div>')
+        lines.append("</body></html>")
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def etag_matches(etag: str, if_none_match: str) -> bool:
+    """Weak comparison, as embeddedIconEtagMatches(): any listed tag (W/ ignored) or *."""
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or (tag[2:] if tag.startswith("W/") else tag) == etag:
+            return True
+    return False
+
+
+class _Stats:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.requests: Dict[int, int] = {}
+        self.body_bytes = 0
+
+    def add(self, status: int, size: int) -> None:
+        with self.lock:
+            self.requests[status] = self.requests.get(status, 0) + 1
+            self.body_bytes += size
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    server_version = "IconEmulator/1.0"
+    # Headers and body go out in separate writes; with Nagle on, persistent
+    # connections would stall on the client's delayed ACK.
+    disable_nagle_algorithm = True
+    store: IconStore
+    config: Dict[str, Any]
+    stats: _Stats
+
+    def log_message(self, format: str, *args: Any) -> None:
+        if self.config["verbose"]:
+            super().log_message(format, *args)
+
+    def do_HEAD(self) -> None:
+        self.do_GET(head=True)
+
+    def do_GET(self, head: bool = False) -> None:
+        self._head = head
+        if self.config["latency"]:
+            time.sleep(self.config["latency"])
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if url.path == "/api/icon":
+            name = query.get("name", [""])[0]
+            if not name:
+                self._send(400, b"missing name\n", "text/plain")
+            elif name not in self.store.icons:
+                self._send(404, b"icon not found\n", "text/plain")
+            else:
+                data, etag = self.store.icons[name]
+                self._send(200, data, "image/png", etag)
+        elif url.path == "/icons/test":
+            atlas = query.get("atlas", ["1" if self.store.atlas_url else "0"])[0] == "1"
+            if atlas and not self.store.atlas_url:
+                self._send(404, b"no atlas in this build\n", "text/plain")
+            else:
+                self._send(200, self.store.test_page(atlas), "text/html; charset=utf-8", cacheable=False)
+        elif url.path in self.config["routes"]:
+            data, etag, ctype = self.config["routes"][url.path]
+            self._send(200, data, ctype, etag)
+        else:
+            self._send(404, b"not found\n", "text/plain")
+
+    def _send(self, status: int, body: bytes, ctype: str, etag: Optional[str] = None, cacheable: bool = True) -> None:
+        use_etag = etag is not None and self.config["etags"]
+        if status == 200 and use_etag:
+            assert etag is not None
+            if_none_match = self.headers.get("If-None-Match")
+            if if_none_match and etag_matches(etag, if_none_match):
+                status, body = 304, b""
+        self.send_response(status)
+        if status != 304:
+            self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        if status in (200, 304) and cacheable:
+            if use_etag:
+                self.send_header("ETag", str(etag))
+            if self.config["cache_control"]:
+                self.send_header("Cache-Control", self.config["cache_control"])
+        self.end_headers()
+        if self._head:
+            body = b""
+        rate = self.config["throttle"]
+        for start in range(0, len(body), _SEGMENT if rate else max(1, len(body))):
+            chunk = body[start : start + _SEGMENT] if rate else body
+            self.wfile.write(chunk)
+            if rate:
+                time.sleep(len(chunk) / rate)
+        self.stats.add(status, len(body))
+
+
+class _ThreadingServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+def make_server(store: IconStore, host: str = "127.0.0.1", port: int = 8080, single_threaded: bool = False, throttle: float = 0.0, latency_ms: float = 0.0, etags: bool = True, cache_control: Optional[str] = None, keep_alive: bool = False, verbose: bool = False) -> http.server.HTTPServer:
+    """
+    An HTTP server for `store`. `cache_control` None uses the build's
+    EMBEDDED_ICONS_CACHE_CONTROL; "" sends none. `throttle` is body bytes/s
+    per connection (0 = unlimited).
+    """
+    config = {
+        "routes": store.routes(),
+        "etags": etags,
+        "cache_control": store.cache_control if cache_control is None else cache_control,
+        "throttle": throttle,
+        "latency": latency_ms / 1000.0,
+        "verbose": verbose,
+    }
+    handler = type("Handler", (_Handler,), {"store": store, "config": config, "stats": _Stats(), "protocol_version": "HTTP/1.1" if keep_alive else "HTTP/1.0"})
+    server_cls = http.server.HTTPServer if single_threaded else _ThreadingServer
+    server = server_cls((host, port), handler)
+    server.stats = handler.stats  # type: ignore[attr-defined]
+    return server
+
+
+def main() -> int:
+    repo_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+    parser = argparse.ArgumentParser(description="Serve /api/icon and /icons/test from a generated icons_embedded.cpp")
+    parser.add_argument("--cpp", default=os.path.join(repo_root, "icons_embedded.cpp"), help="Generated source (default: icons_embedded.cpp in the project root)")
+    parser.add_argument("--blob", default=None, help="Payload blob for output incbin/file (default: found next to the .cpp)")
+    parser.add_argument("--host", default="127.0.0.1", help="Bind address (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8080, help="Port (default: 8080)")
+    parser.add_argument("--single-threaded", action="store_true", help="Serve one connection at a time, like the Arduino WebServer")
+    parser.add_argument("--throttle", type=float, default=0.0, help="Body bytes/s per connection, 0 = unlimited (default: 0)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Added handling time per request in ms (default: 0)")
+    parser.add_argument("--no-etags", action="store_true", help="Ignore the build's ETags (no ETag header, never 304)")
+    parser.add_argument("--cache-control", default=None, help="Cache-Control value (default: the build's; '' for none)")
+    parser.add_argument("--keep-alive", action="store_true", help="HTTP/1.1 persistent connections (default: close after each response)")
+    parser.add_argument("--verbose", "-v", action="store_true", help="Log every request")
+    args = parser.parse_args()
+    gen._require(args.throttle >= 0 and args.latency >= 0, "--throttle and --latency must be >= 0")
+
+    store = IconStore(args.cpp, args.blob)
+    server = make_server(store, args.host, args.port, args.single_threaded, args.throttle, args.latency, not args.no_etags, args.cache_control, args.keep_alive, args.verbose)
+    host, port = server.server_address[:2]
+    print(f"Loaded {len(store.icons)} icon(s) from {args.cpp}{' + atlas' if store.atlas_url else ''}")
+    print(f"Serving on http://{host}:{port}/icons/test ({'single-threaded' if args.single_threaded else 'threaded'}), Ctrl-C to stop")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    stats = server.stats  # type: ignore[attr-defined]
+    print(f"Served {sum(stats.requests.values())} request(s) ({', '.join(f'{n}x {s}' for s, n in sorted(stats.requests.items()))}), {stats.body_bytes} body bytes")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,37 @@
+"""
+Aligned binary blob holding every icon payload (PNG, bitmap, layouts, atlas).
+
+Used by generate_icons.py's "incbin" and "file" output modes: instead of
+formatting payloads as `0xNN,` text, each one is appended to the blob at an
+ALIGN-byte boundary and the generated C only carries its offset and size.
+"""
+
+from typing import Dict, Tuple
+
+
+ALIGN = 4
+
+
+class PayloadBlob:
+    def __init__(self, align: int = ALIGN) -> None:
+        self.align = align
+        self.data = bytearray()
+        self.entries: Dict[str, Tuple[int, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def add(self, name: str, payload: bytes) -> int:
+        """Append `payload` under `name` and return its offset."""
+        if name in self.entries:
+            raise ValueError(f"Duplicate blob entry: {name}")
+        pad = -len(self.data) % self.align
+        self.data += bytes(pad)
+        offset = len(self.data)
+        self.data += payload
+        self.entries[name] = (offset, len(payload))
+        return offset
+
+    def range(self, name: str) -> Tuple[int, int]:
+        """(offset, size) of a named payload."""
+        return self.entries[name]
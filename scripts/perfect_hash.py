@@ -0,0 +1,107 @@
+"""
+Minimal perfect hash over icon names (hash-and-displace).
+
+The generated C lookup hashes the query string exactly once (FNV-1a with a
+build-chosen seed). `h % n` picks a bucket in `displace`; a negative
+entry names the slot directly, otherwise the 32-bit hash is re-mixed with the
+bucket's displacement (integer-only, no second pass over the string). The
+slot indexes `slots`, which holds the registry index to compare against.
+
+FNV-1a and the mixer below must stay bit-for-bit identical to the C emitted
+by generate_icons.py.
+"""
+
+from typing import Dict, List, Optional, Sequence
+
+_MASK = 0xFFFFFFFF
+FNV_OFFSET = 0x811C9DC5
+FNV_PRIME = 0x01000193
+GOLDEN = 0x9E3779B9
+
+MAX_DISPLACEMENT = 1 << 20
+MAX_SEEDS = 256
+
+
+def fnv1a(data: bytes, seed: int) -> int:
+    h = FNV_OFFSET ^ seed
+    for c in data:
+        h = ((h ^ c) * FNV_PRIME) & _MASK
+    return h
+
+
+def mix(h: int, d: int) -> int:
+    # murmur3 fmix32 over (h + d * golden ratio)
+    x = (h + d * GOLDEN) & _MASK
+    x ^= x >> 16
+    x = (x * 0x85EBCA6B) & _MASK
+    x ^= x >> 13
+    x = (x * 0xC2B2AE35) & _MASK
+    x ^= x >> 16
+    return x
+
+
+class PerfectHash:
+    def __init__(self, seed: int, displace: List[int], slots: List[int]) -> None:
+        self.seed = seed
+        self.displace = displace
+        self.slots = slots
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def lookup(self, key: bytes) -> int:
+        """Return the only index `key` can be at; the caller still has to compare."""
+        n = len(self.slots)
+        h = fnv1a(key, self.seed)
+        d = self.displace[h % n]
+        slot = -d - 1 if d < 0 else mix(h, d) % n
+        return self.slots[slot]
+
+
+def _try_build(keys: Sequence[bytes], seed: int) -> Optional[PerfectHash]:
+    n = len(keys)
+    hashes = [fnv1a(k, seed) for k in keys]
+    if len(set(hashes)) != n:
+        return None
+
+    buckets: Dict[int, List[int]] = {}
+    for i, h in enumerate(hashes):
+        buckets.setdefault(h % n, []).append(i)
+
+    displace = [0] * n
+    slots: List[Optional[int]] = [None] * n
+
+    singles: List[int] = []
+    for b in sorted(buckets, key=lambda b: (-len(buckets[b]), b)):
+        members = buckets[b]
+        if len(members) == 1:
+            singles.append(b)
+            continue
+        for d in range(1, MAX_DISPLACEMENT):
+            cand = [mix(hashes[i], d) % n for i in members]
+            if len(set(cand)) == len(cand) and all(slots[c] is None for c in cand):
+                break
+        else:
+            return None
+        displace[b] = d
+        for i, c in zip(members, cand):
+            slots[c] = i
+
+    free = [s for s in range(n) if slots[s] is None]
+    for b, s in zip(singles, free):
+        displace[b] = -s - 1
+        slots[s] = buckets[b][0]
+
+    return PerfectHash(seed, displace, [int(s) for s in slots if s is not None])
+
+
+def build_perfect_hash(keys: Sequence[bytes]) -> PerfectHash:
+    if len(set(keys)) != len(keys):
+        raise ValueError("Perfect hash keys must be unique")
+    if not keys:
+        raise ValueError("Perfect hash needs at least one key")
+    for seed in range(MAX_SEEDS):
+        ph = _try_build(keys, seed)
+        if ph is not None:
+            return ph
+    raise RuntimeError(f"Failed to build a perfect hash for {len(keys)} keys")
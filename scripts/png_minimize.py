@@ -0,0 +1,229 @@
+"""
+Lossless PNG minimizer for small line-art icons.
+
+Pillow writes a tile in the sheet's own mode (usually 8-bit RGBA) with one
+filter heuristic and one zlib setting. Icons are mostly one or two colours,
+so they shrink a lot as palette / low-bit-depth grayscale images. For every
+color type the pixels can be represented in exactly, each candidate is
+tried with every scanline filter (0-4 plus per-row adaptive) and several
+zlib strategies; the smallest file whose decoded RGBA is identical to the
+input wins. Output carries only IHDR, PLTE, tRNS, IDAT and IEND.
+"""
+
+import io
+import struct
+import sys
+import zlib
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from PIL import Image, ImageChops
+
+
+MINIMIZE_VERSION = 1  # bump when candidate generation changes (part of the cache key)
+
+_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+COLOR_GRAY = 0
+COLOR_RGB = 2
+COLOR_PALETTE = 3
+COLOR_GRAY_ALPHA = 4
+COLOR_RGBA = 6
+
+_COLOR_NAMES = {
+    COLOR_GRAY: "gray",
+    COLOR_RGB: "rgb",
+    COLOR_PALETTE: "palette",
+    COLOR_GRAY_ALPHA: "gray+alpha",
+    COLOR_RGBA: "rgba",
+}
+
+_STRATEGIES = (zlib.Z_DEFAULT_STRATEGY, zlib.Z_FILTERED, zlib.Z_RLE, zlib.Z_HUFFMAN_ONLY)
+_SUB_BYTE_RAW_MODES = {1: "P;1", 2: "P;2", 4: "P;4"}
+_SIGNED_COST = bytes(v if v < 128 else 256 - v for v in range(256))
+
+
+class _Candidate:
+    def __init__(self, color_type: int, depth: int, rows: List[bytes], bpp: int, plte: bytes = b"", trns: bytes = b"") -> None:
+        self.color_type = color_type
+        self.depth = depth
+        self.rows = rows
+        self.bpp = bpp  # filter unit: bytes per complete pixel, at least 1
+        self.plte = plte
+        self.trns = trns
+
+
+def _chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+
+def _plane(data: bytes, stride: int) -> Image.Image:
+    """One byte per pixel, one scanline per image row, for ImageChops arithmetic."""
+    return Image.frombytes("L", (stride, len(data) // stride), data)
+
+
+def _mask(img: Image.Image) -> Image.Image:
+    """255 where `img` is zero, else 0."""
+    # add() scales (x + x) by 255 and clips: any non-zero byte saturates.
+    return ImageChops.invert(ImageChops.add(img, img, 1 / 255))
+
+
+def _paeth_predictor(a: Image.Image, b: Image.Image, c: Image.Image) -> Image.Image:
+    # pa = |b - c|, pb = |a - c|, pc = |(a - c) + (b - c)|: pa + pb when both
+    # differences have the same sign, |pa - pb| otherwise. Ties go a, b, c.
+    pa = ImageChops.difference(b, c)
+    pb = ImageChops.difference(a, c)
+    same = ImageChops.invert(ImageChops.difference(_mask(ImageChops.subtract(c, a)), _mask(ImageChops.subtract(c, b))))
+    pa_le_pb = _mask(ImageChops.subtract(pa, pb))
+    pa_le_pc = ImageChops.multiply(pa_le_pb, _mask(ImageChops.subtract(pa, ImageChops.subtract(pb, pa))))
+    pb_le_pc = _mask(ImageChops.subtract(pb, ImageChops.subtract(pa, pb)))
+    opposite = Image.composite(a, Image.composite(b, c, pb_le_pc), pa_le_pc)
+    return Image.composite(Image.composite(a, b, pa_le_pb), opposite, same)
+
+
+def _filtered_planes(cand: _Candidate) -> List[bytes]:
+    """Filtered bytes (without the per-row type byte) of every row for filters 0-4."""
+    stride, bpp = len(cand.rows[0]), cand.bpp
+    zero = bytes(stride)
+    ups = [zero] + cand.rows[:-1]
+    x = _plane(b"".join(cand.rows), stride)
+    a = _plane(b"".join(bytes(bpp) + row[:-bpp] for row in cand.rows), stride)
+    b = _plane(b"".join(ups), stride)
+    c = _plane(b"".join(bytes(bpp) + row[:-bpp] for row in ups), stride)
+    average = ImageChops.add(a, b, 2.0)
+    return [
+        x.tobytes(),
+        ImageChops.subtract_modulo(x, a).tobytes(),
+        ImageChops.subtract_modulo(x, b).tobytes(),
+        ImageChops.subtract_modulo(x, average).tobytes(),
+        ImageChops.subtract_modulo(x, _paeth_predictor(a, b, c)).tobytes(),
+    ]
+
+
+def _filtered_streams(cand: _Candidate) -> Iterator[bytes]:
+    """Yield the filtered image data for each uniform filter, then the adaptive choice."""
+    if not cand.rows:
+        return
+    stride = len(cand.rows[0])
+    spans = [(r * stride, (r + 1) * stride) for r in range(len(cand.rows))]
+    planes = _filtered_planes(cand)
+    per_filter = [[bytes((f,)) + plane[i:j] for i, j in spans] for f, plane in enumerate(planes)]
+    for f in range(5):
+        yield b"".join(per_filter[f])
+
+    # Adaptive: per row, the filter with the smallest sum of signed residuals
+    # (the heuristic from the PNG spec); first filter wins ties.
+    costs = [plane.translate(_SIGNED_COST) for plane in planes]
+    yield b"".join(per_filter[min(range(5), key=lambda f: sum(costs[f][i:j]))][r] for r, (i, j) in enumerate(spans))
+
+
+def _deflate(data: bytes, strategy: int) -> bytes:
+    z = zlib.compressobj(9, zlib.DEFLATED, 15, 9, strategy)
+    return z.compress(data) + z.flush()
+
+
+def _assemble(cand: _Candidate, size: Tuple[int, int], idat: bytes) -> bytes:
+    ihdr = struct.pack(">IIBBBBB", size[0], size[1], cand.depth, cand.color_type, 0, 0, 0)
+    out = [_SIGNATURE, _chunk(b"IHDR", ihdr)]
+    if cand.plte:
+        out.append(_chunk(b"PLTE", cand.plte))
+    if cand.trns:
+        out.append(_chunk(b"tRNS", cand.trns))
+    out.append(_chunk(b"IDAT", idat))
+    out.append(_chunk(b"IEND", b""))
+    return b"".join(out)
+
+
+def _rows(data: bytes, stride: int) -> List[bytes]:
+    return [data[i : i + stride] for i in range(0, len(data), stride)]
+
+
+def _pack_indices(indices: bytes, size: Tuple[int, int], depth: int) -> List[bytes]:
+    """Pack one index/level byte per pixel into PNG scanlines of `depth` bits (MSB-first)."""
+    if depth == 8:
+        return _rows(indices, size[0])
+    img = Image.frombytes("P", size, indices)
+    return _rows(img.tobytes("raw", _SUB_BYTE_RAW_MODES[depth]), (size[0] * depth + 7) // 8)
+
+
+def _min_depth(n: int) -> int:
+    for depth in (1, 2, 4, 8):
+        if n <= 1 << depth:
+            return depth
+    raise ValueError(f"Too many values for a palette: {n}")
+
+
+def _candidates(rgba: Image.Image) -> Iterator[_Candidate]:
+    size = rgba.size
+    raw = rgba.tobytes()
+    r, g, b, a = (raw[i::4] for i in range(4))
+    opaque = min(a) == 255
+    gray = r == g == b
+
+    colors = rgba.getcolors(256)
+    if colors is not None:
+        # Translucent entries first so tRNS can stop after the last of them;
+        # then by frequency.
+        entries = sorted(colors, key=lambda c: (c[1][3] == 255, -c[0]))
+        index: Dict[int, int] = {int.from_bytes(bytes(c), sys.byteorder): i for i, (_, c) in enumerate(entries)}
+        indices = bytes(map(index.__getitem__, memoryview(raw).cast("I")))
+        plte = b"".join(bytes(c[:3]) for _, c in entries)
+        alphas = bytes(c[3] for _, c in entries)
+        trns = alphas.rstrip(b"\xff")
+        yield _Candidate(COLOR_PALETTE, _min_depth(len(entries)), _pack_indices(indices, size, _min_depth(len(entries))), 1, plte, trns)
+
+    if gray and opaque:
+        levels = set(r)
+        for depth in (1, 2, 4, 8):
+            scale = 255 // ((1 << depth) - 1)
+            if all(v % scale == 0 for v in levels):
+                yield _Candidate(COLOR_GRAY, depth, _pack_indices(bytes(v // scale for v in r), size, depth), 1)
+                break
+    if gray:
+        la = bytearray(len(r) * 2)
+        la[0::2] = r
+        la[1::2] = a
+        yield _Candidate(COLOR_GRAY_ALPHA, 8, _rows(bytes(la), size[0] * 2), 2)
+    if opaque:
+        yield _Candidate(COLOR_RGB, 8, _rows(rgba.convert("RGB").tobytes(), size[0] * 3), 3)
+    yield _Candidate(COLOR_RGBA, 8, _rows(raw, size[0] * 4), 4)
+
+
+def _decodes_to(png: bytes, rgba: bytes) -> bool:
+    with Image.open(io.BytesIO(png)) as img:
+        return img.convert("RGBA").tobytes() == rgba
+
+
+def minimize_png(img: Image.Image, baseline: Optional[bytes] = None) -> bytes:
+    """
+    Return the smallest PNG encoding of `img` found, never larger than
+    `baseline` (an existing encoding of the same pixels) when given.
+    """
+    rgba = img if img.mode == "RGBA" else img.convert("RGBA")
+    expect = rgba.tobytes()
+
+    found: List[bytes] = []
+    for cand in _candidates(rgba):
+        best: Optional[bytes] = None
+        # Adaptive often picks one filter for every row; deflate each stream once.
+        for stream in dict.fromkeys(_filtered_streams(cand)):
+            for strategy in _STRATEGIES:
+                idat = _deflate(stream, strategy)
+                if best is None or len(idat) < len(best):
+                    best = idat
+        if best is not None:
+            found.append(_assemble(cand, rgba.size, best))
+
+    if baseline is not None:
+        found.append(baseline)
+    for png in sorted(found, key=len):
+        if png is baseline or _decodes_to(png, expect):
+            return png
+    raise RuntimeError("PNG minimizer produced no decodable candidate")
+
+
+def describe_png(png: bytes) -> str:
+    """Short "<color type> <depth>-bit" summary from a PNG's IHDR."""
+    if not png.startswith(_SIGNATURE) or len(png) < 33:
+        return "?"
+    depth, color_type = png[24], png[25]
+    return f"{_COLOR_NAMES.get(color_type, str(color_type))} {depth}-bit"
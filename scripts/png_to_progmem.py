@@ -13,6 +13,8 @@ import os
 from PIL import Image
 import io
 
+from bitmap_pack import BIT_ORDER_LSB, pack_tile_1bpp
+
 def png_to_progmem(png_path, icon_name):
     """Convert PNG to PROGMEM arrays"""
     
@@ -27,20 +29,8 @@ def png_to_progmem(png_path, icon_name):
         print(f"Warning: {png_path} is {img.size}, expected 16x16. Resizing...")
         img = img.resize((16, 16), Image.Resampling.LANCZOS)
     
-    # Convert to grayscale
-    img = img.convert('L')
-    
-    # Convert to 1-bit monochrome bitmap
-    bitmap = []
-    for y in range(16):
-        for x in range(0, 16, 8):
-            byte = 0
-            for bit in range(8):
-                if x + bit < 16:
-                    pixel = img.getpixel((x + bit, y))
-                    if pixel > 128:  # Threshold
-                        byte |= (1 << bit)
-            bitmap.append(byte)
+    # Convert to 1-bit monochrome bitmap (threshold 128, LSB-first rows)
+    bitmap = pack_tile_1bpp(img, threshold=128, bit_order=BIT_ORDER_LSB)
     
     # Generate C code
     output = []
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The generator is a set of scripts, not a package: import them from scripts/.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "scripts"))
@@ -0,0 +1,139 @@
+"""PackBits and family XOR deltas, decoded with the reference decoders."""
+
+import random
+from typing import Any, Dict, List
+
+import pytest
+
+from bitmap_pack import XFORM_FLIP_X, XFORM_NONE, packbits_decode, packbits_encode, transform_1bpp
+from generate_icons import _apply_xor_delta, _dedup_payloads, _delta_encode_families, _encode_bitmaps
+
+SIZE = (32, 32)
+STRIDE = 4
+
+
+def _sparse(seed: int, lit: int = 40) -> bytes:
+    """Line-art-like bitmap: a few set bits on an empty canvas."""
+    rnd = random.Random(seed)
+    out = bytearray(STRIDE * SIZE[1])
+    for _ in range(lit):
+        out[rnd.randrange(len(out))] |= 1 << rnd.randrange(8)
+    return bytes(out)
+
+
+def _noise(seed: int) -> bytes:
+    rnd = random.Random(seed)
+    return bytes(rnd.randrange(256) for _ in range(STRIDE * SIZE[1]))
+
+
+def _icon(name: str, bmp: bytes) -> Dict[str, Any]:
+    return {"name": name, "w": SIZE[0], "h": SIZE[1], "bmp": bmp, "png": name.encode("ascii")}
+
+
+def _decode(icon: Dict[str, Any], owners: Dict[str, Dict[str, Any]]) -> bytes:
+    """What the generated reader reconstructs: stored array -> PackBits -> delta -> transform."""
+    owner = owners[icon["bmp_sym"]]
+    if icon["bmp_enc"]:
+        data = packbits_decode(owner["bmp_stored"], len(owner["bmp"]))
+    else:
+        assert "bmp_stored" not in owner
+        data = owner["bmp"]
+    if "bmp_delta" in icon:
+        data = _apply_xor_delta(data, icon["bmp_delta"])
+    if icon["bmp_xform"] != XFORM_NONE:
+        data = transform_1bpp(data, SIZE, icon["bmp_xform"])
+    return data
+
+
+def _build(icons: List[Dict[str, Any]], encoding: str, families: bool) -> Dict[str, Any]:
+    expected = {icon["name"]: icon["bmp"] for icon in icons}
+    _dedup_payloads(icons, transforms=True)
+    report = _delta_encode_families(icons, None) if families else None
+    _encode_bitmaps(icons, encoding)
+    owners = {f"icon_{icon['name']}_bitmap": icon for icon in icons}
+    for icon in icons:
+        assert _decode(icon, owners) == expected[icon["name"]], icon["name"]
+    return {"report": report, "icons": {icon["name"]: icon for icon in icons}}
+
+
+def _packbits_cases() -> List[bytes]:
+    rnd = random.Random(7)
+    cases = [b"", b"\x00", b"\x00\x00", b"\x00" * 3, b"\xaa" * 128, b"\xaa" * 129, b"\xaa" * 130, bytes(range(128)), bytes(range(129)), b"\x01\x02\x02\x03\x03\x03\x04"]
+    for _ in range(300):
+        runs = [bytes([rnd.randrange(4)]) * rnd.choice((1, 1, 2, 3, 5, 127, 128, 129, 200)) for _ in range(rnd.randint(1, 12))]
+        cases.append(b"".join(runs))
+    return cases
+
+
+@pytest.mark.parametrize("data", _packbits_cases())
+def test_packbits_round_trip(data: bytes) -> None:
+    packed = packbits_encode(data)
+    assert packbits_decode(packed) == data
+    assert packbits_decode(packed, len(data)) == data
+    # Walk the headers: -128 (0x80) is never emitted.
+    i = 0
+    while i < len(packed):
+        h = packed[i]
+        assert h != 0x80
+        i += 1 + (h + 1 if h < 128 else 1)
+    assert i == len(packed)
+
+
+def test_packbits_with_raw_fallback() -> None:
+    icons = [_icon(f"sparse{i}", _sparse(i)) for i in range(4)] + [_icon("noise", _noise(1)), _icon("empty", bytes(STRIDE * SIZE[1]))]
+    built = _build(icons, "packbits", families=False)["icons"]
+    assert all(built[f"sparse{i}"]["bmp_enc"] == 1 for i in range(4))
+    # Noise doesn't compress: stored raw.
+    assert built["noise"]["bmp_enc"] == 0
+
+
+def test_packbits_keeps_random_access_sources_raw() -> None:
+    base = _sparse(3)
+    mirrored = transform_1bpp(base, SIZE, XFORM_FLIP_X)
+    assert mirrored != base
+    built = _build([_icon("arrow_left", base), _icon("arrow_right", mirrored)], "packbits", families=False)["icons"]
+    assert built["arrow_right"]["bmp_xform"] == XFORM_FLIP_X
+    # The transformed icon reads its source by random access, so it stays raw.
+    assert built["arrow_left"]["bmp_enc"] == built["arrow_right"]["bmp_enc"] == 0
+
+
+@pytest.mark.parametrize("encoding", ["raw", "packbits"])
+def test_family_deltas_with_fallback(encoding: str) -> None:
+    base = _sparse(10)
+    near = bytearray(base)
+    near[5] ^= 0x10
+    near[77] ^= 0x81
+    low = bytearray(base)
+    for off in range(0, 40, 4):
+        low[off] ^= 0x01
+    icons = [
+        _icon("battery_full", base),
+        _icon("battery_half", bytes(near)),
+        _icon("battery_low", bytes(low)),
+        _icon("battery_low_alias", bytes(low)),  # shares battery_low's array
+        _icon("battery_noise", _noise(2)),  # delta would be bigger than the bitmap
+        _icon("wifi_on", _noise(20)),
+        _icon("wifi_off", _noise(21)),
+    ]
+    built = _build(icons, encoding, families=True)
+    by_name = built["icons"]
+    # battery_full is the cheapest base; only battery_half is delta-coded.
+    assert by_name["battery_half"]["bmp_delta"] == bytes([5, 0x10, 77, 0x81])
+    assert by_name["battery_half"]["bmp_sym"] == "icon_battery_full_bitmap"
+    assert "bmp_delta" not in by_name["battery_noise"]
+    # Arrays other icons share are never replaced by a delta.
+    assert "bmp_delta" not in by_name["battery_low"]
+    assert by_name["battery_low_alias"]["bmp_sym"] == "icon_battery_low_bitmap"
+    assert built["report"]["icons"] == 1
+    # Unrelated drawings: a delta wouldn't be smaller, both stay raw.
+    assert "bmp_delta" not in by_name["wifi_on"] and "bmp_delta" not in by_name["wifi_off"]
+
+
+def test_family_delta_member_decodes_from_packbits_base() -> None:
+    base = _sparse(30)
+    member = bytearray(base)
+    member[0] ^= 1
+    built = _build([_icon("sig_a", base), _icon("sig_b", bytes(member))], "packbits", families=True)["icons"]
+    coded = [icon for icon in built.values() if "bmp_delta" in icon]
+    assert len(coded) == 1 and coded[0]["bmp_delta"] == b"\x00\x01"
+    assert coded[0]["bmp_enc"] == 1
@@ -0,0 +1,63 @@
+"""bitmapFormat layouts against a per-pixel reference built from the layout definitions."""
+
+import random
+from typing import List, Tuple
+
+import pytest
+from PIL import Image
+
+from bitmap_pack import BITMAP_FORMATS, FORMAT_GFX, FORMAT_SSD1306, FORMAT_XBM, pack_1bpp, pack_bitmap_format, unpack_bitmap_format
+from generate_icons import _build_formats
+
+SIZES = [(1, 1), (7, 3), (8, 8), (13, 21), (30, 9), (32, 32), (33, 17)]
+
+
+def _random_mono(size: Tuple[int, int], seed: int) -> Image.Image:
+    rnd = random.Random(seed)
+    return Image.frombytes("L", size, bytes(rnd.choice((0, 255)) for _ in range(size[0] * size[1]))).convert("1", dither=Image.Dither.NONE)
+
+
+def _reference(pixels: List[List[int]], w: int, h: int, fmt: str) -> bytes:
+    """Scalar packer: one bit per pixel at the address the format defines."""
+    stride = (w + 7) // 8
+    out = bytearray(((h + 7) // 8) * w if fmt == FORMAT_SSD1306 else stride * h)
+    for y in range(h):
+        for x in range(w):
+            if not pixels[y][x]:
+                continue
+            if fmt == FORMAT_XBM:
+                out[y * stride + x // 8] |= 1 << (x & 7)
+            elif fmt == FORMAT_GFX:
+                out[y * stride + x // 8] |= 0x80 >> (x & 7)
+            else:
+                out[(y // 8) * w + x] |= 1 << (y & 7)
+    return bytes(out)
+
+
+def _pixels(img: Image.Image) -> List[List[int]]:
+    w, h = img.size
+    return [[1 if img.getpixel((x, y)) else 0 for x in range(w)] for y in range(h)]
+
+
+@pytest.mark.parametrize("fmt", BITMAP_FORMATS)
+@pytest.mark.parametrize("size", SIZES)
+def test_pack_matches_reference(fmt: str, size: Tuple[int, int]) -> None:
+    for seed in range(4):
+        mono = _random_mono(size, seed)
+        data = pack_bitmap_format(mono, fmt)
+        assert data == _reference(_pixels(mono), size[0], size[1], fmt)
+        assert unpack_bitmap_format(data, size, fmt).tobytes() == mono.tobytes()
+
+
+def test_build_formats_packs_registry_bitmaps() -> None:
+    icons = []
+    for i, size in enumerate(SIZES):
+        mono = _random_mono(size, 100 + i)
+        icons.append({"name": f"icon{i}", "w": size[0], "h": size[1], "bmp": pack_1bpp(mono), "mono": mono})
+    # Two icons with identical pixels share one array.
+    icons.append(dict(icons[0], name="twin"))
+    _build_formats(icons, list(BITMAP_FORMATS))
+    for icon in icons:
+        for fmt in BITMAP_FORMATS:
+            assert icon["fmt"][fmt] == _reference(_pixels(icon["mono"]), icon["w"], icon["h"], fmt), (icon["name"], fmt)
+    assert all(icons[0]["fmt_sym"][fmt] == icons[-1]["fmt_sym"][fmt] for fmt in BITMAP_FORMATS)
@@ -0,0 +1,101 @@
+"""colorFormat / alphaMask arrays against scalar reference packers."""
+
+import io
+import random
+from typing import Tuple
+
+import pytest
+from PIL import Image
+
+from color_pack import COLOR_FORMATS, COLOR_GRAY2, COLOR_GRAY4, COLOR_RGB565, flatten, gray_stride, pack_alpha_mask, pack_color_format, unpack_gray, unpack_rgb565
+from generate_icons import ALPHA_MASK, _build_color_formats
+
+SIZES = [(1, 1), (3, 5), (7, 2), (13, 21), (32, 32), (33, 9)]
+GRAY_BPP = {COLOR_GRAY4: 4, COLOR_GRAY2: 2}
+
+
+def _random_rgba(size: Tuple[int, int], seed: int) -> Image.Image:
+    rnd = random.Random(seed)
+    # Mix of full-range noise and the flat colours line-art icons are made of.
+    flat = [(0, 0, 0, 0), (255, 255, 255, 255), (0, 0, 0, 255), (255, 0, 0, 255), (30, 144, 255, 128)]
+    pixels = [rnd.choice(flat) if rnd.random() < 0.5 else tuple(rnd.randrange(256) for _ in range(4)) for _ in range(size[0] * size[1])]
+    return Image.frombytes("RGBA", size, bytes(v for p in pixels for v in p))
+
+
+def _ref_rgb565(rgb: Image.Image, byte_swap: bool) -> bytes:
+    out = bytearray()
+    raw = rgb.tobytes()
+    for r, g, b in zip(raw[0::3], raw[1::3], raw[2::3]):
+        v = ((r >> 3) << 11) | ((g >> 2) << 5) | (b >> 3)
+        out += v.to_bytes(2, "big" if byte_swap else "little")
+    return bytes(out)
+
+
+def _ref_gray(rgb: Image.Image, bpp: int) -> bytes:
+    """Levels round(v * top / 255), packed MSB-first, rows padded to a byte."""
+    w, h = rgb.size
+    luma = rgb.convert("L")
+    top = (1 << bpp) - 1
+    out = bytearray(gray_stride(w, bpp) * h)
+    for y in range(h):
+        for x in range(w):
+            level = (luma.getpixel((x, y)) * top + 127) // 255
+            bit = x * bpp
+            out[y * gray_stride(w, bpp) + bit // 8] |= level << (8 - bpp - bit % 8)
+    return bytes(out)
+
+
+def _ref_alpha_mask(img: Image.Image) -> bytes:
+    w, h = img.size
+    stride = (w + 7) // 8
+    out = bytearray(stride * h)
+    for y in range(h):
+        for x in range(w):
+            if img.getpixel((x, y))[3] > 127:
+                out[y * stride + x // 8] |= 1 << (x & 7)
+    return bytes(out)
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_packers_match_reference(size: Tuple[int, int]) -> None:
+    for seed in range(4):
+        img = _random_rgba(size, seed)
+        rgb = flatten(img, (12, 34, 56))
+        for byte_swap in (True, False):
+            data = pack_color_format(rgb, COLOR_RGB565, byte_swap)
+            assert data == _ref_rgb565(rgb, byte_swap)
+            assert unpack_rgb565(data, size, byte_swap) == [int.from_bytes(data[i : i + 2], "big" if byte_swap else "little") for i in range(0, len(data), 2)]
+        for fmt, bpp in GRAY_BPP.items():
+            data = pack_color_format(rgb, fmt)
+            assert data == _ref_gray(rgb, bpp)
+            top = (1 << bpp) - 1
+            assert list(unpack_gray(data, size, bpp).tobytes()) == [(v * top + 127) // 255 for v in rgb.convert("L").tobytes()]
+        assert pack_alpha_mask(img) == _ref_alpha_mask(img)
+
+
+def test_build_color_formats_whole_arrays() -> None:
+    icons = []
+    for i, size in enumerate(SIZES):
+        img = _random_rgba(size, 50 + i)
+        buf = io.BytesIO()
+        img.save(buf, "PNG")
+        icons.append({"name": f"icon{i}", "png": buf.getvalue(), "w": size[0], "h": size[1]})
+    # A registry entry at another size is resized (nearest) before packing.
+    icons.append(dict(icons[-1], name="scaled", w=16, h=20))
+    opts = {"colorFormats": list(COLOR_FORMATS), "alphaMask": True, "colorBackground": (255, 255, 255), "rgb565ByteSwap": True}
+    _build_color_formats(icons, opts)
+    for icon in icons:
+        img = Image.open(io.BytesIO(icon["png"])).convert("RGBA")
+        if img.size != (icon["w"], icon["h"]):
+            img = img.resize((icon["w"], icon["h"]), resample=Image.NEAREST)
+        rgb = flatten(img, opts["colorBackground"])
+        assert icon["fmt"][COLOR_RGB565] == _ref_rgb565(rgb, True)
+        for fmt, bpp in GRAY_BPP.items():
+            assert icon["fmt"][fmt] == _ref_gray(rgb, bpp)
+        assert icon["fmt"][ALPHA_MASK] == _ref_alpha_mask(img)
+
+
+def test_build_color_formats_noop_without_formats() -> None:
+    icons = [{"name": "a", "png": b"", "w": 1, "h": 1}]
+    assert _build_color_formats(icons, {"colorFormats": [], "alphaMask": False}) == {}
+    assert "fmt" not in icons[0]
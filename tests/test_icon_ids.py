@@ -0,0 +1,58 @@
+"""IconId enumerators for icon names that clash with C++ keywords or Arduino macros."""
+
+import subprocess
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from generate_icons import _check_enum_names, _enum_name
+from host_harness import find_compiler
+
+# A few of the macros Arduino.h / binary.h define, as the cores spell them.
+ARDUINO_MACROS = """\
+#define HIGH 0x1
+#define LOW 0x0
+#define INPUT 0x0
+#define OUTPUT 0x1
+#define DEC 10
+#define HEX 16
+#define PI 3.1415926535897932384626433832795
+#define B101 5
+#define min(a, b) ((a) < (b) ? (a) : (b))
+#define max(a, b) ((a) > (b) ? (a) : (b))
+#define abs(x) ((x) > 0 ? (x) : -(x))
+"""
+
+NAMES = ["min", "max", "abs", "HIGH", "low", "input", "Output", "DEC", "hex", "pi", "B101", "b0", "class", "wifi_3", "battery_low", "Bolt", "b2"]
+
+
+@pytest.mark.parametrize(
+    "name, expected",
+    [("min", "min_"), ("INPUT", "INPUT_"), ("input", "input_"), ("class", "class_"), ("B101", "B101_"), ("b11111111", "b11111111_"), ("B111111111", "B111111111"), ("B2", "B2"), ("wifi_3", "wifi_3"), ("minimum", "minimum")],
+)
+def test_enum_name(name: str, expected: str) -> None:
+    assert _enum_name(name) == expected
+
+
+@pytest.mark.parametrize("names", [["wifi", "WIFI"], ["min", "min_"], ["Input", "input_"]])
+def test_clashing_enumerators_rejected(names: List[str]) -> None:
+    with pytest.raises(RuntimeError, match="clashing IconId enumerators"):
+        _check_enum_names(names)
+
+
+def test_distinct_enumerators_accepted() -> None:
+    _check_enum_names(NAMES)
+
+
+@pytest.mark.skipif(find_compiler() is None, reason="no host C++ compiler (set CXX or install g++/clang++)")
+def test_enum_compiles_under_arduino_macros(tmp_path: Path) -> None:
+    lines = [ARDUINO_MACROS, "#include <stdint.h>", "enum class IconId : uint16_t {"]
+    lines += [f"  {_enum_name(name)} = {i}," for i, name in enumerate(NAMES)]
+    lines += ["};", "int main() {"]
+    lines += [f"  static_assert((int)IconId::{_enum_name(name)} == {i}, \"{name}\");" for i, name in enumerate(NAMES)]
+    lines += ["  return 0;", "}", ""]
+    source = tmp_path / "icon_ids.cpp"
+    source.write_text("\n".join(lines), encoding="utf-8")
+    result = subprocess.run([find_compiler(), "-std=c++11", "-fsyntax-only", str(source)], capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
@@ -0,0 +1,47 @@
+"""The emitted findEmbeddedIcon(), compiled with the host C++ compiler."""
+
+import io
+import json
+import os
+import random
+import string
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from generate_icons import _lookup_probes, _write_lookup
+from host_harness import find_compiler, run_lookup
+from perfect_hash import build_perfect_hash
+
+pytestmark = pytest.mark.skipif(find_compiler() is None, reason="no host C++ compiler (set CXX or install g++/clang++)")
+
+MANIFEST = os.path.join(os.path.dirname(__file__), "..", "iconsheet.json")
+
+
+def _random_names(n: int, seed: int) -> List[str]:
+    rnd = random.Random(seed)
+    names: List[str] = []
+    seen = set()
+    while len(names) < n:
+        name = rnd.choice(string.ascii_lowercase) + "".join(rnd.choice(string.ascii_lowercase + string.digits + "_") for _ in range(rnd.randint(0, 14)))
+        if name not in seen:
+            seen.add(name)
+            names.append(name)
+    return names
+
+
+def _manifest_names() -> List[str]:
+    with open(MANIFEST, "r", encoding="utf-8") as f:
+        return [icon["name"] for icon in json.load(f)["icons"]]
+
+
+@pytest.mark.parametrize("names", [["a"], ["a", "b"], ["wifi", "wifi_off", "wifi_on"], _manifest_names(), _random_names(3000, 1)], ids=["one", "two", "family", "manifest", "3000"])
+def test_compiled_lookup(tmp_path: Path, names: List[str]) -> None:
+    ph = build_perfect_hash([n.encode("ascii") for n in names])
+    source = io.StringIO()
+    _write_lookup(source, ph)
+    probes = _lookup_probes(names) + ["", "zz_not_an_icon"]
+    found = run_lookup(str(tmp_path), source.getvalue(), names, names + probes)
+    assert found[: len(names)] == list(range(len(names)))
+    assert found[len(names) :] == [-1] * len(probes)